@@ -1,24 +1,26 @@
 import gradio as gr
 from services.chat.policies_chat import Chat_Bot_ToT
 
+# Conversations resume from their checkpoint (CHAT_SESSION_BACKEND shared by every replica, process memory otherwise)
+if Chat_Bot_ToT.checkpoints is None:
+    Chat_Bot_ToT.use_checkpoints()
+
 class Chat_Bot_ToT_Interface():
-    def __init__(self):
-        self.global_chat_state = gr.State("")
-        
     # Mock function to simulate an AI response
-    def get_ai_response(self, message, history, image):
+    def get_ai_response(self, message, history, image, request: gr.Request):
         """
         Generates a mock AI response with a typing effect.
 
         Args:
             message (str): The user's input message.
             history (list): The chat history (list of tuples: (user_msg, ai_msg)).
+            request (gr.Request): The browser session, its hash identifies the conversation checkpoint.
 
         Returns:
             str: The AI's response (with a typing effect).
         """
 
-        self.global_chat_state.value, chat_response=Chat_Bot_ToT.run_from(message=message, history=history, image=image,from_node_name=self.global_chat_state.value)
+        _, chat_response=Chat_Bot_ToT.run_from(message=message, history=history, image=image, session_id=request.session_hash)
 
         # Simulate a typing delay
         yield str(chat_response)
@@ -38,7 +40,7 @@ class Chat_Bot_ToT_Interface():
             chatbot=gr.Chatbot(height=500, type="messages"),  # Increased height for better visibility
             textbox=gr.Textbox(placeholder="Type your message here...", container=True), # Added container=True
             title="Chat with Mock AI",
-            description="I can answer your questions about company policies and assist you on existing orders process. (Verification Code: 123654)",
+            description="I can answer your questions about company policies and assist you on existing orders process. (The verification code is printed in the mock API console)",
             examples=[
                 ["I want to cancel my order!!", None],  # Added None for image in examples
                 ["where is my package?", None],
@@ -6,20 +6,43 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from services.chat.instrumentation import span
 import hashlib
 import os
 
 
+class TimedEmbeddings(Embeddings):
+    """Embeddings wrapper marking query embeddings as spans, so a retrieval splits into embedding and vector search"""
+    def __init__(self, inner:Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with span("embedding", type(self.inner).__name__, chars=len(text)):
+            return self.inner.embed_query(text)
+
+
 class RAG:
-    def __init__(self, pdf_path, chunk_size=1000, chunk_overlap=100):
+    def __init__(self, pdf_path, chunk_size=1000, chunk_overlap=100, embeddings=None):
         self.pdf_path = pdf_path
-        self.csv_path = f'services\\RAG_support\\csv_files' +"\\"+ os.path.basename(pdf_path) + ".csv"
+        self.csv_path = os.path.join('services', 'RAG_support', 'csv_files', os.path.basename(pdf_path) + ".csv")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.embeddings = OpenAIEmbeddings()
-        self.llm = ChatOpenAI(model="gpt-4.1")
+        # Any langchain Embeddings (e.g. offline ones from the LLM backend), OpenAI by default
+        self.embeddings = TimedEmbeddings(embeddings or OpenAIEmbeddings())
+        self._llm = None
         self.vectorstore = None
+
+    @property
+    def llm(self):
+        """Chat model of the standalone RAG chain, created on first use"""
+        if self._llm is None:
+            self._llm = ChatOpenAI(model="gpt-4.1")
+        return self._llm
         
     def _calculate_pdf_hash(self):
         """Calculate MD5 hash of PDF file to detect changes"""
@@ -139,7 +162,7 @@ class RAG:
 # Example usage
 if __name__ == "__main__":
     # Initialize the RAG system with a PDF path
-    policy_rag = RAG(f"services\\RAG_support\\pdf_files\\TechStream Computing Web Store Policies.pdf")
+    policy_rag = RAG(os.path.join("services", "RAG_support", "pdf_files", "TechStream Computing Web Store Policies.pdf"))
     
     # Process the PDF (will only reprocess if the PDF has changed)
     policy_rag.process_pdf()
@@ -1,14 +1,48 @@
+from services.chat.instrumentation import traced
 import requests
 import json
+import os
+
+# Seconds to wait for the order API before giving up (connect and read)
+REQUEST_TIMEOUT = float(os.environ.get("ORDER_API_TIMEOUT", 10))
+
+# Last body and ETag per URL, so unchanged resources come back as a 304 without body
+ETAG_CACHE_SIZE = 1024
+_etag_cache = {}
+
+def _get_json_with_etag(url: str):
+    """
+    GET request revalidated with If-None-Match against the last response of the same URL.
+
+    Args:
+        url: The full URL to request.
+
+    Returns:
+        The JSON response from the API (a fresh object on every call).
+    """
+    cached = _etag_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and cached:
+        return json.loads(cached[1])
+    response.raise_for_status()  # Raise an exception for bad status codes
+    etag = response.headers.get("ETag")
+    if etag:
+        if len(_etag_cache) >= ETAG_CACHE_SIZE and url not in _etag_cache:
+            _etag_cache.pop(next(iter(_etag_cache)))  # drop the oldest entry
+        _etag_cache[url] = (etag, response.content)
+    return response.json()
 
 # 1. Get Order Details
-def get_order_details(order_id: int, include_tracking: bool = False):
+@traced("backend")
+def get_order_details(order_id: int, include_tracking: bool = False, fields: list = None):
     """
     Retrieves order details using the /order/details endpoint.
 
     Args:
         order_id: The ID of the order to retrieve.
         include_tracking: Whether to include tracking information.
+        fields: Order fields to return. All fields are returned if None.
 
     Returns:
         The JSON response from the API.
@@ -16,13 +50,14 @@ def get_order_details(order_id: int, include_tracking: bool = False):
     url = f"http://127.0.0.1:8000/order/details?order_id={order_id}"
     if include_tracking:
         url += "&include_tracking=true"
-    response = requests.get(url)
-    response.raise_for_status()  # Raise an exception for bad status codes
-    return response.json()
+    if fields:
+        url += "&fields=" + ",".join(fields)
+    return _get_json_with_etag(url)
 
 
 
 # 2. Cancel Order
+@traced("backend")
 def cancel_order(order_id: int, reason: str):
     """
     Cancels an order using the /order/cancel endpoint.
@@ -37,13 +72,14 @@ def cancel_order(order_id: int, reason: str):
     url = "http://127.0.0.1:8000/order/cancel"
     headers = {"Content-Type": "application/json"}
     payload = {"order_id": order_id, "reason": reason}
-    response = requests.post(url, headers=headers, json=payload)
+    response = requests.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.json()
 
 
 
 # 3. Track Order
+@traced("backend")
 def track_order(order_id: int):
     """
     Tracks an order using the /order/track endpoint.
@@ -55,13 +91,44 @@ def track_order(order_id: int):
         The JSON response from the API.
     """
     url = f"http://127.0.0.1:8000/order/track?order_id={order_id}"
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.json()
+    return _get_json_with_etag(url)
+
+
+
+def subscribe_tracking_events(order_ids: list, read_timeout: float = None):
+    """
+    Follows status transitions of orders over the /order/track/stream server-sent events endpoint.
+    One connection serves every subscribed order for as long as the caller keeps iterating.
 
+    Args:
+        order_ids: The IDs of the orders to follow.
+        read_timeout: Seconds without data (heartbeats included) before giving up. Waits forever if None.
+
+    Yields:
+        (event_type, data) tuples: a "snapshot" per order first, then a "status" per transition.
+    """
+    url = "http://127.0.0.1:8000/order/track/stream"
+    params = {"order_ids": ",".join(str(order_id) for order_id in order_ids)}
+    with requests.get(url, params=params, stream=True, timeout=(REQUEST_TIMEOUT, read_timeout)) as response:
+        response.raise_for_status()
+        event_type, data_lines = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                field, _, value = line.partition(":")
+                if field == "event":
+                    event_type = value.strip()
+                elif field == "data":
+                    data_lines.append(value.strip())
+                # lines starting with ":" are keep-alive comments
+                continue
+            # A blank line closes the event
+            if data_lines:
+                yield event_type, json.loads("\n".join(data_lines))
+            event_type, data_lines = "message", []
 
 
 # 4. Security Process
+@traced("backend")
 def send_2_step_code(order_id: int):
     """
     Send verification code to associated email adress.
@@ -70,16 +137,18 @@ def send_2_step_code(order_id: int):
         order_id: The ID of the order to retrieve.
 
     Returns:
-        None 
+        The JSON response from the API.
     """
 
-    url = f"http://127.0.0.1:8000//security/send_2_steps_code"
-    payload = {"order_id": 12345}
+    url = f"http://127.0.0.1:8000/security/send_2_steps_code"
+    payload = {"order_id": order_id}
     headers = {"Content-Type": "application/json"}
-    response = requests.post(url, json=payload, headers=headers)
+    response = requests.post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()  # Raise an exception for bad status codes
-    
+    return response.json()
+
 
+@traced("backend")
 def check_2_step_code(order_id: int, code: int):
     """
     Verify code to associated email adress.
@@ -91,11 +160,11 @@ def check_2_step_code(order_id: int, code: int):
     Returns:
         bool: code is accepted
     """
-    url = f"http://127.0.0.1:8000//security/verify_2_steps_code"
+    url = f"http://127.0.0.1:8000/security/verify_2_steps_code"
     params ={
        "order_id":order_id,
        "code":code
     }
-    response = requests.get(url, params=params)
+    response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()  # Raise an exception for bad status codes
     return response.json()["verified"]
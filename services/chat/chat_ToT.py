@@ -1,34 +1,50 @@
 #from services.RAG_support.RAG_processor import RAG
-from openai import OpenAI
+from services.chat.llm_backends import LLMBackend, ToolSet, get_llm_backend, request_fingerprint
+from services.chat.graph_plan import compile_plan
+from services.chat.fusion import FUSION_PROMPT, FUSED_TOOL_SUFFIX, FusedAnswer, FusedChild
+from services.chat.speculation import SpeculativeRetrieval, claim
+from services.chat.checkpoint import Checkpoint, CheckpointError, history_digest
+from services.chat.history import EMPTY_WINDOW, ChatHistory
+from services.chat.image_pipeline import current_image, image_pipeline, turn_image
+from services.chat.session_backends import SessionConflict, session_backend_from_env
+from services.chat.instrumentation import span
+from services.chat.chrome_trace import TurnTracer
+from services.chat.tracing import get_tracer
+from services.chat.llm_scheduler import request_context
+from services.chat.single_flight import llm_single_flight
+from services.chat.model_policy import ModelPolicy, completion_cost, new_model_stats
+from services.chat.tool_arguments import ArgumentError, ArgumentValidator, ToolCallError, new_argument_stats, parse_arguments, strict_tool
 import os
 from dotenv import load_dotenv
 import re
 import json
+import copy
 import base64
+import contextvars
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from abc import ABC, abstractmethod
-from langfuse import Langfuse
-from langfuse.decorators import langfuse_context, observe
-
-"""langfuse = Langfuse(
-  secret_key="sk-lf-5be7ebc4-7576-4267-aee9-3ba43a84dac5",
-  public_key="pk-lf-69c8d5a6-c174-4ddb-93d1-1b8146792e23",
-  host="https://cloud.langfuse.com"
-)"""
-
-langfuse = Langfuse(
-  secret_key=os.environ['LANGFUSE_SECRET_KEY'],
-  public_key=os.environ['LANGFUSE_PUBLIC_KEY'],
-  host=os.environ['LANGFUSE_HOST']
-)
 
 load_dotenv()  # Load environment variables from .env file
-client = OpenAI(
-  api_key=os.environ['OPENAI_API_KEY']
-)
+# Completions go through the process-wide LLM backend (LLM_BACKEND=live|record|replay|stub), see llm_backends.py
+# LLM hops are traced through tracing.py (Langfuse, local file or none, sampled per session)
+
+### Order context ###
+def serialize_order_context(sys_data:dict, order_fields=None):
+    """Compact JSON form of the order context, restricted to order_fields when they are declared"""
+    if order_fields is not None:
+        sys_data = {key: sys_data[key] for key in order_fields if key in sys_data}
+    # Empty values carry no information for the LLM
+    sys_data = {key: value for key, value in sys_data.items() if value not in (None, "", [], {})}
+    if not sys_data:
+        return ""
+    return json.dumps(sys_data, separators=(",", ":"), ensure_ascii=False)
 
 ### Node ###
 class Node():
-    def __init__(self, name:str, description:str, parameters, required = []):
+    def __init__(self, name:str, description:str, parameters, required = [], order_fields=None):
     
         # Use re.match to check if name matches naming pattern
         naming_pattern = r'^[a-zA-Z0-9_-]+$'
@@ -71,10 +87,19 @@ class Node():
         
         # node description for function calling and graph interactions
         self.childs_tools = []
+        # child name -> ArgumentValidator compiled from the child parameters, filled by ChatToT when connecting
+        self.child_validators = {}
 
         # Interactive nodes: Code_Nodes only for graph-customers interactions
         self.is_interactive_node = False
 
+        # Order fields the node needs: fetched by Code_Nodes, injected in the prompt by LLM_Nodes (None = all)
+        self.order_fields = order_fields
+
+    def freeze(self, children=()):
+        """Fixes the children of the node (their Node objects in children), called by ChatToT.compile()"""
+        self.childs_tools = tuple(self.childs_tools)
+
     #Method to call node in graph execution
     @abstractmethod
     def call(self):
@@ -83,8 +108,10 @@ class Node():
 
 ### LLM call Node ###
 class LLM_Node(Node):
-    def __init__(self,name, description, parameters, template, model:str, required=[], retriver=None):
-        super().__init__(name, description, parameters, required)
+    def __init__(self,name, description, parameters, template, model, required=[], retriver=None, order_fields=None, backend:LLMBackend=None,
+                 history_independent=False, coalesce_window=0.0, pre_extractors=None, strict_tools=True, fusable=False,
+                 speculation:SpeculativeRetrieval=None, history_window:int=None):
+        super().__init__(name, description, parameters, required, order_fields)
 
         if name == "backup_system":
             # Check for exact keys
@@ -102,8 +129,38 @@ class LLM_Node(Node):
                 raise ValueError("A backup_system node must have only 'user_message', 'route_info', 'error_type' keys (strings)")
 
         self.template = template
-        self.__model = model
+        # A model name or a ModelPolicy (cheapest model first, escalated on unusable or low confidence answers)
+        self.model_policy = model if isinstance(model, ModelPolicy) else ModelPolicy([model])
+        # Per model: calls, escalations, parse failures, tokens, cost and latency
+        self.model_stats = {}
+        # Request child tools as strict structured outputs (all properties required, no extra keys)
+        self.strict_tools = strict_tools
+        self._request_tools = None
+        # Tool calls checked at the edge: valid as sent, repaired locally or rejected
+        self.argument_stats = new_argument_stats()
         self.retriver = retriver
+        # Node specific LLM backend, the process-wide one if None
+        self.backend = backend
+        # History independent nodes answer from the current request only (no chat history in the prompt).
+        # Prompts without history (those nodes, or the first message of a conversation when coalesce_window
+        # is set) are shared: identical concurrent requests get one completion, reused up to coalesce_window seconds after
+        self.history_independent = history_independent
+        self.coalesce_window = coalesce_window
+        # Messages of the conversation in the prompt at most, None for all the retained ones
+        self.history_window = history_window
+        # Deterministic extractions tried before the LLM (see pre_extraction.py), first match wins
+        self.pre_extractors = pre_extractors or []
+        self.pre_extraction_stats = {"avoided_llm_calls": 0, "fallbacks": 0}
+        # Fusable nodes can be answered by their parent's routing call (see fusion.py), the parent
+        # offers its fusable children's answer tools while fusion is on
+        self.fusable = fusable
+        self.fusion = os.environ.get("CHAT_FUSION", "0") == "1"
+        self.fused_children = ()
+        self._fused_tools = None
+        self.fusion_stats = {"fused_answers": 0, "routed": 0}
+        # Retrievals of likely children started during the routing completion (see speculation.py)
+        self.speculation = speculation
+        self.retrieval_children = ()
         self.sys_prompt = """You are an e-commerce support assistant. Maintain a helpful, solution-focused approach with customers while following these guidelines:
         
                 Use a warm, professional tone with concise responses
@@ -116,13 +173,49 @@ class LLM_Node(Node):
                 Avoid making promises outside established policies
 
                 Your core function is resolving customer inquiries efficiently while creating positive experiences. Specific product details and company policies will be provided separately."""
-    @observe()                    
+    def pre_extract(self, arg, sys_data):
+        """(child name, arguments) when a pre-extractor fills a child's arguments unambiguously, else None"""
+        for extractor in self.pre_extractors:
+            child = next((tool["function"] for tool in self.childs_tools if tool["function"]["name"] == extractor.child), None)
+            if child is None:
+                raise ValueError(f"Pre-extractor target {extractor.child} is not connected to {self.corpus["function"]["name"]}")
+            arguments = extractor.extract(arg, sys_data)
+            if arguments is None:
+                continue
+            missing = set(child["parameters"]["properties"]) - set(arguments)
+            if missing:
+                raise ValueError(f"Pre-extractor for {extractor.child} does not fill {sorted(missing)}")
+            return extractor.child, arguments
+        return None
+
     def call(self, arg, history, trase=True, sys_data = {}):
+        if isinstance(arg, FusedAnswer):
+            # Answered by the parent's routing call
+            return arg.next_node, arg.arguments
+
+        if self.pre_extractors:
+            extracted = self.pre_extract(arg, sys_data)
+            if extracted is not None:
+                self.pre_extraction_stats["avoided_llm_calls"] += 1
+                return extracted
+            self.pre_extraction_stats["fallbacks"] += 1
+
+        fused = self.fused_children if self.fusion else ()
+        bets = None
+        if self.speculation is not None and self.retrieval_children:
+            # Fused children get their context in the prompt already
+            fused_names = {child.name for child in fused}
+            bets = self.speculation.place([child for child in self.retrieval_children if child.corpus["function"]["name"] not in fused_names],
+                                          arg.get("user_message"))
+
         request = self.template.format(**arg)
         is_retrieved = False
         if self.retriver:
-            # Execute the retriever to get documents and Format the retrieved content into a string
-            retrieved_docs = self.retriver.invoke(request)
+            # Execute the retriever to get documents (ready when the routing call retrieved them ahead) and Format the retrieved content into a string
+            retrieved_docs = claim(self.corpus["function"]["name"], arg.get("user_message"))
+            if retrieved_docs is None:
+                with span("retrieval", self.corpus["function"]["name"], query_chars=len(request)):
+                    retrieved_docs = self.retriver.invoke(request)
             is_retrieved = True
             context_text = "\n".join([doc.page_content for doc in retrieved_docs])
 
@@ -131,92 +224,607 @@ class LLM_Node(Node):
         else:
             inner_template = self.sys_prompt
 
-        if sys_data:
-            request = f"If and only if it is necessary include System data/Order details: {sys_data}\n\n" + request
-
-        messages = [{"role": "system", "content": inner_template}] + history + [{"role": "user", "content": request}]
-
-        langfuse_context.update_current_trace(
-                name=self.corpus["function"]["name"],
-                tags=[self.__model, f"retrieve = {is_retrieved}"], metadata=self.corpus,
-            )
-
-        if self.childs_tools:
-            completion = client.chat.completions.create(
-                model=self.__model,
-                store=trase,
-                messages=messages,
-                tools=self.childs_tools,tool_choice='required'
-            )
-            tool_calling = completion.choices[0].message.tool_calls[0].function
-            # return "next node name", "next node arguments"
-            return tool_calling.name, json.loads(tool_calling.arguments)
+        if fused:
+            inner_template += FUSION_PROMPT.format(suffix=FUSED_TOOL_SUFFIX) + "\n\n".join(child.prompt_section(arg) for child in fused)
+
+        order_context = serialize_order_context(sys_data, self.order_fields) if sys_data else ""
+        if order_context:
+            request = f"If and only if it is necessary include System data/Order details: {order_context}\n\n" + request
+
+        # The last history_window messages of the conversation, read in place (see history.py)
+        if self.history_independent:
+            window = EMPTY_WINDOW
         else:
-            completion = client.chat.completions.create(
-                model=self.__model,
-                store=trase,
-                messages=messages
-            )
-            # return "no next node", "answer"    
-            return None, completion.choices[0].message
+            window = ChatHistory.from_messages(history).window(self.history_window)
+        messages = [{"role": "system", "content": inner_template}, *(message.as_dict() for message in window), {"role": "user", "content": request}]
+
+        try:
+            result = self._complete_with_policy(messages, arg, trase, is_retrieved, fused, shared=not window)
+        except BaseException:
+            if bets is not None:
+                bets.settle(None)
+            raise
+        if bets is not None:
+            bets.settle(result[0])
+        return result
+
+    def _complete_with_policy(self, messages, arg, trase, is_retrieved, fused, shared=False):
+        """Node result of the first usable completion, from the cheapest model of the policy up"""
+        backend = self.backend or get_llm_backend()
+        models = self.model_policy.models
+        for level, model in enumerate(models):
+            can_escalate = level + 1 < len(models)
+            stats = self.model_stats.setdefault(model, new_model_stats())
+            with get_tracer().observe(self.corpus["function"]["name"], model=model,
+                                      tags=[model, f"retrieve = {is_retrieved}"], metadata=self.corpus,
+                                      input=arg) as observation:
+                started = time.perf_counter()
+                with span("llm", model, tools=len(self.childs_tools)):
+                    tools = (self._fused_tools if fused else self.request_tools()) if self.childs_tools else None
+                    # What the confidence check needs (logprobs, sampled routes), only when it can escalate
+                    options = self.model_policy.request_options(tools) if can_escalate else {}
+                    if tools:
+                        completion, upstream = self._complete(backend, model, messages, trase, tools=tools, tool_choice='required', shared=shared, **options)
+                    else:
+                        completion, upstream = self._complete(backend, model, messages, trase, shared=shared, **options)
+                if upstream:
+                    self._record_usage(stats, model, completion, time.perf_counter() - started)
+                else:
+                    # Another caller's completion: its calls, tokens and cost are already counted
+                    stats["shared"] += 1
+                try:
+                    result, output = self._parse(completion, arg, fused)
+                except ToolCallError:
+                    stats["parse_failures"] += 1
+                    if not can_escalate:
+                        raise
+                    stats["escalations"] += 1
+                    continue
+                observation.set_output(output)
+            if can_escalate and self.model_policy.low_confidence(completion):
+                stats["low_confidence"] += 1
+                stats["escalations"] += 1
+                continue
+            return result
+
+    def freeze(self, children=()):
+        super().freeze(children)
+        self._request_tools = None
+        self.request_tools()
+        self.fused_children = tuple(FusedChild(child) for child in children if getattr(child, "fusable", False))
+        self.retrieval_children = tuple(child for child in children if getattr(child, "retriver", None) is not None)
+        if self.fused_children:
+            fused_tools = [strict_tool(child.tool) if self.strict_tools else child.tool for child in self.fused_children]
+            self._fused_tools = ToolSet(list(self.request_tools()) + fused_tools)
+
+    def request_tools(self):
+        """Child tool definitions sent to the LLM, built and serialized once per set of children"""
+        if self._request_tools is None or len(self._request_tools) != len(self.childs_tools):
+            self._request_tools = ToolSet(strict_tool(tool) for tool in self.childs_tools) if self.strict_tools else ToolSet(self.childs_tools)
+        return self._request_tools
+
+    def _parse(self, completion, arg, fused=()):
+        """(node result, traced output) of a completion, ToolCallError when its tool call can't be used"""
+        message = completion.choices[0].message
+        if not self.childs_tools:
+            # return "no next node", "answer"
+            return (None, message), message.content
+        tool_calls = getattr(message, "tool_calls", None)
+        if not tool_calls:
+            raise ToolCallError(f"{self.corpus["function"]["name"]}: the completion has no tool call")
+        tool_calling = tool_calls[0].function
+        fused_child = next((child for child in fused if child.tool_name == tool_calling.name), None)
+        if fused_child is None and tool_calling.name not in [tool["function"]["name"] for tool in self.childs_tools]:
+            raise ToolCallError(f"{self.corpus["function"]["name"]}: unknown tool {tool_calling.name}")
+        # Validation at the edge: the child only ever receives arguments matching its parameters
+        stats = self.argument_stats
+        stats["tool_calls"] += 1
+        try:
+            arguments, repairs = parse_arguments(tool_calling.arguments)
+            validator = fused_child.validator if fused_child else self.child_validators.get(tool_calling.name)
+            if validator is not None:
+                arguments, validation_repairs = validator.validate(arguments, context=arg)
+                repairs += validation_repairs
+            elif not isinstance(arguments, dict):
+                raise ArgumentError(tool_calling.name, ["arguments must be an object"])
+        except ToolCallError:
+            stats["rejected"] += 1
+            raise
+        stats["repaired" if repairs else "valid"] += 1
+        for repair in repairs:
+            stats["repairs"][repair] = stats["repairs"].get(repair, 0) + 1
+        if fused:
+            self.fusion_stats["fused_answers" if fused_child else "routed"] += 1
+        if fused_child is not None:
+            # The fused child forwards the answer to its own child
+            return (fused_child.name, FusedAnswer(fused_child.next_node, arguments)), {"name": tool_calling.name, "arguments": tool_calling.arguments}
+        # return "next node name", "next node arguments"
+        return (tool_calling.name, arguments), {"name": tool_calling.name, "arguments": tool_calling.arguments}
+
+    @staticmethod
+    def _record_usage(stats, model, completion, elapsed):
+        stats["calls"] += 1
+        stats["latency_s"] += elapsed
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["cost_usd"] += completion_cost(model, prompt_tokens, completion_tokens) or 0.0
+
+    def _complete(self, backend, model, messages, trase, tools=None, tool_choice=None, shared=False, logprobs=False, n=1):
+        """(completion, upstream): upstream is False when the completion of another caller was shared (single_flight.py)"""
+        def request():
+            return backend.complete(model=model, store=trase, messages=messages, tools=tools, tool_choice=tool_choice, logprobs=logprobs, n=n)
+        # Only prompts without conversation history are shared between sessions
+        if not (shared and (self.history_independent or self.coalesce_window > 0)):
+            return request(), True
+        key = request_fingerprint(model, messages, tools, tool_choice)
+        if logprobs or n > 1:
+            key += f":n={n}:logprobs={logprobs}"
+        return llm_single_flight.call(key, request, stale_seconds=self.coalesce_window)
 
 ### python Node ###
 class Code_Node(Node):
-    def __init__(self,name, description, parameters, function:callable, required=[], is_interactive=False):
-        super().__init__(name, description, parameters, required)
+    def __init__(self,name, description, parameters, function:callable, required=[], is_interactive=False, order_fields=None):
+        super().__init__(name, description, parameters, required, order_fields)
 
         if name == "backup_system":
             raise ValueError("backup_system node must be a LLM_Node. Review Documentation")
 
         self.core_function = function
         self.is_interactive_node = is_interactive
+        # Functions declaring a sys_data parameter get the order context of the conversation (e.g. fan-out branches updating it)
+        self.takes_sys_data = "sys_data" in inspect.signature(function).parameters
     def call(self, arg, history, trase=True, sys_data = {}):
         if self.is_interactive_node and not self.childs_tools:
             raise ValueError(f"Interactive nodes, as {self.corpus["function"]["name"]}, must have one and only one connection")
-        return self.core_function(arg, trase=trase, childs_tools=self.childs_tools)
+        if self.takes_sys_data:
+            return self.core_function(arg, trase=trase, childs_tools=self.childs_tools, order_fields=self.order_fields, sys_data=sys_data)
+        return self.core_function(arg, trase=trase, childs_tools=self.childs_tools, order_fields=self.order_fields)
+
+### Image to text Node ###
+# Describes the image of the turn (an ImageRef from image_pipeline.py) with a vision completion
+# and hands the description to its child as arg["image_description"]; without a child it answers with it.
+# The prepared image is a bounded JPEG sent at `detail` ("low": a fixed 85 tokens), and descriptions are
+# cached by the hash of the image's pixels. A turn without an image goes on unchanged.
+IMAGE_PROMPT = """You describe pictures sent to an e-commerce customer support team: products, packaging,
+damage, labels, order or tracking numbers, screenshots. Describe what is relevant to a support request in a few
+factual sentences and copy any visible text or numbers exactly. Do not guess what you cannot see."""
 
 class Image_to_text_Node(Node):
-    def __init__(self, name, description, parameters, required=[]):
-        super().__init__(name, description, parameters, required)
+    takes_images = True
+
+    def __init__(self, name, description, parameters, model="gpt-4.1-mini", required=[], prompt=IMAGE_PROMPT, detail="low",
+                 order_fields=None, backend:LLMBackend=None):
+        super().__init__(name, description, parameters, required, order_fields)
+        # Only the first model of a policy is used: a description can't be checked for escalation
+        self.model_policy = model if isinstance(model, ModelPolicy) else ModelPolicy([model])
+        self.prompt = prompt
+        self.detail = detail
+        self.backend = backend
+        self.model_stats = {}
+
+    def call(self, arg, history, trase=True, sys_data = {}):
+        if len(self.childs_tools) > 1:
+            raise ValueError(f"{self.corpus["function"]["name"]} hands its description to one child at most")
+        image = arg.get("image") or current_image()
+        description = None
+        if image is not None:
+            try:
+                prepared = image_pipeline().submit(image).result()
+            except (OSError, ValueError) as e:
+                # An unreadable upload is a turn without an image, retrying the node wouldn't read it either
+                print(f"{self.corpus["function"]["name"]}: image not usable: {e}")
+                prepared = None
+            if prepared is not None:
+                # Cached by pixels only, so the description must not depend on the message: the child gets both
+                description = image_pipeline().describe(prepared, lambda prepared: self._describe(prepared, trase))
+        if not self.childs_tools:
+            return None, description or "No image was received."
+        return self.childs_tools[0]["function"]["name"], {**arg, "image_description": description}
+
+    def _describe(self, prepared, trase):
+        backend = self.backend or get_llm_backend()
+        model = self.model_policy.models[0]
+        stats = self.model_stats.setdefault(model, new_model_stats())
+        messages = [{"role": "system", "content": self.prompt},
+                    {"role": "user", "content": [{"type": "image_url", "image_url": {"url": prepared.data_url(), "detail": self.detail}}]}]
+        with get_tracer().observe(self.corpus["function"]["name"], model=model, tags=[model, "image"], metadata=self.corpus,
+                                  input={"image": repr(prepared)}) as observation:
+            started = time.perf_counter()
+            with span("llm", model, image_kb=len(prepared.data) // 1024):
+                completion = backend.complete(model=model, store=trase, messages=messages)
+            LLM_Node._record_usage(stats, model, completion, time.perf_counter() - started)
+            description = completion.choices[0].message.content
+            observation.set_output(description)
+        return description
+
+### Fan-out and join Nodes ###
+# A FanOut_Node runs all its children but its join concurrently, each one as a single node call
+# (a branch) with its own copy of arg and of the order context, and waits for them up to its
+# deadline. Branches that time out or fail are reported as missing: the turn goes on with partial
+# results unless the branch is listed in required_branches, then the fan-out fails (and is retried
+# like any node). The Join_Node merges the branch outputs into arg and their callbacks into sys_data:
+# what a branch changed in its copy of the order context (Code_Node functions taking sys_data) and the
+# order details a Code_Node function returns. A multi-source answer costs its slowest branch, not the sum.
+_branch_pool = None
+_branch_pool_lock = threading.Lock()
+
+def branch_pool():
+    """Thread pool shared by the fan-out branches of the process (FAN_OUT_WORKERS threads)"""
+    global _branch_pool
+    if _branch_pool is None:
+        with _branch_pool_lock:
+            if _branch_pool is None:
+                _branch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("FAN_OUT_WORKERS", 16)),
+                                                  thread_name_prefix="fan-out")
+    return _branch_pool
+
+def new_branch_stats():
+    return {"calls": 0, "ok": 0, "timeouts": 0, "errors": 0}
+
+class FanOut_Node(Node):
+    def __init__(self, name, description, parameters, join:str, deadline:float=None, required_branches=(), required=[], order_fields=None):
+        """
+        Args:
+            join: Name of the Join_Node child receiving the branch results; every other child is a branch.
+            deadline: Seconds to wait for the branches, None to wait for all of them.
+            required_branches: Branches without which the fan-out fails instead of going on with partial results.
+        """
+        super().__init__(name, description, parameters, required, order_fields)
+        self.join = join
+        self.deadline = deadline
+        self.required_branches = set(required_branches)
+        self.branches = ()
+        self.branch_stats = {}
+        self._stats_lock = threading.Lock()
+
+    def freeze(self, children=()):
+        super().freeze(children)
+        self.branches = tuple(child for child in children if child.corpus["function"]["name"] != self.join)
+        self.branch_stats = {branch.corpus["function"]["name"]: new_branch_stats() for branch in self.branches}
+
+    @staticmethod
+    def _run_branch(branch, arg, history, trase, sys_data):
+        """(output, callback) of a branch, the callback holding the order context keys it set or changed"""
+        branch_data = dict(sys_data)
+        with span("branch", branch.corpus["function"]["name"]):
+            result = branch.call(arg, history, trase=trase, sys_data=branch_data)
+        output = result[1]
+        callback = {key: value for key, value in branch_data.items() if key not in sys_data or sys_data[key] != value}
+        if len(result) > 2 and result[2]:
+            callback.update(result[2])
+        # Answering LLM_Nodes return the completion message
+        return getattr(output, "content", output), callback
+
+    def call(self, arg, history, trase=True, sys_data = {}):
+        futures = {}
+        # Order context as the branches find it; each one changes its own copy
+        snapshot = dict(sys_data)
+        for branch in self.branches:
+            # Branches keep the turn's context: tracing, span recorder and LLM scheduling priority
+            context = contextvars.copy_context()
+            futures[branch_pool().submit(context.run, self._run_branch, branch, dict(arg), history, trase, snapshot)] = branch.corpus["function"]["name"]
+        not_done = wait(futures, timeout=self.deadline).not_done
+
+        results, callbacks, missing = {}, {}, {}
+        outcomes = {}
+        # In branch order (futures is filled in submission order), so the join merges the callbacks deterministically
+        for future, name in futures.items():
+            if future in not_done:
+                # Not started yet: never runs; already running: its result is dropped
+                future.cancel()
+                missing[name] = "timeout"
+                outcomes[name] = "timeouts"
+                continue
+            try:
+                results[name], callbacks[name] = future.result()
+                outcomes[name] = "ok"
+            except Exception as error:
+                missing[name] = f"error: {error}"
+                outcomes[name] = "errors"
+        with self._stats_lock:
+            for name, outcome in outcomes.items():
+                self.branch_stats[name]["calls"] += 1
+                self.branch_stats[name][outcome] += 1
+
+        failed = self.required_branches & missing.keys()
+        if failed:
+            raise RuntimeError(f"Required branches of {self.corpus["function"]["name"]} missing: {', '.join(f'{name} ({missing[name]})' for name in sorted(failed))}")
+        return self.join, {**arg, "results": results, "callbacks": callbacks, "missing": missing}
+
+class Join_Node(Node):
+    is_join = True
+
+    def __init__(self, name, description, parameters, function:callable=None, required=[], order_fields=None):
+        """
+        Args:
+            function: Optional merge, called as function(arg, results=..., missing=..., trase=..., childs_tools=..., order_fields=...)
+                and returning (next node name, arguments) like a Code_Node function. By default the branch
+                outputs go to the only child as arguments named after their branch, plus "missing_sources".
+        """
+        super().__init__(name, description, parameters, required, order_fields)
+        self.core_function = function
 
     def call(self, arg, history, trase=True, sys_data = {}):
-        return 
+        arg = dict(arg)
+        results, callbacks, missing = arg.pop("results", {}), arg.pop("callbacks", {}), arg.pop("missing", {})
+        # Order context updates of the branches, in branch order: a later branch wins a key set by several
+        for callback in callbacks.values():
+            sys_data.update(callback)
+        if self.core_function is not None:
+            return self.core_function(arg, results=results, missing=missing, trase=trase, childs_tools=self.childs_tools, order_fields=self.order_fields)
+        return self.childs_tools[0]["function"]["name"], {**arg, **results, "missing_sources": ", ".join(sorted(missing))}
 
 ### Chat Tree of Thoghts ###
+def connect_nodes(graph:dict, from_name:str, to_Node:Node):
+    """Connects to_Node as a child of from_name in a graph of {name: {"node", "childs"}}, adding it to the graph when new"""
+    # Load parent node graph representation
+    from_node_rep = graph[from_name]
+
+    # Check interactive nodes has only one child
+    if from_node_rep["node"].is_interactive_node and from_node_rep["childs"]:
+        raise TypeError(f"Interactive nodes, as {from_name}, must have one and only one connection")
+    # Update graph connections if it don't already exist
+    if to_Node.corpus["function"]["name"] not in from_node_rep["childs"]:
+        from_node_rep["node"].childs_tools.append(to_Node.corpus)
+        from_node_rep["node"].child_validators[to_Node.corpus["function"]["name"]] = ArgumentValidator(
+            to_Node.corpus["function"]["name"], to_Node.corpus["function"]["parameters"])
+        from_node_rep["childs"].append(to_Node.corpus["function"]["name"])
+        if to_Node.corpus["function"]["name"] not in graph:
+            graph.update({to_Node.corpus["function"]["name"]:{"node":to_Node, "childs":[]}})
+    else:
+        raise TypeError(f"{to_Node.corpus["function"]["name"]} alrady connected from {from_name}")
+
+
 class ChatToT():
     def __init__(self, root:Node):
         self.root_name = root.corpus["function"]["name"]
         self.__graph ={self.root_name:{"node":root, "childs":[]}}
         self.__sys_data = {}
+        # Execution plan run by run_from, built by compile() (on the first turn at the latest)
+        self.__plan = None
+        self.__compile_lock = threading.Lock()
+        # Called after every node attempt as listener(node_name, elapsed_seconds, error or None)
+        self.hop_listeners = []
+        # Chrome trace export of sampled turns (CHAT_TRACE_DIR), None when disabled
+        self.timeline = TurnTracer.from_env()
+        # Session backend of the conversation checkpoints (CHAT_SESSION_BACKEND or CHAT_CHECKPOINT_DIR), None when disabled,
+        # see checkpoint.py and session_backends.py
+        enabled = os.environ.get("CHAT_SESSION_BACKEND") or os.environ.get("CHAT_CHECKPOINT_DIR")
+        self.checkpoints = session_backend_from_env() if enabled else None
+        self.checkpoint_stats = self.new_checkpoint_stats()
 
     def conect_node_to_node(self, from_name:str, to_Node:Node):
 
-        # Load parent node graph representation
-        from_node_rep = self.__graph[from_name]
-
-        # Check interactive nodes has only one child
-        if from_node_rep["node"].is_interactive_node and from_node_rep["childs"]:
-            raise TypeError(f"Interactive nodes, as {from_name}, must have one and only one connection")
-        # Update graph connections if it don't already exist
-        if to_Node.corpus["function"]["name"] not in from_node_rep["childs"]:
-            from_node_rep["node"].childs_tools.append(to_Node.corpus)
-            from_node_rep["childs"].append(to_Node.corpus["function"]["name"])
-            if to_Node.corpus["function"]["name"] not in self.__graph:
-                    self.__graph.update({to_Node.corpus["function"]["name"]:{"node":to_Node, "childs":[]}})
-        else:
-            raise TypeError(f"{to_Node.corpus["function"]["name"]} alrady connected from {from_name}")
-            
-    def run_from(self, message, history, image, from_node_name=None, trase=True, max_retries=3):
+        if self.__plan is not None:
+            raise TypeError(f"The graph is compiled, {to_Node.corpus["function"]["name"]} can't be connected to {from_name}")
+
+        connect_nodes(self.__graph, from_name, to_Node)
+
+    def compile(self):
+        """Validates the graph and freezes it into the execution plan run_from follows, see graph_plan.py"""
+        with self.__compile_lock:
+            if self.__plan is None:
+                self.__plan = compile_plan(self.__graph, self.root_name)
+        return self.__plan
+
+    @property
+    def plan(self):
+        return self.__plan or self.compile()
+
+    def replace_graph(self, graph:dict, root_name:str, plan=None):
+        """
+        Adopts another graph and its execution plan (hot reload, see graph_loader.GraphReloader), compiling it
+        when no plan is given.
+
+        Turns in flight finish on the plan they started with, the next ones run the new plan, and
+        conversations resume at their node by name (at the root when the node was removed).
+        """
+        plan = plan or compile_plan(graph, root_name)
+        with self.__compile_lock:
+            self.__graph = graph
+            self.root_name = root_name
+            self.__plan = plan
+
+    def analyze_paths(self, **estimates):
+        """LLM calls, order API calls and latency per turn type, see path_analysis.analyze_plan for the estimates"""
+        from services.chat.path_analysis import analyze_plan
+        return analyze_plan(self.plan, **estimates)
+
+    def model_report(self):
+        """Calls, escalations, tokens, cost and latency per LLM node and model"""
+        return {name: {model: dict(stats) for model, stats in node_rep["node"].model_stats.items()}
+                for name, node_rep in self.__graph.items() if getattr(node_rep["node"], "model_stats", None)}
+
+    def set_models(self, models:dict):
+        """Overrides node models, node name -> model name or ModelPolicy (e.g. to compare tiers on a replay set)"""
+        for name, model in models.items():
+            self.__graph[name]["node"].model_policy = model if isinstance(model, ModelPolicy) else ModelPolicy([model])
+
+    def reset_stats(self):
+        """Zeroes the pre-extraction and model counters of every node, and the checkpoint counters"""
+        for node_rep in self.__graph.values():
+            node = node_rep["node"]
+            if hasattr(node, "model_stats"):
+                node.model_stats = {}
+            if isinstance(node, LLM_Node):
+                node.pre_extraction_stats = {"avoided_llm_calls": 0, "fallbacks": 0}
+                node.argument_stats = new_argument_stats()
+                node.fusion_stats = {"fused_answers": 0, "routed": 0}
+                if node.speculation is not None:
+                    node.speculation.reset_stats()
+        self.checkpoint_stats = self.new_checkpoint_stats()
+
+    def argument_report(self):
+        """Tool calls valid as sent, repaired locally and rejected, per LLM node with children"""
+        return {name: copy.deepcopy(node_rep["node"].argument_stats) for name, node_rep in self.__graph.items()
+                if getattr(node_rep["node"], "argument_stats", {}).get("tool_calls")}
+
+    def set_fusion(self, enabled:bool):
+        """Turns node fusion on or off for every LLM node (default CHAT_FUSION), see fusion.py"""
+        for node_rep in self.__graph.values():
+            if hasattr(node_rep["node"], "fusion"):
+                node_rep["node"].fusion = enabled
+
+    def fusion_report(self):
+        """Routing calls answered for a fused child, and routed as usual, per LLM node with fusable children"""
+        return {name: dict(node_rep["node"].fusion_stats) for name, node_rep in self.__graph.items()
+                if getattr(node_rep["node"], "fused_children", None)}
+
+    def fan_out_report(self):
+        """Calls, successes, timeouts and errors per fan-out node and branch"""
+        return {name: copy.deepcopy(node_rep["node"].branch_stats) for name, node_rep in self.__graph.items()
+                if isinstance(node_rep["node"], FanOut_Node)}
+
+    def speculation_report(self):
+        """Speculative retrievals started, used, cancelled and wasted, with the seconds wasted and saved, per routing node"""
+        return {name: dict(node_rep["node"].speculation.stats) for name, node_rep in self.__graph.items()
+                if getattr(node_rep["node"], "speculation", None) is not None}
+
+    @staticmethod
+    def new_checkpoint_stats():
+        return {"turns": 0, "saved": 0, "resumed": 0, "cleared": 0, "stale": 0, "invalid": 0, "conflicts": 0,
+                "bytes": 0, "io_seconds": 0.0}
+
+    def use_checkpoints(self, backend=None):
+        """Checkpoints conversations run with a session_id in a session backend (session_backend_from_env() by default)"""
+        self.checkpoints = backend if backend is not None else session_backend_from_env()
+        return self.checkpoints
+
+    def load_checkpoint(self, session_id):
+        """Checkpoint of the session, None when there is none"""
+        data = self.checkpoints.get(session_id)[0] if self.checkpoints is not None else None
+        return Checkpoint.decode(data, self.plan) if data is not None else None
+
+    def checkpoint_report(self):
+        """Checkpoints saved, resumed, cleared at answers, discarded (stale, invalid) and lost to concurrent turns, with their mean size and session I/O per turn"""
+        report = dict(self.checkpoint_stats)
+        report["mean_bytes"] = report.pop("bytes") / report["saved"] if report["saved"] else 0.0
+        report["io_ms_per_turn"] = report.pop("io_seconds") * 1000 / report["turns"] if report["turns"] else 0.0
+        return report
+
+    def pre_extraction_stats(self):
+        """LLM calls avoided and fallbacks to the LLM per node with pre-extractors"""
+        return {name: dict(node_rep["node"].pre_extraction_stats) for name, node_rep in self.__graph.items()
+                if getattr(node_rep["node"], "pre_extractors", None)}
+
+    def _notify_hop(self, node_name, started, error=None):
+        elapsed = time.perf_counter() - started
+        for listener in self.hop_listeners:
+            listener(node_name, elapsed, error)
+
+    def run_from(self, message, history, image, from_node_name=None, trase=True, max_retries=3, sys_data=None, session_id=None):
+        """
+        Runs one conversation turn.
+
+        With checkpoints enabled and a session_id, from_node_name and sys_data left as None are loaded from the
+        session's checkpoint, and the checkpoint is updated at the end of the turn: the caller keeps no state
+        between turns, and the turns of a conversation can be served by any worker sharing the session backend.
+
+        Returns:
+            (next_node_name, reply): the node the next turn starts at, "" for the root after an answer
+            and None when the turn failed.
+        """
+        # Checkpoints are only checked against a history the caller sent
+        history_sent = history is not None
+        # Gradio lists are read into a capped ChatHistory once per turn, see history.py
+        history = ChatHistory.from_messages(history)
+        backend = self.checkpoints if session_id is not None else None
+        version = None
+        if backend is not None and sys_data is None:
+            checkpoint, version = self._resume(backend, session_id, history if history_sent else None)
+            sys_data = checkpoint.sys_data if checkpoint else {}
+            if from_node_name is None and checkpoint:
+                from_node_name = checkpoint.node
+        with get_tracer().turn(session_id), request_context(session_id):
+            if self.timeline is None:
+                result = self._run_turn(message, history, image, from_node_name, trase, max_retries, sys_data)
+            else:
+                with self.timeline.trace_turn(session_id):
+                    with span("turn", from_node_name or self.root_name, session_id=session_id):
+                        result = self._run_turn(message, history, image, from_node_name, trase, max_retries, sys_data)
+        if backend is not None:
+            self._save_checkpoint(backend, session_id, version, result, sys_data, history)
+        return result
+
+    def _resume(self, backend, session_id, history):
+        """
+        Returns:
+            (checkpoint, version): the session's checkpoint, None when there is none or it doesn't match the
+            history sent by the caller (not checked for a None history), and the version read (written back by _save_checkpoint).
+        """
+        started = time.perf_counter()
+        data, version = backend.get(session_id)
+        self.checkpoint_stats["io_seconds"] += time.perf_counter() - started
+        if data is None:
+            return None, version
+        try:
+            checkpoint = Checkpoint.decode(data, self.plan)
+        except CheckpointError as e:
+            print(f"Discarding checkpoint of session {session_id}: {e}")
+            self.checkpoint_stats["invalid"] += 1
+            return None, version
+        # The conversation was rewritten by the client (retried or edited message): start over from the root
+        if history is not None and (history.total != checkpoint.history_length or history_digest(history) != checkpoint.history_digest):
+            self.checkpoint_stats["stale"] += 1
+            return None, version
+        self.checkpoint_stats["resumed"] += 1
+        return checkpoint, version
+
+    def _save_checkpoint(self, backend, session_id, version, result, sys_data, history):
+        """Writes the checkpoint of the turn if the session is still at version (None when it wasn't read)"""
+        next_node_name, reply = result
+        started = time.perf_counter()
+        self.checkpoint_stats["turns"] += 1
+        try:
+            # Answers and failed turns restart from the root with a new order context
+            if not next_node_name:
+                backend.delete(session_id, version)
+                self.checkpoint_stats["cleared"] += 1
+            else:
+                # The client appends the user message and this reply before the next turn
+                history_length = history.total + 2
+                data = Checkpoint(next_node_name, sys_data, reply, history_length, history_digest([str(reply)])).encode(self.plan)
+                backend.put(session_id, data, version)
+                self.checkpoint_stats["saved"] += 1
+                self.checkpoint_stats["bytes"] += len(data)
+        except SessionConflict as e:
+            # Another turn of the session (e.g. a double submitted message on another worker) finished first: its checkpoint wins
+            print(f"Checkpoint of session {session_id} not saved: {e}")
+            self.checkpoint_stats["conflicts"] += 1
+        self.checkpoint_stats["io_seconds"] += time.perf_counter() - started
+
+    def _run_turn(self, message, history, image, from_node_name, trase, max_retries, sys_data):
+        # Only a reference to the image travels with the turn, prepared in the background from here on (see image_pipeline.py).
+        # Graphs without an image node never read it: the upload is dropped instead of prepared for nothing
+        image = image_pipeline().submit(image) if self.plan.takes_images else None
+        with turn_image(image):
+            return self._run_hops(message, image, from_node_name, trase, max_retries, sys_data, history)
+
+    def _run_hops(self, message, image, from_node_name, trase, max_retries, sys_data, history):
+        plan = self.plan
         arg = {"user_message": message, "image": image}
+
+        # Order context of the conversation: the caller's one (one dict per session) or the shared instance one
+        if sys_data is None:
+            sys_data = self.__sys_data
         
         # Store nodes execution path for retries
         execution_path = []
         
         # Start from the specified node or root
+        if from_node_name and from_node_name not in plan.index:
+            print(f"{from_node_name} is not in graph {plan.signature}, starting from the root")
+            from_node_name = None
         if from_node_name:
             current_node_name = from_node_name
+            plan_node = plan[from_node_name]
         else:
-            current_node_name = self.root_name
+            current_node_name = plan.root.name
+            plan_node = plan.root
+        waiting_for_user = False
             
         # Main execution loop
         while current_node_name:
@@ -229,25 +837,29 @@ class ChatToT():
             
             # Retry loop for current node
             while retry_count < max_retries and not success:
+                hop_started = time.perf_counter()
                 try:
                     print(f"Executing {current_node_name} (attempt {retry_count + 1}/{max_retries}) -> {arg}")
-                    current_node = self.__graph[current_node_name]["node"]
                     
-                    if current_node.is_interactive_node:
-                        next_node_name, arg, callback= current_node.call(arg, history, trase=trase, sys_data = self.__sys_data)
-                        self.__sys_data |= callback
+                    if plan_node.is_interactive:
+                        with span("node", current_node_name, attempt=retry_count + 1):
+                            next_node_name, arg, callback= plan_node.node.call(arg, history, trase=trase, sys_data = sys_data)
+                        next_plan_node = plan.next_node(plan_node, next_node_name)
+                        sys_data |= callback
+                        self._notify_hop(current_node_name, hop_started)
                         success = True
                         # For interactive nodes, we break the main loop after successful execution
-                        if success:
-                            current_node_name = next_node_name
-                            break
+                        waiting_for_user = True
                     else:
-                        next_node_name, arg = current_node.call(arg, history, trase=trase, sys_data = self.__sys_data)
+                        with span("node", current_node_name, attempt=retry_count + 1):
+                            next_node_name, arg = plan_node.node.call(arg, history, trase=trase, sys_data = sys_data)
+                        next_plan_node = plan.next_node(plan_node, next_node_name)
+                        self._notify_hop(current_node_name, hop_started)
                         success = True
-                        if success:
-                            current_node_name = next_node_name
+                    current_node_name, plan_node = next_node_name, next_plan_node
                     
                 except Exception as e:
+                    self._notify_hop(current_node_name, hop_started, e)
                     retry_count += 1
                     print(f"Error in node {current_node_name}: {str(e)}")
                     
@@ -255,16 +867,17 @@ class ChatToT():
                         print(f"Maximum retries reached for node {current_node_name}")
                         
                         # Call backup_system node if system has one
-                        if "backup_system" in self.__graph.keys():
-                            current_node_name = "backup_system"
+                        if plan.backup is not None:
+                            current_node_name, plan_node = plan.backup.name, plan.backup
                             arg = {
                                 "user_message":  str(arg),
-                                "route_info":  f"Error in node {current_node_name}: {self.__graph[current_node_name]["node"].corpus["function"]["description"]}",
+                                "route_info":  f"Error in node {current_node_name}: {plan_node.node.corpus["function"]["description"]}",
                                 "error_type": str(e)}
                         # Go back one step in the execution path if possible
                         elif len(execution_path) > 1:
                             execution_path.pop()  # Remove current failed node
                             current_node_name = execution_path[-1]  # Go back to previous node
+                            plan_node = plan[current_node_name]
                             print(f"Retrying from previous node: {current_node_name}")
                             retry_count = 0  # Reset retry count for the previous node
                         else:
@@ -272,12 +885,12 @@ class ChatToT():
                             return None, arg
             
             # Break main loop if interactive node was executed successfully
-            if current_node.is_interactive_node and success:
+            if waiting_for_user:
                 break
 
         # Clear callbacks in output nodes 
         if current_node_name == "":
-            self.__sys_data = {}
+            sys_data.clear()
 
         return current_node_name, arg
     
@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+### Conversation checkpoints ###
+# At the end of every turn ChatToT.run_from(session_id=...) saves where the conversation stopped:
+# the interactive node it resumes at (None after an answer, the root is next), the pending reply,
+# the order context (sys_data) and a history pointer (number of messages covered and digest of the
+# last one). Checkpoints are small versioned JSON arrays, so any worker with the same graph can load
+# them and resume the conversation: the process holds no conversation state between turns.
+# The node is stored by plan id and name: the id is used while the graph signature matches, the
+# name after the graph changed (a node missing from the new graph makes the checkpoint unusable).
+# Where checkpoints are stored is up to the session backend, see session_backends.py.
+CHECKPOINT_VERSION = 1
+
+try:
+    import orjson
+
+    def _dumps(content) -> bytes:
+        return orjson.dumps(content, default=str)
+
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library
+    def _dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+    _loads = json.loads
+
+
+class CheckpointError(ValueError):
+    pass
+
+
+def history_digest(history):
+    """Short digest of the last history message, "" for an empty history"""
+    if not history:
+        return ""
+    last = history[-1]
+    content = last.get("content") if isinstance(last, dict) else getattr(last, "content", last)
+    return hashlib.blake2b(str(content).encode(), digest_size=6).hexdigest()
+
+
+class Checkpoint():
+    __slots__ = ("node", "sys_data", "pending", "history_length", "history_digest")
+
+    def __init__(self, node, sys_data, pending=None, history_length=0, history_digest=""):
+        """
+        Args:
+            node: Node the next turn starts at, None for the root.
+            sys_data: Order context of the conversation.
+            pending: Reply of the paused node (the message the customer answers to).
+            history_length: Messages in the history once the reply is appended.
+            history_digest: history_digest() of that history.
+        """
+        self.node = node
+        self.sys_data = sys_data
+        self.pending = pending
+        self.history_length = history_length
+        self.history_digest = history_digest
+
+    def encode(self, plan) -> bytes:
+        plan_node = plan.index.get(self.node) if self.node else None
+        return _dumps([CHECKPOINT_VERSION, plan.signature, plan_node.id if plan_node else -1, self.node,
+                       self.sys_data, self.pending, self.history_length, self.history_digest])
+
+    @classmethod
+    def decode(cls, data, plan):
+        """
+        Raises:
+            CheckpointError: for unknown versions, corrupt data or a node missing from the graph.
+        """
+        try:
+            version, signature, node_id, node, sys_data, pending, history_length, digest = _loads(data)
+        except (ValueError, TypeError) as error:
+            raise CheckpointError(f"Corrupt checkpoint: {error}")
+        if version != CHECKPOINT_VERSION:
+            raise CheckpointError(f"Unsupported checkpoint version {version}")
+        if node is not None:
+            if signature == plan.signature and 0 <= node_id < len(plan.nodes):
+                node = plan.nodes[node_id].name
+            elif node not in plan.index:
+                raise CheckpointError(f"Checkpoint node {node} is not in graph {plan.signature}")
+        return cls(node, sys_data, pending, history_length, digest)
@@ -0,0 +1,79 @@
+from services.chat.instrumentation import SpanRecorder, active_recorder, recording
+from services.chat.tracing import head_sampled
+from contextlib import contextmanager
+import itertools
+import json
+import os
+import random
+import re
+import threading
+
+### Chrome trace export ###
+# Turns can be dumped as Chrome/Perfetto trace-event JSON (chrome://tracing, ui.perfetto.dev).
+# Tracing is opt-in: set CHAT_TRACE_DIR to the output directory, and optionally
+# CHAT_TRACE_SAMPLE_RATE (0-1, default 1). Sessions are sampled as a whole: every turn of
+# a sampled session_id is traced, turns without session_id are sampled one by one.
+
+
+class ChromeTraceRecorder(SpanRecorder):
+    """Keeps every finished span as a complete ("X") trace event"""
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    def exit(self, span, end, error=None):
+        event = {"name": span.name, "cat": span.category, "ph": "X",
+                 "ts": span.start * 1e6, "dur": (end - span.start) * 1e6,
+                 "pid": self.pid, "tid": threading.get_ident()}
+        args = dict(span.args)
+        if error is not None:
+            args["error"] = f"{type(error).__name__}: {error}"
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_json(self):
+        thread_names = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread.ident, "args": {"name": thread.name}}
+                        for thread in threading.enumerate() if thread.ident in {event["tid"] for event in self.events}]
+        return {"traceEvents": thread_names + self.events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_json(), file)
+
+
+class TurnTracer():
+    """Decides which turns are traced and writes one trace file per traced turn"""
+    def __init__(self, directory, sample_rate=1.0, seed=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self._random = random.Random(seed)
+        self._sequence = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """TurnTracer configured by CHAT_TRACE_DIR / CHAT_TRACE_SAMPLE_RATE, None when tracing is off"""
+        directory = os.environ.get("CHAT_TRACE_DIR")
+        if not directory:
+            return None
+        return cls(directory, sample_rate=float(os.environ.get("CHAT_TRACE_SAMPLE_RATE", 1.0)))
+
+    def sampled(self, session_id=None):
+        return head_sampled(session_id, self.sample_rate, self._random)
+
+    @contextmanager
+    def trace_turn(self, session_id=None):
+        """Records the spans of the turn run inside the block, yields the recorder or None if not sampled"""
+        # Nested in an already recorded context (e.g. the replay harness): leave that recorder alone
+        if active_recorder() is not None or not self.sampled(session_id):
+            yield None
+            return
+        recorder = ChromeTraceRecorder()
+        try:
+            with recording(recorder):
+                yield recorder
+        finally:
+            prefix = re.sub(r"[^a-zA-Z0-9_-]", "_", str(session_id)) if session_id is not None else "turn"
+            name = f"{prefix}-{next(self._sequence):06d}.json"
+            recorder.save(os.path.join(self.directory, name))
@@ -0,0 +1,57 @@
+from services.chat.instrumentation import span
+from services.chat.tool_arguments import ArgumentValidator
+import copy
+
+### Node fusion ###
+# A leaf answering node can be marked fusable. That is an LLM_Node with a retriever whose only child
+# receives its answer, e.g. policies_questions -> just_chatting. With fusion on (CHAT_FUSION=1 or
+# ChatToT.set_fusion), the parent's routing call retrieves the child's context up front. It also offers
+# an extra "<child>__answer" tool that takes the arguments of the child's own tool call. When the model
+# answers through it, the child forwards the answer without a completion of its own. Simple Q&A turns
+# then take one LLM round trip instead of two, and the node path of the turn is unchanged.
+FUSED_TOOL_SUFFIX = "__answer"
+
+FUSION_PROMPT = """
+
+Some pipelines can be answered right away. When the user request is fully answered by one of the
+contexts below, follow that pipeline's instructions and call its `{suffix}` tool with the complete
+reply for the user instead of routing to the pipeline. Otherwise route as usual.
+
+"""
+
+
+class FusedAnswer():
+    """Answer of a fused child made by its parent's routing call, the child hands it over as is"""
+    __slots__ = ("next_node", "arguments")
+
+    def __init__(self, next_node, arguments):
+        self.next_node = next_node
+        self.arguments = arguments
+
+    def __repr__(self):
+        return f"FusedAnswer({self.next_node}, {self.arguments})"
+
+
+class FusedChild():
+    """What a routing call needs to answer for a fusable child: its answer tool, validator and context"""
+    def __init__(self, node):
+        function = node.corpus["function"]
+        answer = node.childs_tools[0]["function"]
+        self.node = node
+        self.name = function["name"]
+        self.tool_name = self.name + FUSED_TOOL_SUFFIX
+        # The child's answer goes to its own child, with the arguments of that tool call
+        self.next_node = answer["name"]
+        self.tool = {"type": "function",
+                     "function": {"name": self.tool_name,
+                                  "description": f"{function['description']}, answering directly from the {self.name} context",
+                                  "parameters": copy.deepcopy(answer["parameters"])}}
+        self.validator = ArgumentValidator(self.tool_name, answer["parameters"])
+
+    def prompt_section(self, arg):
+        """Instructions and retrieved context of the child, for the routing prompt"""
+        request = self.node.template.format(user_message=arg.get("user_message", ""))
+        with span("retrieval", self.name, query_chars=len(request), fused=True):
+            retrieved_docs = self.node.retriver.invoke(request)
+        context_text = "\n".join(doc.page_content for doc in retrieved_docs)
+        return f"### {self.tool_name}\nInstructions: {request}\nContext:\n{context_text}"
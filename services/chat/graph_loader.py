@@ -0,0 +1,337 @@
+from services.RAG_support.RAG_processor import RAG
+from services.chat.chat_ToT import ChatToT, Code_Node, FanOut_Node, Image_to_text_Node, Join_Node, LLM_Node, connect_nodes
+from services.chat.graph_plan import GraphError, compile_plan
+from services.chat.llm_backends import get_llm_backend
+from services.chat.model_policy import CONFIDENCE_SAMPLES, ModelPolicy
+from services.chat.pre_extraction import PreExtractor
+from services.chat.speculation import SpeculativeRetrieval
+import importlib
+import json
+import os
+import threading
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional, JSON graph files need only the standard library
+    yaml = None
+
+### Declarative graphs ###
+# A graph file (YAML or JSON) declares the nodes of a ChatToT, their edges ("children", in
+# connection order), templates, models, retrievers and Code_Node functions:
+#   version: 1
+#   root: root
+#   models:     name -> [cheapest, ..., largest] (or {models: [...], min_confidence: x})
+#   documents:  name -> {source: pdf path, chunk_size, chunk_overlap}
+#   parameters: name -> parameters dict
+#   nodes:      [{name, type: llm|code|fan_out|join|image, description, parameters, children, ...}]
+# Node keys are the keyword arguments of the node class. Parameters and templates are inline values,
+# names of the sections above, or {ref: "module:attribute"} (e.g. the prompts modules); functions are
+# "module:attribute"; retrievers are {documents: name, request_type, top_k, ...}; pre-extractors are
+# {child, fields: {parameter: extract}, constants} with extracts named in pre_extraction.py.
+# load_graph validates the whole file and compiles the graph, reporting every issue in one GraphError.
+# GraphReloader swaps a newer version of the file into a running ChatToT, see ChatToT.replace_graph.
+GRAPH_FORMAT_VERSION = 1
+
+NODE_CLASSES = {"llm": LLM_Node, "code": Code_Node, "fan_out": FanOut_Node, "join": Join_Node, "image": Image_to_text_Node}
+COMMON_KEYS = {"name", "type", "description", "parameters", "required", "order_fields", "children"}
+NODE_KEYS = {"llm": {"template", "model", "retriever", "history_independent", "coalesce_window", "pre_extractors",
+                     "strict_tools", "fusable", "speculation", "history_window"},
+             "code": {"function", "is_interactive"},
+             "fan_out": {"join", "deadline", "required_branches"},
+             "join": {"function"},
+             "image": {"model", "prompt", "detail"}}
+
+
+def read_graph_file(path):
+    with open(path, encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ImportError(f"PyYAML is needed to load {path}")
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def resolve_ref(reference:str):
+    """Object named by "module:attribute" """
+    module_name, _, attribute = reference.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Reference '{reference}' must be 'module:attribute'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def data_modules(spec):
+    """Modules referenced by {ref: ...} values (parameters and templates), reloaded by GraphReloader when they change"""
+    modules = set()
+    for node_spec in spec.get("nodes") or []:
+        for key in ("parameters", "template"):
+            value = node_spec.get(key) if isinstance(node_spec, dict) else None
+            if isinstance(value, dict) and set(value) == {"ref"}:
+                modules.add(str(value["ref"]).partition(":")[0])
+    return modules
+
+
+### Retrievers ###
+class RetrieverCache():
+    """
+    Document indexes and retrievers by spec, kept across graph reloads: the RAG setup (PDF processing
+    and embeddings) runs once per document, and a retriever is only rebuilt when its spec changes.
+    """
+    def __init__(self):
+        self._documents = {}
+        self._retrievers = {}
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self.stats = {"documents_built": 0, "retrievers_built": 0, "retrievers_reused": 0}
+
+    def retriever(self, documents:dict, options:dict):
+        documents_key = json.dumps(documents, sort_keys=True)
+        key = (documents_key, json.dumps(options, sort_keys=True))
+        with self._lock:
+            if key in self._retrievers:
+                self.stats["retrievers_reused"] += 1
+                return self._retrievers[key]
+            rag = self._documents.get(documents_key)
+            if rag is None:
+                if self._embeddings is None:
+                    # Offline LLM backends (replay/stub) also provide the retrievers' embeddings
+                    self._embeddings = get_llm_backend().embeddings()
+                rag = RAG(os.path.join(*documents["source"].split("/")), chunk_size=documents.get("chunk_size", 1000),
+                          chunk_overlap=documents.get("chunk_overlap", 100), embeddings=self._embeddings)
+                self._documents[documents_key] = rag
+                self.stats["documents_built"] += 1
+            retriever = rag.get_retriver(**options)
+            self._retrievers[key] = retriever
+            self.stats["retrievers_built"] += 1
+            return retriever
+
+
+_default_retrievers = RetrieverCache()
+
+
+def default_retrievers():
+    """Retriever cache shared by the graphs loaded in the process"""
+    return _default_retrievers
+
+
+### Graph building ###
+class _GraphBuilder():
+    def __init__(self, spec, retrievers:RetrieverCache):
+        self.spec = spec
+        self.retrievers = retrievers
+        self.models = spec.get("models") or {}
+        self.documents = spec.get("documents") or {}
+        self.parameters = spec.get("parameters") or {}
+
+    @staticmethod
+    def value(value, section:dict=None):
+        """Inline value, {ref: "module:attribute"}, or the name of an entry of section"""
+        if isinstance(value, dict) and set(value) == {"ref"}:
+            return resolve_ref(value["ref"])
+        if section is not None and isinstance(value, str):
+            if value not in section:
+                raise ValueError(f"Unknown parameters '{value}'")
+            return section[value]
+        return value
+
+    def model(self, value):
+        value = self.models.get(value, value) if isinstance(value, str) else value
+        if isinstance(value, dict):
+            return ModelPolicy(value["models"], min_confidence=value.get("min_confidence"),
+                               samples=value.get("samples", CONFIDENCE_SAMPLES))
+        return ModelPolicy(value)
+
+    def retriever(self, value):
+        options = dict(value)
+        documents = options.pop("documents", None)
+        if documents not in self.documents:
+            raise ValueError(f"Unknown documents '{documents}'")
+        return self.retrievers.retriever(self.documents[documents], options)
+
+    @staticmethod
+    def pre_extractor(value):
+        fields = {}
+        for parameter, extract in value["fields"].items():
+            fields[parameter] = resolve_ref(extract if ":" in extract else f"services.chat.pre_extraction:{extract}")
+        return PreExtractor(value["child"], fields=fields, constants=value.get("constants"))
+
+    def node(self, node_spec):
+        kind = node_spec.get("type")
+        if kind not in NODE_CLASSES:
+            raise ValueError(f"Unknown node type '{kind}', use {', '.join(NODE_CLASSES)}")
+        unknown = set(node_spec) - COMMON_KEYS - NODE_KEYS[kind]
+        if unknown:
+            raise ValueError(f"Unknown keys for a {kind} node: {', '.join(sorted(unknown))}")
+        kwargs = {key: value for key, value in node_spec.items() if key not in ("type", "children")}
+        kwargs["parameters"] = self.value(kwargs.get("parameters", {}), self.parameters)
+        for key in ("template", "prompt"):
+            if key in kwargs:
+                kwargs[key] = self.value(kwargs[key])
+        if "model" in kwargs:
+            kwargs["model"] = self.model(kwargs["model"])
+        if "retriever" in kwargs:
+            kwargs["retriver"] = self.retriever(kwargs.pop("retriever"))
+        if "pre_extractors" in kwargs:
+            kwargs["pre_extractors"] = [self.pre_extractor(value) for value in kwargs["pre_extractors"]]
+        if "speculation" in kwargs:
+            kwargs["speculation"] = SpeculativeRetrieval(**kwargs["speculation"])
+        if "function" in kwargs:
+            kwargs["function"] = resolve_ref(kwargs["function"])
+        return NODE_CLASSES[kind](**kwargs)
+
+    def build(self):
+        """
+        Returns:
+            (graph, root_name, plan): the connected nodes and their execution plan, see ChatToT.replace_graph.
+        """
+        spec, issues = self.spec, []
+        if spec.get("version") != GRAPH_FORMAT_VERSION:
+            issues.append(f"Unsupported graph file version {spec.get('version')}, expected {GRAPH_FORMAT_VERSION}")
+        node_specs = {}
+        for index, node_spec in enumerate(spec.get("nodes") or []):
+            name = node_spec.get("name") if isinstance(node_spec, dict) else None
+            if not name:
+                issues.append(f"Node #{index} has no name")
+            elif name in node_specs:
+                issues.append(f"Node {name} is declared twice")
+            else:
+                node_specs[name] = node_spec
+        root_name = spec.get("root")
+        if root_name not in node_specs:
+            issues.append(f"Root node '{root_name}' is not declared")
+        for name, node_spec in node_specs.items():
+            for child in node_spec.get("children") or []:
+                if child not in node_specs:
+                    issues.append(f"{name}: child {child} is not declared")
+
+        nodes = {}
+        for name, node_spec in node_specs.items():
+            try:
+                nodes[name] = self.node(node_spec)
+            except (TypeError, ValueError, KeyError, ImportError, AttributeError) as error:
+                issues.append(f"{name}: {error}")
+        if issues:
+            raise GraphError(issues)
+
+        # Connected breadth first from the root, children in declaration order
+        graph = {root_name: {"node": nodes[root_name], "childs": []}}
+        queue, connected = [root_name], {root_name}
+        for parent in queue:
+            for child in node_specs[parent].get("children") or []:
+                try:
+                    connect_nodes(graph, parent, nodes[child])
+                except TypeError as error:
+                    issues.append(str(error))
+                if child not in connected:
+                    connected.add(child)
+                    queue.append(child)
+        issues += [f"{name} can't be reached from the root {root_name}" for name in node_specs if name not in connected]
+        if issues:
+            raise GraphError(issues)
+        return graph, root_name, compile_plan(graph, root_name)
+
+
+def load_graph(path, retrievers:RetrieverCache=None):
+    """
+    ChatToT built and compiled from a graph file.
+
+    Raises:
+        GraphError: every issue found in the file and in the graph it declares.
+    """
+    graph, root_name, plan = _GraphBuilder(read_graph_file(path), retrievers or default_retrievers()).build()
+    chat_bot = ChatToT(graph[root_name]["node"])
+    chat_bot.replace_graph(graph, root_name, plan)
+    return chat_bot
+
+
+### Hot reload ###
+class GraphReloader():
+    """
+    Reloads a ChatToT from its graph file when the file, or a module its templates and parameters
+    reference, changes. The new graph is built and validated aside and swapped in atomically
+    (ChatToT.replace_graph): turns in flight finish on the old graph, conversations resume on the new
+    one by node name, and unchanged retrievers are reused. Invalid files are reported and ignored.
+    Code_Node functions are not reloaded: code changes still need a restart.
+    """
+    def __init__(self, chat_bot:ChatToT, path, retrievers:RetrieverCache=None):
+        self.chat_bot = chat_bot
+        self.path = path
+        self.retrievers = retrievers or default_retrievers()
+        self.stats = {"reloads": 0, "failures": 0}
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._modules = data_modules(read_graph_file(path))
+        self._mtimes = self._snapshot()
+
+    def _files(self):
+        files = {self.path: None}
+        for module_name in self._modules:
+            module = importlib.import_module(module_name)
+            if getattr(module, "__file__", None):
+                files[module.__file__] = module_name
+        return files
+
+    def _snapshot(self):
+        mtimes = {}
+        for path in self._files():
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[path] = None
+        return mtimes
+
+    def changed(self):
+        return self._snapshot() != self._mtimes
+
+    def reload(self):
+        """
+        Rebuilds the graph and swaps it in.
+
+        Returns:
+            True when the new graph is running, False when the file was invalid (the old graph keeps running).
+        """
+        with self._lock:
+            previous = self._mtimes
+            self._mtimes = self._snapshot()
+            try:
+                # Changed template/parameter modules are re-imported first
+                for path, module_name in self._files().items():
+                    if module_name and previous.get(path) != self._mtimes.get(path):
+                        importlib.reload(importlib.import_module(module_name))
+                spec = read_graph_file(self.path)
+                # Only the nodes and their plan: the running ChatToT keeps its session backend and tracer
+                graph, root_name, plan = _GraphBuilder(spec, self.retrievers).build()
+            except Exception as error:
+                self.stats["failures"] += 1
+                self.last_error = error
+                print(f"Graph reload of {self.path} failed, keeping the running graph: {error}")
+                return False
+            self.chat_bot.replace_graph(graph, root_name, plan)
+            self._modules = data_modules(spec)
+            self._mtimes = self._snapshot()
+            self.stats["reloads"] += 1
+            self.last_error = None
+            print(f"Graph reloaded from {self.path} (plan {plan.signature})")
+            return True
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            if self.changed():
+                self.reload()
+
+    def start(self, interval=2.0):
+        """Checks the files every interval seconds from a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name="graph-reloader", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @classmethod
+    def from_env(cls, chat_bot:ChatToT, path):
+        """Reloader watching every CHAT_GRAPH_RELOAD_SECONDS, None when the variable is unset or 0"""
+        interval = float(os.environ.get("CHAT_GRAPH_RELOAD_SECONDS", 0) or 0)
+        return cls(chat_bot, path).start(interval) if interval > 0 else None
@@ -0,0 +1,161 @@
+from types import MappingProxyType
+import hashlib
+
+### Execution plan ###
+# ChatToT.compile() freezes the graph built with conect_node_to_node into an ExecutionPlan.
+# The structure is validated once, so broken graphs fail at startup instead of mid conversation.
+# Node names are interned into PlanNodes (integer id, node, interactive flag, children by name),
+# each node's tools payload is built and serialized once, and a hop resolves the next node through
+# its parent's children: a node can only hand over to a node it is connected to.
+BACKUP_NODE = "backup_system"
+
+
+class GraphError(ValueError):
+    """Structural problems found while compiling a graph, all of them at once"""
+    def __init__(self, issues):
+        super().__init__("Invalid graph:\n  " + "\n  ".join(issues))
+        self.issues = issues
+
+
+class PlanNode():
+    __slots__ = ("id", "name", "node", "is_interactive", "children")
+
+    def __init__(self, id, name, node):
+        self.id = id
+        self.name = name
+        self.node = node
+        self.is_interactive = node.is_interactive_node
+        # child name -> PlanNode, filled and frozen by compile_plan
+        self.children = {}
+
+    def __repr__(self):
+        return f"PlanNode({self.id}, {self.name!r})"
+
+
+class ExecutionPlan():
+    def __init__(self, root, nodes, signature):
+        self.root = root
+        # PlanNodes by id, and by name for resuming turns
+        self.nodes = nodes
+        self.index = MappingProxyType({plan_node.name: plan_node for plan_node in nodes})
+        self.backup = self.index.get(BACKUP_NODE)
+        # Hash of the node names and edges, identifies the graph version
+        self.signature = signature
+        # Uploads are only prepared for graphs with a node describing them (Image_to_text_Node)
+        self.takes_images = any(getattr(plan_node.node, "takes_images", False) for plan_node in nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, name):
+        return self.index[name]
+
+    def next_node(self, plan_node, name):
+        """PlanNode a node hands over to, None when the turn ends there ("" or None)"""
+        if not name:
+            return None
+        child = plan_node.children.get(name)
+        if child is None:
+            raise ValueError(f"{plan_node.name} handed over to {name}, which it is not connected to")
+        return child
+
+
+def validate_graph(graph, root_name):
+    """
+    Structural issues of a graph (name -> {"node", "childs"}).
+
+    Returns:
+        A list of human readable issues, empty when the graph can run.
+    """
+    issues = []
+    for name, node_rep in graph.items():
+        node, childs = node_rep["node"], node_rep["childs"]
+        if node.is_interactive_node and len(childs) != 1:
+            issues.append(f"{name}: interactive nodes must have one and only one connection, it has {len(childs)}")
+        for extractor in getattr(node, "pre_extractors", []):
+            if extractor.child not in childs:
+                issues.append(f"{name}: pre-extractor target {extractor.child} is not connected")
+                continue
+            properties = graph[extractor.child]["node"].corpus["function"]["parameters"]["properties"]
+            missing = set(properties) - set(extractor.fields) - set(extractor.constants)
+            if missing:
+                issues.append(f"{name}: pre-extractor for {extractor.child} does not fill {sorted(missing)}")
+        join = getattr(node, "join", None)
+        if join is not None:
+            branches = [child for child in childs if child != join]
+            if join not in childs:
+                issues.append(f"{name}: join node {join} is not connected")
+            elif not getattr(graph[join]["node"], "is_join", False):
+                issues.append(f"{name}: {join} is not a Join_Node")
+            if not branches:
+                issues.append(f"{name}: a fan-out needs at least one branch besides its join")
+            issues += [f"{name}: branch {branch} is interactive" for branch in branches if graph[branch]["node"].is_interactive_node]
+            issues += [f"{name}: required branch {branch} is not connected" for branch in sorted(node.required_branches - set(branches))]
+        if getattr(node, "fusable", False):
+            # Answered by the parent's routing call, see fusion.py
+            if len(childs) != 1 or node.retriver is None or set(node.corpus["function"]["parameters"]["properties"]) != {"user_message"}:
+                issues.append(f"{name}: fusable nodes need a retriever, a single child and only a user_message parameter")
+            for parent, parent_rep in graph.items():
+                if name in parent_rep["childs"] and "user_message" not in parent_rep["node"].corpus["function"]["parameters"]["properties"]:
+                    issues.append(f"{name}: parent {parent} has no user_message to answer it with")
+
+    # Every node must be able to end the turn: reach an interactive node (waits for the customer)
+    # or a leaf (output Code_Node or answering LLM_Node)
+    parents = {name: [] for name in graph}
+    for name, node_rep in graph.items():
+        for child in node_rep["childs"]:
+            parents[child].append(name)
+    can_stop = {name for name, node_rep in graph.items() if node_rep["node"].is_interactive_node or not node_rep["childs"]}
+    pending = list(can_stop)
+    while pending:
+        for parent in parents[pending.pop()]:
+            if parent not in can_stop:
+                can_stop.add(parent)
+                pending.append(parent)
+    for name in graph:
+        if name not in can_stop:
+            issues.append(f"{name}: no path to an output or interactive node, turns would never end")
+
+    # Nodes are only added by connecting them, but a graph edited by hand could have orphans
+    reachable, pending = {root_name}, [root_name]
+    while pending:
+        for child in graph[pending.pop()]["childs"]:
+            if child not in reachable:
+                reachable.add(child)
+                pending.append(child)
+    for name in graph.keys() - reachable - {BACKUP_NODE}:
+        issues.append(f"{name}: not reachable from {root_name}")
+    return issues
+
+
+def compile_plan(graph, root_name):
+    """
+    Validates a graph and builds its ExecutionPlan, freezing the children of every node.
+
+    Raises:
+        GraphError: listing every structural issue found.
+    """
+    issues = validate_graph(graph, root_name)
+    if issues:
+        raise GraphError(issues)
+
+    # Root first, then breadth first, so ids are stable for a given graph
+    order, seen = [root_name], {root_name}
+    for name in order:
+        for child in graph[name]["childs"]:
+            if child not in seen:
+                seen.add(child)
+                order.append(child)
+    order += sorted(graph.keys() - seen)
+
+    nodes = tuple(PlanNode(id, name, graph[name]["node"]) for id, name in enumerate(order))
+    by_name = {plan_node.name: plan_node for plan_node in nodes}
+    edges = []
+    for plan_node in nodes:
+        childs = graph[plan_node.name]["childs"]
+        plan_node.children = MappingProxyType({child: by_name[child] for child in childs})
+        edges += [f"{plan_node.name}>{child}" for child in childs]
+        plan_node.node.freeze([child.node for child in plan_node.children.values()])
+
+    signature = hashlib.sha256("\n".join(order + edges).encode()).hexdigest()[:16]
+    return ExecutionPlan(by_name[root_name], nodes, signature)
@@ -0,0 +1,153 @@
+from collections.abc import Sequence
+import os
+import sys
+
+### Conversation history ###
+# run_from turns the history it receives (Gradio's list of message dicts or (user, bot) pairs) into a
+# ChatHistory: append-only Message records with __slots__ and interned role strings, capped per turn
+# by CHAT_HISTORY_MAX_MESSAGES and CHAT_HISTORY_MAX_CHARS (the oldest messages are dropped first).
+# Only the retained tail of a caller's list is read, so a long chat costs the same per turn as a short
+# one. LLM_Nodes read a HistoryWindow (the last history_window messages, all of them by default): a view
+# over the records, no list is copied until the API messages of the hop are built.
+# The caps bound the turn and its prompts, not the caller: Gradio keeps its whole list per session, and the
+# ChatHistory built from it lives for one turn.
+DEFAULT_MAX_MESSAGES = 100
+DEFAULT_MAX_CHARS = 50_000
+
+# Gradio sends non-text content (files, components) in messages: the LLM only gets a marker
+ATTACHMENT = "[attachment]"
+
+
+class Message():
+    __slots__ = ("role", "content")
+
+    def __init__(self, role:str, content:str):
+        self.role = sys.intern(role)
+        self.content = content if isinstance(content, str) else ATTACHMENT
+
+    def as_dict(self):
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self):
+        return f"Message({self.role}, {self.content[:40]!r})"
+
+
+class HistoryWindow(Sequence):
+    """Messages start..stop of a ChatHistory, without copying them; valid until the history is appended to"""
+    __slots__ = ("_messages", "_start", "_stop")
+
+    def __init__(self, messages, start, stop):
+        self._messages = messages
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self._messages[self._start + i] for i in range(start, stop, step)]
+            return HistoryWindow(self._messages, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history window index out of range")
+        return self._messages[self._start + index]
+
+    def __iter__(self):
+        messages = self._messages
+        for index in range(self._start, self._stop):
+            yield messages[index]
+
+    def as_dicts(self):
+        """API messages ({"role", "content"} dicts) of the window"""
+        return [message.as_dict() for message in self]
+
+
+EMPTY_WINDOW = HistoryWindow((), 0, 0)
+
+
+class ChatHistory(Sequence):
+    def __init__(self, max_messages=None, max_chars=None):
+        """
+        Args:
+            max_messages: Messages kept at most (CHAT_HISTORY_MAX_MESSAGES by default).
+            max_chars: Characters of content kept at most (CHAT_HISTORY_MAX_CHARS by default).
+        """
+        self.max_messages = max_messages or int(os.environ.get("CHAT_HISTORY_MAX_MESSAGES", DEFAULT_MAX_MESSAGES))
+        self.max_chars = max_chars or int(os.environ.get("CHAT_HISTORY_MAX_CHARS", DEFAULT_MAX_CHARS))
+        self._messages = []
+        self.chars = 0
+        # Messages of the conversation, retained or dropped by the caps
+        self.total = 0
+
+    @property
+    def dropped(self):
+        return self.total - len(self._messages)
+
+    def append(self, role:str, content):
+        message = Message(role, content)
+        self._messages.append(message)
+        self.chars += len(message.content)
+        self.total += 1
+        self._trim()
+
+    def add_turn(self, user_message, reply):
+        self.append("user", user_message)
+        self.append("assistant", reply)
+
+    def _trim(self):
+        messages = self._messages
+        drop = max(0, len(messages) - self.max_messages)
+        chars = self.chars - sum(len(message.content) for message in messages[:drop])
+        # The latest message is always kept
+        while chars > self.max_chars and drop < len(messages) - 1:
+            chars -= len(messages[drop].content)
+            drop += 1
+        if drop:
+            del messages[:drop]
+            self.chars = chars
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.window()[index]
+        return self._messages[index]
+
+    def window(self, max_messages=None):
+        """The last max_messages retained messages (all of them for None), as a view"""
+        stop = len(self._messages)
+        start = 0 if max_messages is None else max(0, stop - max_messages)
+        return HistoryWindow(self._messages, start, stop)
+
+    def nbytes(self):
+        """Approximate memory held by the history: records, their content and the record list"""
+        return (sys.getsizeof(self) + sys.getsizeof(self._messages)
+                + sum(sys.getsizeof(message) + sys.getsizeof(message.content) for message in self._messages))
+
+    @classmethod
+    def from_messages(cls, history, max_messages=None, max_chars=None):
+        """
+        History of a caller: a ChatHistory is used as is, Gradio histories are converted.
+
+        Args:
+            history: ChatHistory, list of {"role", "content"} dicts, list of (user, bot) pairs, or None.
+        """
+        if isinstance(history, ChatHistory):
+            return history
+        chat_history = cls(max_messages, max_chars)
+        if not history:
+            return chat_history
+        if isinstance(history[0], (list, tuple)):
+            # Gradio "tuples" format: one (user, bot) pair per turn
+            history = [{"role": role, "content": content} for pair in history
+                       for role, content in zip(("user", "assistant"), pair) if content is not None]
+        # Only the tail the caps can retain is read
+        for message in history[-chat_history.max_messages:]:
+            chat_history.append(message["role"], message["content"])
+        chat_history.total = len(history)
+        return chat_history
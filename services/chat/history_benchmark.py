@@ -0,0 +1,97 @@
+"""
+Memory per 1,000 concurrent sessions of the conversation history, and the prompt assembly cost per hop.
+
+Every session holds a conversation of N turns (user message and assistant reply of typical sizes),
+either as Gradio sends it (a list of freshly decoded {"role", "content"} dicts) or as the capped
+ChatHistory run_from reads it into (history.py). Memory is measured with tracemalloc over all the
+sessions alive at once. This compares the data structures for callers keeping a ChatHistory per session
+(like soak_test.py): a Gradio worker still holds Gradio's own list, run_from's ChatHistory only lives for
+a turn. The hop benchmark times building the API messages of one LLM hop: the whole list concatenated
+([system] + history + [request]) against a ChatHistory window.
+
+Usage:
+    python -m services.chat.history_benchmark --sessions 1000 --turns 10 50 150
+"""
+from services.chat.history import ChatHistory
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+WORDS = ("order", "shipping", "refund", "the", "laptop", "warranty", "policy", "please", "tracking", "days",
+         "cancel", "account", "delivery", "return", "monitor", "keyboard", "status", "support", "thanks", "store")
+
+
+def sentence(rng, chars):
+    words, length = [], 0
+    while length < chars:
+        words.append(rng.choice(WORDS))
+        length += len(words[-1]) + 1
+    return " ".join(words)
+
+
+def gradio_history(seed, turns, user_chars=80, reply_chars=450):
+    """A session's history as Gradio sends it: JSON decoded dicts, nothing shared between messages"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(turns):
+        messages += [{"role": "user", "content": sentence(rng, user_chars)},
+                     {"role": "assistant", "content": sentence(rng, reply_chars)}]
+    return json.loads(json.dumps(messages))
+
+
+def measure_memory(build, sessions):
+    """Bytes held by `sessions` live histories made by build(seed)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    histories = [build(seed) for seed in range(sessions)]
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del histories
+    return held
+
+
+def measure_hop(messages, window, iterations):
+    """Microseconds to build one hop's API messages: list concatenation vs a ChatHistory window"""
+    system = {"role": "system", "content": "You are an e-commerce support assistant."}
+    request = {"role": "user", "content": "Route the request. User message: where is my order 1042?"}
+    history = ChatHistory.from_messages(messages)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        [system] + messages + [request]
+    concatenated = (time.perf_counter() - started) / iterations * 1e6
+    started = time.perf_counter()
+    for _ in range(iterations):
+        [system, *(message.as_dict() for message in history.window(window)), request]
+    windowed = (time.perf_counter() - started) / iterations * 1e6
+    return concatenated, windowed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure conversation history memory per 1,000 sessions")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, nargs="*", default=[10, 50, 150], help="Conversation lengths to compare")
+    parser.add_argument("--max-messages", type=int, help="ChatHistory cap (default CHAT_HISTORY_MAX_MESSAGES)")
+    parser.add_argument("--max-chars", type=int, help="ChatHistory cap (default CHAT_HISTORY_MAX_CHARS)")
+    parser.add_argument("--window", type=int, default=20, help="Messages per LLM hop in the hop benchmark")
+    args = parser.parse_args()
+
+    caps = ChatHistory(args.max_messages, args.max_chars)
+    print(f"ChatHistory caps: {caps.max_messages} messages, {caps.max_chars} chars")
+    print(f"{'turns':>6}{'dict list MB/1k':>18}{'ChatHistory MB/1k':>20}{'saved':>8}"
+          f"{'concat us/hop':>15}{'window us/hop':>15}{f'window {args.window} us':>16}")
+    scale = 1000 / args.sessions
+    for turns in args.turns:
+        dicts = measure_memory(lambda seed: gradio_history(seed, turns), args.sessions) * scale
+        # What a session keeps once its Gradio list is read: the capped records only
+        compact = measure_memory(lambda seed: ChatHistory.from_messages(gradio_history(seed, turns), args.max_messages, args.max_chars),
+                                 args.sessions) * scale
+        messages = gradio_history(0, turns)
+        concatenated, windowed = measure_hop(messages, None, 2000)
+        _, last_window = measure_hop(messages, args.window, 2000)
+        print(f"{turns:>6}{dicts / 2**20:>18.1f}{compact / 2**20:>20.1f}{1 - compact / dicts:>8.0%}"
+              f"{concatenated:>15.2f}{windowed:>15.2f}{last_window:>16.2f}")
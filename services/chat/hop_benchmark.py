@@ -0,0 +1,142 @@
+"""
+Micro-benchmark of the graph engine's own overhead per hop.
+
+Synthetic chains of no-op Code_Nodes and of LLM_Nodes answered by a zero-latency stub are run
+through `ChatToT.run_from`, so what is measured is chat_ToT.py itself: resolving the next node
+in the compiled plan, retry bookkeeping, spans and hop listeners (engine), and for LLM_Nodes the
+prompt, tools payload and argument validation around the completion (node overhead). The
+request fingerprint, computed for every coalesced completion and by the record/replay backends,
+is also timed with the tools serialized on every call and pre-serialized at compile time.
+
+Usage:
+    python -m services.chat.hop_benchmark --turns 2000 --chain 8
+"""
+from services.chat.chat_ToT import ChatToT, Code_Node, LLM_Node
+from services.chat.instrumentation import SpanRecorder, recording
+from services.chat.llm_backends import StubBackend, ToolSet, request_fingerprint
+from services.chat.tool_arguments import strict_tool
+import argparse
+import contextlib
+import io
+import time
+
+MESSAGE_PARAMETERS = {"user_message": {"type": "string", "description": "message sent by the user"}}
+
+
+class HopRecorder(SpanRecorder):
+    """Seconds spent inside node calls and inside completions"""
+    def __init__(self):
+        self.node_seconds = 0.0
+        self.llm_seconds = 0.0
+
+    def exit(self, span, end, error=None):
+        if span.category == "node":
+            self.node_seconds += end - span.start
+        elif span.category == "llm":
+            self.llm_seconds += end - span.start
+
+
+def _hand_over(arg, childs_tools, trase=True, order_fields=None):
+    return childs_tools[0]["function"]["name"], arg
+
+
+def _finish(arg, childs_tools, trase=True, order_fields=None):
+    return "", arg["user_message"]
+
+
+def build_chain(kind, length, distractors=2):
+    """
+    Graph root -> hop_1 -> ... -> hop_{length-1} -> done, of Code_Nodes or of LLM_Nodes.
+
+    LLM_Nodes get `distractors` extra output children, so every completion carries several tools.
+    """
+    def make(index):
+        name = f"hop_{index}"
+        if kind == "code":
+            return Code_Node(name=name, description=f"Hop {index}", parameters=MESSAGE_PARAMETERS, function=_hand_over)
+        return LLM_Node(name=name, description=f"Hop {index}", parameters=MESSAGE_PARAMETERS,
+                        template="Route the request. User message: {user_message}", model="gpt-4.1-nano",
+                        # The chain child is always connected first
+                        backend=StubBackend(tool_selector=lambda messages, tools: tools[0]["function"]["name"]))
+
+    nodes = [make(index) for index in range(length)]
+    chat_bot = ChatToT(nodes[0])
+    for parent, child in zip(nodes, nodes[1:]):
+        chat_bot.conect_node_to_node(parent.corpus["function"]["name"], child)
+    chat_bot.conect_node_to_node(nodes[-1].corpus["function"]["name"],
+                                 Code_Node(name="done", description="Output node", parameters=MESSAGE_PARAMETERS, function=_finish))
+    if kind == "llm":
+        for parent in nodes:
+            for index in range(distractors):
+                chat_bot.conect_node_to_node(parent.corpus["function"]["name"],
+                                             Code_Node(name=f"{parent.corpus['function']['name']}_exit_{index}",
+                                                       description="Unrelated output node", parameters=MESSAGE_PARAMETERS,
+                                                       function=_finish))
+    chat_bot.compile()
+    return chat_bot
+
+
+def measure(chat_bot, turns, hops_per_turn):
+    """Microseconds per hop: wall time, and with spans recorded the engine and node shares"""
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        chat_bot.run_from(message="warm up", history=[], image=None)
+        started = time.perf_counter()
+        for turn in range(turns):
+            chat_bot.run_from(message=f"request {turn}", history=[], image=None)
+            if turn % 256 == 0:
+                output.seek(0)
+                output.truncate()
+        wall = time.perf_counter() - started
+
+        recorder = HopRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            for turn in range(turns):
+                chat_bot.run_from(message=f"request {turn}", history=[], image=None)
+                if turn % 256 == 0:
+                    output.seek(0)
+                    output.truncate()
+        recorded = time.perf_counter() - started
+    hops = turns * hops_per_turn
+    return {"hop_us": wall / hops * 1e6,
+            "engine_us": (recorded - recorder.node_seconds) / hops * 1e6,
+            "node_us": (recorder.node_seconds - recorder.llm_seconds) / hops * 1e6,
+            "llm_us": recorder.llm_seconds / hops * 1e6}
+
+
+def measure_fingerprint(tools, iterations):
+    """Microseconds per request fingerprint, tools serialized per call vs pre-serialized"""
+    messages = [{"role": "system", "content": "You are an e-commerce support assistant."},
+                {"role": "user", "content": "Route the request. User message: where is my order 1042?"}]
+    tool_list, tool_set = list(tools), ToolSet(tools)
+    if request_fingerprint("gpt-4.1", messages, tool_list, "required") != request_fingerprint("gpt-4.1", messages, tool_set, "required"):
+        raise AssertionError("Pre-serialized tools change the request fingerprint")
+    timings = {}
+    for label, payload in (("per_call_us", tool_list), ("pre_serialized_us", tool_set)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            request_fingerprint("gpt-4.1", messages, payload, "required")
+        timings[label] = (time.perf_counter() - started) / iterations * 1e6
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the graph engine overhead per hop")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--chain", type=int, default=8, help="Nodes per turn before the output node")
+    parser.add_argument("--tools", type=int, default=8, help="Tools in the fingerprint benchmark")
+    args = parser.parse_args()
+
+    hops_per_turn = args.chain + 1
+    print(f"{'chain':<8}{'hop us':>10}{'engine us':>12}{'node us':>10}{'llm us':>10}")
+    for kind in ("code", "llm"):
+        result = measure(build_chain(kind, args.chain), args.turns, hops_per_turn)
+        print(f"{kind:<8}{result['hop_us']:>10.1f}{result['engine_us']:>12.1f}{result['node_us']:>10.1f}{result['llm_us']:>10.1f}")
+
+    tools = [strict_tool({"type": "function", "function": {"name": f"tool_{index}", "description": f"Support pipeline {index} " * 8,
+                                                           "parameters": {"type": "object", "properties": dict(MESSAGE_PARAMETERS),
+                                                                          "required": [], "additionalProperties": False}}})
+             for index in range(args.tools)]
+    timings = measure_fingerprint(tools, iterations=max(1000, args.turns))
+    print(f"request fingerprint with {args.tools} tools: {timings['per_call_us']:.1f} us serializing the tools, "
+          f"{timings['pre_serialized_us']:.1f} us pre-serialized")
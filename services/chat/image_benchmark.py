@@ -0,0 +1,108 @@
+"""
+Cost of an image turn: what the pipeline sends instead of the upload, how long preparing takes, and how
+much of it the routing completion hides.
+
+For uploads of typical sizes (synthetic photos, Gradio sends them as RGBA, and a transparent screenshot),
+it reports the decoded upload held in memory, the upload as a lossless PNG data URL (what sending it
+unprepared would cost), the prepared JPEG, the preparation time and the description cache lookup. A small
+graph (root -> Image_to_text_Node -> answer) then runs turns on the stub backend with an emulated LLM
+latency, with and without an image, and once more with the same image to show the cached description.
+
+Usage:
+    python -m services.chat.image_benchmark --latency-ms 300 --turns 5
+"""
+from services.chat.chat_ToT import ChatToT, Image_to_text_Node, LLM_Node
+from services.chat.image_pipeline import ImagePipeline, image_pipeline, prepare_image
+from services.chat.llm_backends import StubBackend
+from PIL import Image, ImageDraw
+import argparse
+import base64
+import io
+import statistics
+import time
+
+
+def synthetic_photo(width, height, mode="RGBA"):
+    """Smooth gradients with sensor-like noise, compressing like a photo"""
+    base = Image.merge("RGB", [Image.linear_gradient("L").rotate(angle).resize((width, height)) for angle in (0, 90, 45)])
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    return Image.blend(base, noise, 0.15).convert(mode)
+
+
+def synthetic_screenshot(width, height):
+    """Flat colors and text on a transparent background"""
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 40):
+        draw.rectangle((20, row + 5, width - 20, row + 35), fill=(240, 240, 250, 255))
+        draw.text((30, row + 12), f"Order 10{row:05d} - shipped - tracking 1Z{row * 7919:012d}", fill=(20, 20, 20, 255))
+    return image
+
+
+def png_data_url_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return len(base64.b64encode(buffer.getvalue()))
+
+
+def prepare_report(name, image, repeat):
+    times = []
+    for _ in range(repeat):
+        prepared = prepare_image(image)
+        times.append(prepared.prepare_seconds * 1000)
+    pipeline = ImagePipeline(workers=1)
+    pipeline.describe(prepared, lambda prepared: "description")
+    started = time.perf_counter()
+    for _ in range(1000):
+        pipeline.describe(prepared, lambda prepared: "description")
+    lookup_us = (time.perf_counter() - started) / 1000 * 1e6
+    print(f"{name:<22}{image.width * image.height * len(image.getbands()) / 2**20:>10.1f}"
+          f"{png_data_url_bytes(image) / 1024:>14.0f}{len(prepared.data_url()) / 1024:>14.1f}"
+          f"{statistics.median(times):>12.1f}{lookup_us:>12.2f}   {prepared.width}x{prepared.height}")
+
+
+def build_graph(backend):
+    message = {"user_message": {"type": "string", "description": "Last user message"}}
+    root = LLM_Node("root", "Routes the request", message, "Route the request. User message: {user_message}",
+                    "gpt-4.1-nano", backend=backend)
+    describe = Image_to_text_Node("damaged_item_photo", "The customer sent a photo of a damaged item", message, backend=backend)
+    answer = LLM_Node("answer_damage", "Answers about the damaged item", message,
+                      "Picture: {image_description}\nUser message: {user_message}", "gpt-4.1-mini", backend=backend)
+    chat_bot = ChatToT(root)
+    chat_bot.conect_node_to_node("root", describe)
+    chat_bot.conect_node_to_node("damaged_item_photo", answer)
+    chat_bot.compile()
+    chat_bot.hop_listeners = []
+    return chat_bot
+
+
+def turn_ms(chat_bot, image, turns, fresh):
+    times = []
+    for turn in range(turns):
+        # A fresh image per turn misses the description cache
+        upload = synthetic_photo(4000 - turn, 3000) if fresh else image
+        started = time.perf_counter()
+        chat_bot.run_from(message="my item arrived damaged, see the photo", history=[], image=upload, trase=False)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure image preparation and image turn cost")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Emulated latency of every completion")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="Preparations per upload size")
+    args = parser.parse_args()
+
+    print(f"{'upload':<22}{'decoded MB':>10}{'PNG url KB':>14}{'sent url KB':>14}{'prepare ms':>12}{'cached us':>12}   sent size")
+    prepare_report("photo 1280x960 RGBA", synthetic_photo(1280, 960), args.repeat)
+    prepare_report("photo 4000x3000 RGBA", synthetic_photo(4000, 3000), args.repeat)
+    prepare_report("screenshot 1600x2400", synthetic_screenshot(1600, 2400), args.repeat)
+
+    chat_bot = build_graph(StubBackend(latency_ms=args.latency_ms))
+    photo = synthetic_photo(4000, 3000)
+    print(f"\nTurn medians with {args.latency_ms:.0f} ms per completion:")
+    print(f"  no image:                {turn_ms(chat_bot, None, args.turns, False):8.1f} ms")
+    print(f"  new 4000x3000 image:     {turn_ms(chat_bot, None, args.turns, True):8.1f} ms")
+    print(f"  same image (cached):     {turn_ms(chat_bot, photo, args.turns, False):8.1f} ms")
+    print(f"  pipeline: {image_pipeline().report()}")
@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from PIL import Image
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+
+### Image turns ###
+# run_from hands the customer's image to the process-wide ImagePipeline as soon as the turn starts (when the
+# graph has an Image_to_text_Node, the upload is dropped otherwise) and keeps only an ImageRef in arg and in
+# the turn's context (tool-call arguments replace arg after the first hop): the full-resolution upload never
+# reaches the per-hop print, traces or checkpoints.
+# On a pipeline thread (Pillow releases the GIL while resizing and encoding, so this overlaps the routing
+# completion) the image is downscaled to CHAT_IMAGE_MAX_SIDE pixels, flattened on white when it has an alpha
+# channel (Gradio sends RGBA), hashed, and re-encoded as JPEG within CHAT_IMAGE_MAX_BYTES. Image_to_text_Node
+# waits for it and describes it once per content hash (the vision prompt holds the picture only, the
+# message goes to the node's child with the description): a picture sent again (Gradio keeps the image in the
+# input between messages) reuses the cached description instead of another vision completion.
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_MAX_BYTES = 200_000
+# Quality ladder tried before downscaling further
+JPEG_QUALITIES = (85, 72, 60, 45)
+
+
+class PreparedImage():
+    __slots__ = ("key", "data", "width", "height", "source_size", "source_bytes", "prepare_seconds")
+    media_type = "image/jpeg"
+
+    def __init__(self, key, data, width, height, source_size, source_bytes, prepare_seconds):
+        self.key = key
+        self.data = data
+        self.width = width
+        self.height = height
+        # (width, height) and decoded bytes of the upload
+        self.source_size = source_size
+        self.source_bytes = source_bytes
+        self.prepare_seconds = prepare_seconds
+
+    def data_url(self):
+        return f"data:{self.media_type};base64,{base64.b64encode(self.data).decode()}"
+
+    def __repr__(self):
+        return f"PreparedImage({self.key[:12]} {self.width}x{self.height} jpeg {len(self.data) / 1024:.0f} KB)"
+
+
+class ImageRef():
+    """Reference to an image being prepared by the pipeline, what arg carries instead of the image"""
+    __slots__ = ("_future",)
+
+    def __init__(self, future):
+        self._future = future
+
+    def result(self, timeout=None):
+        """The PreparedImage, raises the preparation error (e.g. an unreadable file)"""
+        return self._future.result(timeout)
+
+    async def aresult(self):
+        """result() for asyncio callers, without blocking their event loop"""
+        return await asyncio.wrap_future(self._future)
+
+    def __repr__(self):
+        if not self._future.done():
+            return "ImageRef(preparing)"
+        if self._future.exception() is not None:
+            return f"ImageRef(failed: {self._future.exception()})"
+        return f"ImageRef({self._future.result()!r})"
+
+
+_turn_image = ContextVar("turn_image", default=None)
+
+@contextmanager
+def turn_image(image:ImageRef):
+    """Makes image the image of the turn run inside the block (fan-out branches inherit it)"""
+    token = _turn_image.set(image)
+    try:
+        yield image
+    finally:
+        _turn_image.reset(token)
+
+
+def current_image():
+    """ImageRef of the running turn, None when the customer sent no image"""
+    return _turn_image.get()
+
+
+def _open(image):
+    """PIL image of an upload: PIL image, encoded bytes, file path or array (Gradio type="numpy")"""
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image))
+    if isinstance(image, (str, os.PathLike)):
+        return Image.open(image)
+    return Image.fromarray(image)
+
+
+def _flatten(image):
+    """RGB image, transparent pixels composited on white"""
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def prepare_image(image, max_side=None, max_bytes=None):
+    """
+    Downscaled, flattened and re-encoded copy of an upload, keyed by the hash of its pixels.
+
+    Args:
+        max_side: Longest side in pixels (CHAT_IMAGE_MAX_SIDE by default).
+        max_bytes: Size of the JPEG at most (CHAT_IMAGE_MAX_BYTES by default); quality, then size, is reduced to fit.
+    """
+    started = time.perf_counter()
+    max_side = max_side or int(os.environ.get("CHAT_IMAGE_MAX_SIDE", DEFAULT_MAX_SIDE))
+    max_bytes = max_bytes or int(os.environ.get("CHAT_IMAGE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    image = _open(image)
+    source_size = image.size
+    source_bytes = image.width * image.height * len(image.getbands())
+    if image.format == "JPEG":
+        # Lets the decoder skip resolution it would throw away
+        image.draft("RGB", (max_side, max_side))
+    if image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema()[0] == 255:
+        # Opaque, like photos Gradio sends as RGBA: three bands resample faster than four premultiplied ones
+        image = image.convert("RGB")
+    scale = min(1.0, max_side / max(image.size))
+    if scale < 1.0:
+        # The caller's image is left untouched; reducing_gap resamples huge uploads in two cheap passes
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.BICUBIC, reducing_gap=2.0)
+    image = _flatten(image)
+    key = hashlib.blake2b(image.tobytes(), digest_size=16, person=b"chat-image").hexdigest() + f"-{image.width}x{image.height}"
+    while True:
+        for quality in JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= max_bytes:
+                break
+        if buffer.tell() <= max_bytes or max(image.size) <= 64:
+            break
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+    return PreparedImage(key, buffer.getvalue(), image.width, image.height, source_size, source_bytes,
+                         time.perf_counter() - started)
+
+
+def new_image_stats():
+    return {"images": 0, "failed": 0, "source_bytes": 0, "sent_bytes": 0, "prepare_seconds": 0.0,
+            "described": 0, "cache_hits": 0}
+
+
+class ImagePipeline():
+    def __init__(self, workers=None, cache_size=None, max_side=None, max_bytes=None):
+        """
+        Args:
+            workers: Threads preparing images (CHAT_IMAGE_WORKERS, default 2).
+            cache_size: Descriptions kept, least recently used first evicted (CHAT_IMAGE_CACHE, default 1024).
+        """
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size or int(os.environ.get("CHAT_IMAGE_CACHE", 1024))
+        self.pool = ThreadPoolExecutor(max_workers=workers or int(os.environ.get("CHAT_IMAGE_WORKERS", 2)),
+                                       thread_name_prefix="image")
+        self._descriptions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = new_image_stats()
+
+    def submit(self, image):
+        """ImageRef of an upload, prepared in the background; None and ImageRefs are returned as they are"""
+        if image is None or isinstance(image, ImageRef):
+            return image
+        future = self.pool.submit(prepare_image, image, self.max_side, self.max_bytes)
+        future.add_done_callback(self._record)
+        return ImageRef(future)
+
+    def _record(self, future):
+        with self._lock:
+            if future.exception() is not None:
+                self.stats["failed"] += 1
+                return
+            prepared = future.result()
+            self.stats["images"] += 1
+            self.stats["source_bytes"] += prepared.source_bytes
+            self.stats["sent_bytes"] += len(prepared.data)
+            self.stats["prepare_seconds"] += prepared.prepare_seconds
+
+    def describe(self, prepared:PreparedImage, describe):
+        """Cached description of the image, describe(prepared) is called on a miss"""
+        with self._lock:
+            description = self._descriptions.get(prepared.key)
+            if description is not None:
+                self._descriptions.move_to_end(prepared.key)
+                self.stats["cache_hits"] += 1
+                return description
+        description = describe(prepared)
+        with self._lock:
+            self.stats["described"] += 1
+            self._descriptions[prepared.key] = description
+            while len(self._descriptions) > self.cache_size:
+                self._descriptions.popitem(last=False)
+        return description
+
+    def report(self):
+        stats = dict(self.stats)
+        images = max(1, stats["images"])
+        stats["mean_sent_kb"] = stats["sent_bytes"] / images / 1024
+        stats["mean_prepare_ms"] = stats["prepare_seconds"] / images * 1000
+        stats["cached_descriptions"] = len(self._descriptions)
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = new_image_stats()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def image_pipeline():
+    """Image pipeline shared by the turns of the process"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ImagePipeline()
+    return _pipeline
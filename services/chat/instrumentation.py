@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+
+### Instrumentation ###
+# Spans mark the expensive steps of a turn: "node" (a node call in ChatToT.run_from),
+# "llm" (a completion), "retrieval" (a retriever invoke), "backend" (an order API call) and
+# "branch" (a fan-out branch, run in another thread).
+# They are only recorded while a recorder is active in the current context (see `recording`);
+# otherwise `span` returns a shared no-op object, so instrumented code costs one context
+# variable lookup.
+
+_recorder = ContextVar("span_recorder", default=None)
+
+
+class Span():
+    __slots__ = ("category", "name", "args", "start", "recorder")
+
+    def __init__(self, recorder, category, name, args):
+        self.recorder = recorder
+        self.category = category
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.recorder.enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.exit(self, time.perf_counter(), exc)
+        return False
+
+
+class _NoopSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanRecorder():
+    """Base recorder: receives every span of the context it is active in"""
+    def enter(self, span:Span):
+        pass
+
+    def exit(self, span:Span, end:float, error=None):
+        pass
+
+
+def span(category, name, **args):
+    """Context manager timing a step of the turn, a no-op unless a recorder is active"""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NOOP_SPAN
+    return Span(recorder, category, name, args)
+
+
+def traced(category, name=None):
+    """Decorator wrapping every call of the function in a span"""
+    def decorator(function):
+        span_name = name or function.__name__
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(category, span_name):
+                return function(*args, **kwargs)
+        # Lets static analysis (path_analysis.py) count the calls a node makes per category
+        wrapper.span_category = category
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def recording(recorder:SpanRecorder):
+    """Activate a recorder for the spans of the current context (thread or task)"""
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def active_recorder():
+    return _recorder.get()
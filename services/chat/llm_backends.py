@@ -0,0 +1,380 @@
+from langchain_core.embeddings import Embeddings
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+import atexit
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+### LLM backends ###
+# Every chat completion made by an LLM_Node goes through an LLMBackend:
+#   live    -> OpenAI chat completions
+#   record  -> live, saving request fingerprint -> response (tool calls included) in a cassette file
+#   replay  -> answers from a cassette, no network
+#   stub    -> local emulation of chat completions tool calling with configurable latency
+# The process-wide backend is chosen with LLM_BACKEND (default "live"), the cassette with LLM_CASSETTE.
+# Backends also provide the embeddings of the retrievers, so an offline graph does not need OpenAI at all.
+
+
+class ToolSet(tuple):
+    """Tool definitions fixed when the graph is compiled, serialized once (same JSON as request_fingerprint)"""
+    def __new__(cls, tools):
+        tool_set = super().__new__(cls, tools)
+        tool_set.json = json.dumps(list(tool_set), sort_keys=True, ensure_ascii=False, default=str)
+        return tool_set
+
+
+def request_fingerprint(model, messages, tools=None, tool_choice=None):
+    """Stable hash of everything that determines a completion"""
+    if isinstance(tools, ToolSet):
+        # Same bytes as below ("tools" is the last sorted key), without serializing the tools again
+        payload = json.dumps({"model": model, "messages": messages, "tool_choice": tool_choice},
+                             sort_keys=True, ensure_ascii=False, default=str)[:-1] + ', "tools": ' + tools.json + "}"
+    else:
+        payload = json.dumps({"model": model, "messages": messages, "tools": tools, "tool_choice": tool_choice},
+                             sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def as_completion(data):
+    """Recursively turn a recorded completion dict into an object with the OpenAI attribute layout"""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: as_completion(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [as_completion(value) for value in data]
+    return data
+
+
+def completion_to_dict(completion):
+    """Inverse of as_completion, also accepts OpenAI response objects"""
+    if hasattr(completion, "model_dump"):
+        return completion.model_dump()
+    if isinstance(completion, SimpleNamespace):
+        return {key: completion_to_dict(value) for key, value in vars(completion).items()}
+    if isinstance(completion, list):
+        return [completion_to_dict(value) for value in completion]
+    return completion
+
+
+def estimate_tokens(text):
+    """Rough token count (4 characters per token), used where no tokenizer response is available"""
+    return max(1, len(text) // 4)
+
+
+# Tokens of an image part sent with detail "low" (the provider's fixed cost)
+LOW_DETAIL_IMAGE_TOKENS = 85
+
+def content_text(content):
+    """Text of a message content: a string, or the text parts of a multimodal content list"""
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return str(content or "")
+
+
+def estimate_content_tokens(content):
+    images = sum(part.get("type") == "image_url" for part in content) if isinstance(content, list) else 0
+    return estimate_tokens(content_text(content)) + images * LOW_DETAIL_IMAGE_TOKENS
+
+
+### Cassette ###
+class CassetteMissError(LookupError):
+    pass
+
+
+class Cassette():
+    """JSON file of recorded completions (in call order per fingerprint) and embeddings (per text hash)"""
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.interactions = {}
+        self.embeddings = {}
+        self._replay_position = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != self.version:
+                raise ValueError(f"Unsupported cassette version {data.get('version')} in {path}")
+            self.interactions = data.get("interactions", {})
+            self.embeddings = data.get("embeddings", {})
+
+    def record(self, fingerprint, response:dict):
+        with self._lock:
+            self.interactions.setdefault(fingerprint, []).append(response)
+
+    def next(self, fingerprint) -> dict:
+        # Identical requests are replayed in recording order; the last response is reused afterwards
+        with self._lock:
+            responses = self.interactions.get(fingerprint)
+            if not responses:
+                raise CassetteMissError(f"No recorded completion for request {fingerprint[:12]} in {self.path}")
+            position = self._replay_position.get(fingerprint, 0)
+            self._replay_position[fingerprint] = position + 1
+            return responses[min(position, len(responses) - 1)]
+
+    def save(self):
+        with self._lock:
+            data = {"version": self.version, "interactions": self.interactions, "embeddings": self.embeddings}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+### Embeddings ###
+class CassetteEmbeddings(Embeddings):
+    """Embeddings served from a cassette; new texts are embedded by `inner` and recorded (fails in replay)"""
+    def __init__(self, cassette:Cassette, inner:Embeddings=None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def _lookup(self, texts, embed):
+        keys = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        missing = [text for key, text in zip(keys, texts) if key not in self.cassette.embeddings]
+        if missing:
+            if self.inner is None:
+                raise CassetteMissError(f"{len(missing)} texts without recorded embedding in {self.cassette.path}")
+            for text, vector in zip(missing, embed(missing)):
+                self.cassette.embeddings[hashlib.sha256(text.encode()).hexdigest()] = vector
+        return [self.cassette.embeddings[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._lookup(texts, lambda missing: self.inner.embed_documents(missing))
+
+    def embed_query(self, text):
+        return self._lookup([text], lambda missing: [self.inner.embed_query(missing[0])])[0]
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings (hashed tokens), good enough for offline retrieval"""
+    def __init__(self, size=256):
+        self.size = size
+
+    def embed_query(self, text):
+        vector = [0.0] * self.size
+        for token in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(token.encode()).hexdigest(), 16) % self.size] += 1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+### Backends ###
+class LLMBackend(ABC):
+    # Offline backends never reach the network
+    offline = False
+
+    @abstractmethod
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        """
+        Chat completion with the OpenAI response layout (choices[0].message, usage).
+
+        Args:
+            logprobs: Ask for the logprobs of the answer tokens (choices[i].logprobs.content).
+            n: Number of sampled choices.
+        """
+        pass
+
+    def embeddings(self):
+        """Embeddings for the retrievers, None to keep the RAG default"""
+        return None
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        # Created on first use, so importing the graph does not require an API key
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+        return self._client
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        kwargs = {"model": model, "store": store, "messages": messages}
+        if tools:
+            kwargs.update(tools=list(tools), tool_choice=tool_choice)
+        if logprobs:
+            kwargs["logprobs"] = True
+        if n > 1:
+            kwargs["n"] = n
+        return self.client.chat.completions.create(**kwargs)
+
+
+class RecordingBackend(LLMBackend):
+    def __init__(self, cassette_path, backend:LLMBackend=None):
+        self.backend = backend or OpenAIBackend()
+        self.cassette = Cassette(cassette_path)
+        atexit.register(self.cassette.save)
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        completion = self.backend.complete(model, messages, tools=tools, tool_choice=tool_choice, store=store, logprobs=logprobs, n=n)
+        self.cassette.record(request_fingerprint(model, messages, tools, tool_choice), completion_to_dict(completion))
+        return completion
+
+    def embeddings(self):
+        from langchain_openai import OpenAIEmbeddings
+        return CassetteEmbeddings(self.cassette, self.backend.embeddings() or OpenAIEmbeddings())
+
+
+class ReplayBackend(LLMBackend):
+    offline = True
+
+    def __init__(self, cassette_path, latency_ms=0.0):
+        if not os.path.exists(cassette_path):
+            raise FileNotFoundError(f"Cassette {cassette_path} not found, record it first with LLM_BACKEND=record")
+        self.cassette = Cassette(cassette_path)
+        self.latency_ms = latency_ms
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        # Recorded with the same options: logprobs and samples are not part of the fingerprint
+        response = self.cassette.next(request_fingerprint(model, messages, tools, tool_choice))
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return as_completion(response)
+
+    def embeddings(self):
+        return CassetteEmbeddings(self.cassette)
+
+
+class StubBackend(LLMBackend):
+    """
+    Local emulation of chat completions. With tools it always calls one: the one picked by
+    `tool_selector(messages, tools)` if given, otherwise the tool whose name or description
+    best matches the user message, with arguments filled from its schema.
+    """
+    offline = True
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, tool_selector=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tool_selector = tool_selector
+        self._random = random.Random(seed)
+
+    def _sleep(self):
+        latency = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    @staticmethod
+    def _user_message(request):
+        # Templates end with `User message: ...` or quote it mid-prompt as `USER MESSAGE: "..."`
+        match = re.search(r'(?:User message|USER MESSAGE):\s*(?:"([^"]*)"|(.*))', request, re.DOTALL)
+        if not match:
+            return request
+        return (match.group(1) if match.group(1) is not None else match.group(2)).strip()
+
+    def _select_tool(self, request, tools):
+        words = set(re.findall(r"\w+", self._user_message(request).lower()))
+        def score(tool):
+            function = tool["function"]
+            name_words = set(re.findall(r"[a-z0-9]+", function["name"].lower().replace("_", " ")))
+            return 2 * len(words & name_words) + len(words & set(re.findall(r"\w+", function["description"].lower())))
+        return max(tools, key=score)["function"]
+
+    def _arguments(self, request, function):
+        user_message = self._user_message(request)
+        numbers = re.findall(r"\d+", user_message)
+        order_id = re.search(r'"order_id":\s*(\d+)', request)
+        arguments = {}
+        for name, schema in function["parameters"]["properties"].items():
+            if schema["type"] == "integer":
+                if "order" in name and order_id:
+                    arguments[name] = int(order_id.group(1))
+                else:
+                    arguments[name] = int(numbers.pop(0)) if numbers else 0
+            elif schema["type"] == "number":
+                arguments[name] = float(numbers.pop(0)) if numbers else 0.0
+            elif schema["type"] == "boolean":
+                arguments[name] = False
+            elif name == "user_message":
+                arguments[name] = user_message
+            else:
+                arguments[name] = f"[stub {name}] {user_message}"
+        return arguments
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        self._sleep()
+        request = content_text(messages[-1]["content"])
+        if tools:
+            # A selector returns (name, arguments), just a name (arguments filled from its schema) or None.
+            # Sampled choices all make the same call: the stub always agrees with itself
+            selected = self.tool_selector(messages, tools) if self.tool_selector else None
+            if isinstance(selected, tuple):
+                name, arguments = selected
+            else:
+                if selected is None:
+                    function = self._select_tool(request, tools)
+                else:
+                    function = next(tool["function"] for tool in tools if tool["function"]["name"] == selected)
+                name, arguments = function["name"], self._arguments(request, function)
+            output = json.dumps(arguments)
+        else:
+            output = f"[stub answer] {self._user_message(request)}"
+        choices, completion_tokens = [], 0
+        for index in range(n):
+            if tools:
+                message = {"role": "assistant", "content": None,
+                           "tool_calls": [{"id": f"call_stub_{self._random.getrandbits(32):08x}", "type": "function",
+                                           "function": {"name": name, "arguments": output}}]}
+                choice = {"index": index, "message": message, "finish_reason": "tool_calls"}
+            else:
+                choice = {"index": index, "message": {"role": "assistant", "content": output}, "finish_reason": "stop"}
+                if logprobs:
+                    # The stub is always sure of its answer
+                    choice["logprobs"] = {"content": [{"token": token, "logprob": 0.0} for token in output.split()]}
+            choices.append(choice)
+            completion_tokens += estimate_tokens(output)
+        prompt_tokens = sum(estimate_content_tokens(item.get("content")) for item in messages)
+        return as_completion({"model": model, "choices": choices,
+                              "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                        "total_tokens": prompt_tokens + completion_tokens}})
+
+    def embeddings(self):
+        return HashEmbeddings()
+
+
+### Process-wide backend ###
+_backend = None
+_backend_lock = threading.Lock()
+
+def backend_from_env():
+    mode = os.environ.get("LLM_BACKEND", "live")
+    cassette_path = os.environ.get("LLM_CASSETTE", "llm_cassette.json")
+    if mode == "live":
+        backend = OpenAIBackend()
+    elif mode == "record":
+        backend = RecordingBackend(cassette_path)
+    elif mode == "replay":
+        backend = ReplayBackend(cassette_path, latency_ms=float(os.environ.get("LLM_REPLAY_LATENCY_MS", 0)))
+    elif mode == "stub":
+        backend = StubBackend(latency_ms=float(os.environ.get("LLM_STUB_LATENCY_MS", 0)),
+                              jitter_ms=float(os.environ.get("LLM_STUB_JITTER_MS", 0)))
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND '{mode}', expected live, record, replay or stub")
+    # Rate limited, prioritized dispatch when a budget is configured (LLM_RPM / LLM_TPM), see llm_scheduler.py
+    if os.environ.get("LLM_RPM") or os.environ.get("LLM_TPM"):
+        from services.chat.llm_scheduler import LLMScheduler, ScheduledBackend
+        backend = ScheduledBackend(backend, LLMScheduler.from_env())
+    return backend
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = backend_from_env()
+    return _backend
+
+def set_llm_backend(backend:LLMBackend):
+    global _backend
+    _backend = backend
@@ -0,0 +1,299 @@
+from services.chat.llm_backends import LLMBackend, estimate_content_tokens, estimate_tokens
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+### LLM scheduler ###
+# Process-wide gate between the LLM nodes and the provider. A request waits until
+#   - requests-per-minute and tokens-per-minute token buckets have room for it,
+#   - no request of a higher priority class is waiting (user-blocking hops before background work),
+#   - its session is next in the round-robin over the sessions waiting in its class,
+# and the in-flight limit allows it. A 429 from the provider pauses every dispatch for the
+# Retry-After delay and the request is queued again, instead of each session retrying on its own.
+#
+# Enabled when LLM_RPM or LLM_TPM is set (see backend_from_env); LLM_MAX_IN_FLIGHT caps concurrency.
+
+PRIORITY_INTERACTIVE = 0  # a customer waits for the answer
+PRIORITY_BACKGROUND = 10  # summaries, prefetch, evaluations
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# (session_id, priority) of the LLM requests made in this context
+_request_context = ContextVar("llm_request_context", default=(None, PRIORITY_INTERACTIVE))
+
+
+@contextmanager
+def request_context(session_id=None, priority=PRIORITY_INTERACTIVE):
+    """Tags the LLM requests made inside the block with their session and priority"""
+    token = _request_context.set((session_id, priority))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+class TokenBucket():
+    """Continuously refilled budget of `rate` units per minute, holding at most `capacity`"""
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (0 if now). Requests above capacity only need a full bucket"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount  # may go negative for requests above capacity: later requests pay the debt
+
+    def give_back(self, amount):
+        """Returns (or, if negative, charges) the difference between estimated and actual usage"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket():
+    __slots__ = ("session", "priority", "tokens", "enqueued")
+
+    def __init__(self, session, priority, tokens):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler():
+    def __init__(self, rpm=None, tpm=None, max_in_flight=None, burst_seconds=2, rate_limit_retries=3,
+                 default_retry_after=1.0, history=1000):
+        """
+        Args:
+            rpm: Requests per minute budget, unlimited if None.
+            tpm: Tokens per minute budget (prompt + completion), unlimited if None.
+            max_in_flight: Concurrent upstream requests, unlimited if None.
+            burst_seconds: Bucket capacity in seconds of budget, how much can be spent at once after idling.
+            rate_limit_retries: Times a request rejected with 429 is queued again before the error is raised.
+            default_retry_after: Pause after a 429 without Retry-After header, in seconds.
+            history: Wait times kept per priority for the metrics.
+        """
+        self.requests = TokenBucket(rpm, max(1, rpm * burst_seconds / 60)) if rpm else None
+        self.tokens = TokenBucket(tpm, max(1, tpm * burst_seconds / 60)) if tpm else None
+        self.max_in_flight = max_in_flight
+        self.rate_limit_retries = rate_limit_retries
+        self.default_retry_after = default_retry_after
+        self._condition = threading.Condition()
+        # priority -> session -> waiting tickets, sessions in round-robin order
+        self._waiting = {}
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._waits = {}
+        self._history = history
+        self.counters = {"granted": 0, "rate_limited": 0, "max_queue_depth": 0}
+
+    @classmethod
+    def from_env(cls):
+        rpm = os.environ.get("LLM_RPM")
+        tpm = os.environ.get("LLM_TPM")
+        max_in_flight = os.environ.get("LLM_MAX_IN_FLIGHT")
+        return cls(rpm=float(rpm) if rpm else None, tpm=float(tpm) if tpm else None,
+                   max_in_flight=int(max_in_flight) if max_in_flight else None)
+
+    ### Queue ###
+    def _enqueue(self, ticket):
+        sessions = self._waiting.setdefault(ticket.priority, OrderedDict())
+        sessions.setdefault(ticket.session, deque()).append(ticket)
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue_depth())
+
+    def _head(self):
+        """Next ticket to dispatch: best priority class, then round-robin over its sessions"""
+        for priority in sorted(self._waiting):
+            sessions = self._waiting[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _dequeue(self, ticket):
+        sessions = self._waiting[ticket.priority]
+        tickets = sessions[ticket.session]
+        tickets.popleft()
+        # The session goes to the back of the round-robin, or leaves it when it has nothing left
+        del sessions[ticket.session]
+        if tickets:
+            sessions[ticket.session] = tickets
+
+    def _wait_time(self, ticket):
+        """Seconds until the budgets allow the ticket (0 if now), None when only a finished request can unblock it"""
+        if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+            return None
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(ticket.tokens))
+        return wait
+
+    def acquire(self, tokens, session=None, priority=PRIORITY_INTERACTIVE):
+        """Blocks until the request may be sent, returns the seconds waited"""
+        with self._condition:
+            ticket = _Ticket(session, priority, tokens)
+            self._enqueue(ticket)
+            while True:
+                if self._head() is ticket:
+                    wait = self._wait_time(ticket)
+                    if wait == 0:
+                        break
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            self._dequeue(ticket)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self._in_flight += 1
+            waited = time.monotonic() - ticket.enqueued
+            self._waits.setdefault(priority, deque(maxlen=self._history)).append(waited)
+            self.counters["granted"] += 1
+            # The next head may be dispatchable right away
+            self._condition.notify_all()
+            return waited
+
+    def release(self, estimated_tokens, used_tokens=None):
+        """Ends a request, settling the token budget with the actual usage when known"""
+        with self._condition:
+            self._in_flight -= 1
+            if self.tokens and used_tokens is not None:
+                self.tokens.give_back(estimated_tokens - used_tokens)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Stops every dispatch for `seconds` (provider rate limit)"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.counters["rate_limited"] += 1
+            self._condition.notify_all()
+
+    ### Metrics ###
+    def queue_depth(self):
+        return sum(len(tickets) for sessions in self._waiting.values() for tickets in sessions.values())
+
+    def metrics(self):
+        with self._condition:
+            waits = {}
+            for priority, values in self._waits.items():
+                ordered = sorted(values)
+                waits[PRIORITY_NAMES.get(priority, str(priority))] = {
+                    "count": len(ordered),
+                    "p50_ms": ordered[len(ordered) // 2] * 1000,
+                    "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                    "max_ms": ordered[-1] * 1000}
+            depth_by_priority = {PRIORITY_NAMES.get(priority, str(priority)): sum(len(tickets) for tickets in sessions.values())
+                                 for priority, sessions in self._waiting.items()}
+            return {"queue_depth": self.queue_depth(), "queue_depth_by_priority": depth_by_priority,
+                    "waiting_sessions": sum(len(sessions) for sessions in self._waiting.values()),
+                    "in_flight": self._in_flight, "wait": waits, **self.counters}
+
+
+def _is_rate_limit(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error, default):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+class ScheduledBackend(LLMBackend):
+    """LLM backend whose requests go through an LLMScheduler"""
+    def __init__(self, backend:LLMBackend, scheduler:LLMScheduler, completion_tokens=256):
+        """
+        Args:
+            backend: Backend sending the requests.
+            scheduler: Usually shared by the whole process.
+            completion_tokens: Completion size reserved in the token budget until the real usage is known.
+        """
+        self.backend = backend
+        self.scheduler = scheduler
+        self.completion_tokens = completion_tokens
+        self.offline = backend.offline
+
+    def estimate(self, messages, tools=None, n=1):
+        prompt = sum(estimate_content_tokens(message.get("content")) for message in messages)
+        if tools:
+            prompt += estimate_tokens(getattr(tools, "json", None) or json.dumps(tools))
+        return prompt + self.completion_tokens * n
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        session, priority = _request_context.get()
+        estimated = self.estimate(messages, tools, n)
+        for attempt in range(self.scheduler.rate_limit_retries + 1):
+            self.scheduler.acquire(estimated, session=session, priority=priority)
+            used = None
+            try:
+                completion = self.backend.complete(model, messages, tools=tools, tool_choice=tool_choice, store=store, logprobs=logprobs, n=n)
+                usage = getattr(completion, "usage", None)
+                used = getattr(usage, "total_tokens", None)
+                return completion
+            except Exception as error:
+                if _is_rate_limit(error):
+                    # Rejected before any processing: the whole reservation goes back to the budget
+                    used = 0
+                if not _is_rate_limit(error) or attempt == self.scheduler.rate_limit_retries:
+                    raise
+                self.scheduler.pause(_retry_after(error, self.scheduler.default_retry_after))
+            finally:
+                self.scheduler.release(estimated, used)
+
+    def embeddings(self):
+        return self.backend.embeddings()
+
+
+if __name__ == "__main__":
+    # Interactive sessions and background jobs competing for a small budget with the stub backend
+    import argparse
+    from services.chat.llm_backends import StubBackend
+
+    parser = argparse.ArgumentParser(description="Simulate sessions sharing an LLM budget through the scheduler")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--background", type=int, default=5, help="Background workers")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per session / worker")
+    parser.add_argument("--rpm", type=float, default=1200)
+    parser.add_argument("--tpm", type=float, default=200000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    scheduler = LLMScheduler(rpm=args.rpm, tpm=args.tpm)
+    backend = ScheduledBackend(StubBackend(latency_ms=args.latency_ms), scheduler)
+    messages = [{"role": "user", "content": "Where is my order? " * 20}]
+
+    def client(session, priority):
+        with request_context(session, priority):
+            for _ in range(args.requests):
+                backend.complete("gpt-4.1", messages)
+
+    threads = [threading.Thread(target=client, args=(f"session-{index}", PRIORITY_INTERACTIVE)) for index in range(args.sessions)]
+    threads += [threading.Thread(target=client, args=(f"job-{index}", PRIORITY_BACKGROUND)) for index in range(args.background)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total = (args.sessions + args.background) * args.requests
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed * 60:.0f} rpm, budget {args.rpm:.0f})")
+    print(json.dumps(scheduler.metrics(), indent=2))
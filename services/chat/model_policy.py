@@ -0,0 +1,109 @@
+import math
+
+### Model policies ###
+# An LLM_Node tries the models of its policy from the cheapest up: a completion whose tool call
+# can't be used (see ToolCallError in tool_arguments.py) or whose confidence is below min_confidence is
+# retried one tier up, the last tier's answer is final. Usage, cost and latency are kept per node
+# and model, see ChatToT.model_report().
+# Confidence is only requested when min_confidence is set, and never from the last tier. Answers are
+# scored by their token logprobs. Tool calls have no logprobs: routing nodes sample `samples` completions
+# in one request (the prompt is billed once) and score the share of them calling the first one's tool.
+CONFIDENCE_SAMPLES = 3
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def completion_cost(model, prompt_tokens, completion_tokens):
+    """USD cost of a completion, None for models without a known price"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def logprob_confidence(completion):
+    """Geometric mean probability of the answer tokens, None when the completion has no logprobs"""
+    logprobs = getattr(completion.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None) if logprobs is not None else None
+    if not tokens:
+        return None
+    return math.exp(sum(token.logprob for token in tokens) / len(tokens))
+
+
+def tool_agreement(completion):
+    """Share of the sampled choices calling the same tool as the first one, None for a single choice"""
+    choices = completion.choices
+    if len(choices) < 2:
+        return None
+    def tool_name(choice):
+        tool_calls = getattr(choice.message, "tool_calls", None)
+        return tool_calls[0].function.name if tool_calls else None
+    first = tool_name(choices[0])
+    return sum(tool_name(choice) == first for choice in choices) / len(choices)
+
+
+def completion_confidence(completion):
+    """Tool agreement of sampled tool calls, logprob confidence of an answer"""
+    if getattr(completion.choices[0].message, "tool_calls", None):
+        return tool_agreement(completion)
+    return logprob_confidence(completion)
+
+
+class ModelPolicy():
+    def __init__(self, models, min_confidence=None, confidence=completion_confidence, samples=CONFIDENCE_SAMPLES):
+        """
+        Args:
+            models: Model names from the cheapest (default) to the largest (last escalation).
+            min_confidence: Escalate when confidence(completion) is below it. None disables the check.
+            confidence: Completion -> confidence in [0, 1], or None when it can't be told.
+            samples: Completions sampled per tool call request to score the routing agreement.
+        """
+        if isinstance(models, str):
+            models = [models]
+        if not models:
+            raise ValueError("A model policy needs at least one model")
+        self.models = list(models)
+        self.min_confidence = min_confidence
+        self.confidence = confidence
+        self.samples = samples
+
+    def request_options(self, tools=None):
+        """Backend options giving the completion what confidence() reads"""
+        if self.min_confidence is None:
+            return {}
+        return {"n": self.samples} if tools else {"logprobs": True}
+
+    def low_confidence(self, completion):
+        if self.min_confidence is None:
+            return False
+        confidence = self.confidence(completion)
+        return confidence is not None and confidence < self.min_confidence
+
+
+def new_model_stats():
+    # shared: completions of identical requests reused from another caller, not counted in calls, tokens or cost
+    return {"calls": 0, "escalations": 0, "parse_failures": 0, "low_confidence": 0, "shared": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "latency_s": 0.0}
+
+
+def format_model_report(report):
+    """Table of ChatToT.model_report(): one line per node and model, then the totals"""
+    lines = [f"{'node':<28}{'model':<16}{'calls':>7}{'shared':>8}{'escal.':>8}{'parse err':>10}{'tokens':>10}{'cost $':>11}{'mean ms':>10}"]
+    total_calls, total_cost = 0, 0.0
+    for node_name, models in report.items():
+        for model, stats in models.items():
+            tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+            mean_ms = stats["latency_s"] / stats["calls"] * 1000 if stats["calls"] else 0.0
+            lines.append(f"{node_name:<28}{model:<16}{stats['calls']:>7}{stats.get('shared', 0):>8}{stats['escalations']:>8}{stats['parse_failures']:>10}"
+                         f"{tokens:>10}{stats['cost_usd']:>11.5f}{mean_ms:>10.1f}")
+            total_calls += stats["calls"]
+            total_cost += stats["cost_usd"]
+    lines.append(f"total: {total_calls} LLM calls, ${total_cost:.5f}")
+    return "\n".join(lines)
@@ -1,31 +1,31 @@
 from services.chat.api_requests import *
 
-def chat_orderID_request(arg, childs_tools, trase=True):
+def chat_orderID_request(arg, childs_tools, trase=True, order_fields=None):
     """
     Request user for the order_id
     """
     return childs_tools[0]["function"]["name"], arg["system_message"], {}
 
-def chat_2steps_request(arg, childs_tools, trase=True):
+def chat_2steps_request(arg, childs_tools, trase=True, order_fields=None):
     """
     Send 2-step code and retrieve order status.
     """
     send_2_step_code(arg["order_id"])
-    return childs_tools[0]["function"]["name"], arg["system_message"], get_order_details(arg["order_id"])
+    return childs_tools[0]["function"]["name"], arg["system_message"], get_order_details(arg["order_id"], fields=order_fields)
 
-def chat_check_2steps(arg, childs_tools, trase=True):
+def chat_check_2steps(arg, childs_tools, trase=True, order_fields=None):
     """
     Process 2-step code and retrieve order status.
     """
     if check_2_step_code(order_id=arg["order_id"],code=arg["2-step_code"]):
-        return childs_tools[0]["function"]["name"], "Verification was successful. " + arg["system_message"], get_order_details(arg["order_id"])
-    return "", "There was a problem with verification, contact the call center or try it again latter", get_order_details(arg["order_id"])
+        return childs_tools[0]["function"]["name"], "Verification was successful. " + arg["system_message"], get_order_details(arg["order_id"], fields=order_fields)
+    return "", "There was a problem with verification, contact the call center or try it again latter", get_order_details(arg["order_id"], fields=order_fields)
 
-def canceling_order(arg, childs_tools, trase=True): ## Output Node
+def canceling_order(arg, childs_tools, trase=True, order_fields=None): ## Output Node
     """
     Process Order cancelation and retrieve order status.
     """
-    final_status = cancel_order(order_id=arg["order_id"],reason=arg["motivations"]).status
+    final_status = cancel_order(order_id=arg["order_id"],reason=arg["motivations"])["status"]
     if final_status == "cancelled":
         return "", arg["system_message"]
     elif final_status in ["shipped", "delivered"]:
@@ -33,35 +33,35 @@ def canceling_order(arg, childs_tools, trase=True): ## Output Node
     else:
         return "", "There was a problem, contact the call center or try it again latter"
     
-def returning_to_root(arg, childs_tools, trase=True): ## Output Node
+def returning_to_root(arg, childs_tools, trase=True, order_fields=None): ## Output Node
     """
     User regret order cancelation, returning to root node 
     """
     return "", arg["system_message"]
 
 
-def order_status_check(arg, childs_tools, trase=True):
+def order_status_check(arg, childs_tools, trase=True, order_fields=None):
     """
     Retrieve the current status of the order from tracking database.
     """
     
     return childs_tools[0]["function"]["name"], track_order(arg["order_id"])
 
-def update_notification_preferences(arg, childs_tools, trase=True): ## Output Node
+def update_notification_preferences(arg, childs_tools, trase=True, order_fields=None): ## Output Node
     """
     Update a customer's notification preferences for order tracking.
     """
     # Implementation would update customer preferences in database
     return "", arg["system_message"]
 
-def chat_tracking_info(arg, childs_tools, trase=True):
+def chat_tracking_info(arg, childs_tools, trase=True, order_fields=None):
     """
     Process user messages related to order tracking for additional information requests.
     """
     # Implementation would analyze the message and return appropriate tracking details
-    return childs_tools[0]["function"]["name"], arg["system_message"], get_order_details(arg["order_id"])
+    return childs_tools[0]["function"]["name"], arg["system_message"], get_order_details(arg["order_id"], fields=order_fields)
 
-def just_chatting_handler(arg, childs_tools, trase=True):
+def just_chatting_handler(arg, childs_tools, trase=True, order_fields=None):
     """
     Handles just chatting loop
     """
@@ -0,0 +1,260 @@
+"""
+Static path analysis of a compiled chat graph.
+
+A turn starts at the root or at the node an interactive node resumes to, and ends at an
+interactive node (waiting for the customer), an answering LLM_Node or a Code_Node returning ""
+(output nodes, whose links only document where the conversation goes next, or early exits).
+Every simple path between those points is enumerated and grouped by turn type (start -> end):
+min/max LLM completions (pre-extracted and fused hops cost none, escalations one per model tier),
+order API calls (counted from the node functions' references to @traced("backend") functions),
+and the expected and worst-case turn latency from per-node estimates. The worst case with
+retries assumes every node on the path uses all its attempts and the turn falls back to
+backup_system. Cycles a turn can go around without reaching an interactive node are flagged:
+only the LLM decides when they stop.
+
+Usage:
+    python -m services.chat.path_analysis --llm-ms 900 --backend-ms 40 --budget-ms 10000 --max-llm-calls 6
+    python -m services.chat.path_analysis --profile replay_profile.json
+"""
+import argparse
+import dis
+import json
+import sys
+
+
+def code_node_exits(node):
+    """
+    (hands over, may end the turn) of a node, read from a Code_Node function's code: it hands over
+    when it reads childs_tools, and may end the turn when it can return "" (e.g. a failed verification).
+    """
+    function = getattr(node, "core_function", None)
+    code = getattr(function, "__code__", None)
+    if code is None or not node.childs_tools:
+        return bool(node.childs_tools), not node.childs_tools
+    reads_children = any(instruction.argval == "childs_tools" for instruction in dis.get_instructions(code)
+                         if instruction.opname.startswith("LOAD_"))
+    return reads_children, not reads_children or "" in code.co_consts
+
+
+def backend_calls(node):
+    """Order API functions referenced by a Code_Node's function, 0 for other nodes"""
+    function = getattr(node, "core_function", None)
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return 0
+    names = set(code.co_names)
+    return sum(getattr(function.__globals__.get(name), "span_category", None) == "backend" for name in names)
+
+
+class NodeEstimate():
+    """Static cost of one node call"""
+    __slots__ = ("is_llm", "models", "skips_to", "answers_for", "backend_calls", "retrievals", "expected_ms", "worst_ms", "branch_llm")
+
+    def __init__(self, node, llm_ms, backend_ms, retrieval_ms, worst_factor, measured=None):
+        policy = getattr(node, "model_policy", None)
+        self.is_llm = policy is not None
+        self.models = len(policy.models) if policy else 0
+        # Children a pre-extractor can reach without a completion
+        self.skips_to = {extractor.child for extractor in getattr(node, "pre_extractors", [])}
+        # Children whose completion the node's routing call can make, with fusion on
+        self.answers_for = {child.name for child in getattr(node, "fused_children", ())} if getattr(node, "fusion", False) else set()
+        self.backend_calls = backend_calls(node)
+        self.retrievals = 1 if getattr(node, "retriver", None) else 0
+        # (min, max) completions of a fan-out's branches
+        self.branch_llm = (0, 0)
+        if measured:
+            # Medians of a transcript replay profile, the LLM share being one completion
+            completion_ms = measured["llm_ms"] / max(1.0, measured["llm_calls"] / max(1, measured["calls"]))
+            other_ms = measured["retrieval_ms"] + measured["backend_ms"]
+            self.expected_ms = measured["total_ms"]
+            self.worst_ms = worst_factor * (completion_ms * self.models + other_ms) + measured["code_ms"]
+        else:
+            completion_ms = llm_ms if self.is_llm else 0.0
+            other_ms = self.retrievals * retrieval_ms + self.backend_calls * backend_ms
+            self.expected_ms = completion_ms + other_ms
+            self.worst_ms = worst_factor * (completion_ms * self.models + other_ms)
+
+
+def turn_paths(plan, start):
+    """Simple paths from a turn start to the nodes that end the turn"""
+    paths, stack = [], [(start, (start,))]
+    while stack:
+        plan_node, path = stack.pop()
+        if plan_node.is_interactive:
+            paths.append(path)
+            continue
+        hands_over, may_end = code_node_exits(plan_node.node)
+        if may_end:
+            paths.append(path)
+        if not hands_over:
+            continue
+        join = getattr(plan_node.node, "join", None)
+        # Fan-out branches are single calls inside the fan-out hop, the turn goes on at the join
+        children = [plan_node.children[join]] if join is not None else plan_node.children.values()
+        for child in children:
+            if child not in path:
+                stack.append((child, path + (child,)))
+    return paths
+
+
+def spinning_cycles(plan):
+    """Cycles of non-interactive nodes (strongly connected components), a turn can loop through them"""
+    index, lowlink, on_stack, stack, cycles = {}, {}, set(), [], []
+
+    def visit(plan_node):
+        # Recursive Tarjan, graphs have tens of nodes
+        index[plan_node] = lowlink[plan_node] = len(index)
+        stack.append(plan_node)
+        on_stack.add(plan_node)
+        children = plan_node.children.values() if not plan_node.is_interactive and code_node_exits(plan_node.node)[0] else ()
+        for child in children:
+            if child not in index:
+                visit(child)
+                lowlink[plan_node] = min(lowlink[plan_node], lowlink[child])
+            elif child in on_stack:
+                lowlink[plan_node] = min(lowlink[plan_node], index[child])
+        if lowlink[plan_node] == index[plan_node]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member is plan_node:
+                    break
+            if len(component) > 1 or plan_node in children:
+                cycles.append([member.name for member in sorted(component, key=lambda member: member.id)])
+
+    for plan_node in plan.nodes:
+        if plan_node not in index:
+            visit(plan_node)
+    return cycles
+
+
+def analyze_plan(plan, latencies=None, llm_ms=800.0, backend_ms=50.0, retrieval_ms=30.0, worst_factor=3.0, max_retries=3):
+    """
+    LLM calls, order API calls and latency per turn type of a compiled graph.
+
+    Args:
+        plan: ExecutionPlan of ChatToT.compile().
+        latencies: Optional per node medians (the "nodes" of a transcript replay profile), used instead of the defaults.
+        llm_ms, backend_ms, retrieval_ms: Typical completion, order API call and retrieval latency.
+        worst_factor: Slow call latency relative to the typical one.
+        max_retries: Attempts per node, as in ChatToT.run_from.
+
+    Returns:
+        {"turns": [...], "cycles": [...]} with one entry per turn type (start, end).
+    """
+    latencies = latencies or {}
+    estimates = {plan_node: NodeEstimate(plan_node.node, llm_ms, backend_ms, retrieval_ms, worst_factor, latencies.get(plan_node.name))
+                 for plan_node in plan.nodes}
+
+    # A fan-out costs the calls of all its branches and the latency of the slowest one (capped by its deadline)
+    for plan_node in plan.nodes:
+        join = getattr(plan_node.node, "join", None)
+        if join is None:
+            continue
+        branches = [estimates[child] for name, child in plan_node.children.items() if name != join]
+        estimate = estimates[plan_node]
+        estimate.branch_llm = (sum(branch.is_llm for branch in branches), sum(branch.models for branch in branches))
+        estimate.backend_calls += sum(branch.backend_calls for branch in branches)
+        deadline_ms = plan_node.node.deadline * 1000 if plan_node.node.deadline is not None else float("inf")
+        estimate.expected_ms += min(deadline_ms, max(branch.expected_ms for branch in branches))
+        estimate.worst_ms += min(deadline_ms, max(branch.worst_ms for branch in branches))
+
+    def path_cost(path):
+        cost = {"llm_min": 0, "llm_max": 0, "backend": 0, "expected_ms": 0.0, "worst_ms": 0.0}
+        for position, plan_node in enumerate(path):
+            estimate = estimates[plan_node]
+            following = path[position + 1].name if position + 1 < len(path) else None
+            answered = position > 0 and plan_node.name in estimates[path[position - 1]].answers_for
+            if estimate.is_llm:
+                cost["llm_min"] += 0 if following in estimate.skips_to or answered else 1
+                cost["llm_max"] += estimate.models
+            cost["llm_min"] += estimate.branch_llm[0]
+            cost["llm_max"] += estimate.branch_llm[1]
+            cost["backend"] += estimate.backend_calls
+            cost["expected_ms"] += estimate.expected_ms
+            cost["worst_ms"] += estimate.worst_ms
+        return cost
+
+    # Fallback after a node exhausted its retries: the most expensive backup_system path
+    backup_llm, backup_ms = 0, 0.0
+    if plan.backup is not None:
+        backup_costs = [path_cost(path) for path in turn_paths(plan, plan.backup)]
+        backup_llm = max(cost["llm_max"] for cost in backup_costs) * max_retries
+        backup_ms = max(cost["worst_ms"] for cost in backup_costs) * max_retries
+
+    starts = [plan.root] + [child for plan_node in plan.nodes if plan_node.is_interactive for child in plan_node.children.values()]
+    turns = []
+    for start in dict.fromkeys(starts):
+        by_end = {}
+        for path in turn_paths(plan, start):
+            by_end.setdefault(path[-1], []).append((path, path_cost(path)))
+        for end, routes in by_end.items():
+            costs = [cost for _, cost in routes]
+            worst_path, worst_cost = max(routes, key=lambda route: route[1]["worst_ms"])
+            turns.append({"start": start.name, "end": end.name,
+                          "end_kind": "interactive" if end.is_interactive else "llm answer" if estimates[end].is_llm else "output",
+                          "paths": len(routes),
+                          "llm_calls": [min(cost["llm_min"] for cost in costs), max(cost["llm_max"] for cost in costs)],
+                          "backend_calls": [min(cost["backend"] for cost in costs), max(cost["backend"] for cost in costs)],
+                          "expected_ms": sum(cost["expected_ms"] for cost in costs) / len(costs),
+                          "worst_ms": worst_cost["worst_ms"],
+                          "worst_path": [plan_node.name for plan_node in worst_path],
+                          "worst_llm_calls_with_retries": max(cost["llm_max"] for cost in costs) * max_retries + backup_llm,
+                          "worst_ms_with_retries": worst_cost["worst_ms"] * max_retries + backup_ms})
+    return {"turns": turns, "cycles": spinning_cycles(plan)}
+
+
+def format_path_report(report):
+    lines = [f"{'turn (start -> end)':<62}{'paths':>6}{'llm':>8}{'api':>7}{'expected ms':>13}{'worst ms':>10}{'retries ms':>12}"]
+    for turn in sorted(report["turns"], key=lambda turn: -turn["worst_ms"]):
+        llm, api = turn["llm_calls"], turn["backend_calls"]
+        lines.append(f"{turn['start'] + ' -> ' + turn['end']:<62}{turn['paths']:>6}{f'{llm[0]}-{llm[1]}':>8}{f'{api[0]}-{api[1]}':>7}"
+                     f"{turn['expected_ms']:>13.0f}{turn['worst_ms']:>10.0f}{turn['worst_ms_with_retries']:>12.0f}")
+    if report["cycles"]:
+        lines += [f"cycle without interactive stop: {' -> '.join(cycle)}" for cycle in report["cycles"]]
+    else:
+        lines.append("no cycle without an interactive stop")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worst-case LLM calls and latency per turn type of the chat graph")
+    parser.add_argument("--llm-ms", type=float, default=800.0, help="Typical completion latency")
+    parser.add_argument("--backend-ms", type=float, default=50.0, help="Typical order API call latency")
+    parser.add_argument("--retrieval-ms", type=float, default=30.0, help="Typical retrieval latency")
+    parser.add_argument("--worst-factor", type=float, default=3.0, help="Slow call latency relative to the typical one")
+    parser.add_argument("--profile", help="Transcript replay profile (JSON) with measured per node latencies")
+    parser.add_argument("--budget-ms", type=float, help="Fail when a turn type's worst case (without retries) exceeds it")
+    parser.add_argument("--max-llm-calls", type=int, help="Fail when a turn type can need more completions (without retries)")
+    parser.add_argument("--output", help="Write the report JSON here")
+    args = parser.parse_args()
+
+    # Only the graph structure is needed: build it offline
+    from services.chat.llm_backends import StubBackend, set_llm_backend
+    set_llm_backend(StubBackend())
+    from services.chat.policies_chat import Chat_Bot_ToT
+
+    latencies = None
+    if args.profile:
+        with open(args.profile) as file:
+            latencies = json.load(file)["nodes"]
+    report = Chat_Bot_ToT.analyze_paths(latencies=latencies, llm_ms=args.llm_ms, backend_ms=args.backend_ms,
+                                        retrieval_ms=args.retrieval_ms, worst_factor=args.worst_factor)
+    print(format_path_report(report))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failures = [f"cycle {' -> '.join(cycle)}" for cycle in report["cycles"]]
+    for turn in report["turns"]:
+        if args.budget_ms is not None and turn["worst_ms"] > args.budget_ms:
+            failures.append(f"{turn['start']} -> {turn['end']}: worst case {turn['worst_ms']:.0f} ms > {args.budget_ms:.0f} ms "
+                            f"via {' -> '.join(turn['worst_path'])}")
+        if args.max_llm_calls is not None and turn["llm_calls"][1] > args.max_llm_calls:
+            failures.append(f"{turn['start']} -> {turn['end']}: up to {turn['llm_calls'][1]} LLM calls > {args.max_llm_calls}")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("PASSED")
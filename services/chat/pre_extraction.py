@@ -0,0 +1,89 @@
+import re
+
+### Pre-extraction ###
+# Extraction nodes (order id, verification code...) can often be answered without the LLM.
+# A PreExtractor declares how to fill every argument of one child node: a regex over the
+# user message or a key of the order context, a cast and an optional validator per parameter,
+# plus fixed (templated) values such as the system message. When every parameter has exactly
+# one valid candidate, the node goes straight to that child; otherwise the LLM decides.
+
+
+class Extract():
+    def __init__(self, pattern=None, cast=str, validator=None, source="user_message", key=None, group=0, exclusive=None):
+        """
+        Args:
+            pattern: Regex searched in the source text. Every distinct match is a candidate.
+            cast: Applied to the matched text (or context value). Values it can't cast are discarded.
+            validator: Optional predicate the cast value must satisfy.
+            source: "user_message" (or any other node argument) or "order" for the order context.
+            key: Order context key read when source is "order".
+            group: Regex group holding the value.
+            exclusive: Regex of any value of the kind (e.g. any number): when the text holds more than one
+                distinct match, the extraction is ambiguous and has no candidate.
+        """
+        if source == "order" and key is None:
+            raise ValueError("Order context extraction needs a key")
+        if source != "order" and pattern is None:
+            raise ValueError("Text extraction needs a pattern")
+        self.pattern = re.compile(pattern) if pattern is not None else None
+        self.cast = cast
+        self.validator = validator
+        self.source = source
+        self.key = key
+        self.group = group
+        self.exclusive = re.compile(exclusive) if exclusive is not None else None
+
+    def candidates(self, arg, sys_data):
+        """Distinct valid values, in order of appearance"""
+        if self.source == "order":
+            raw_values = [sys_data[self.key]] if sys_data.get(self.key) is not None else []
+        else:
+            text = arg.get(self.source)
+            if not isinstance(text, str):
+                return []
+            if self.exclusive is not None and len(set(self.exclusive.findall(text))) > 1:
+                return []
+            raw_values = [match.group(self.group) for match in self.pattern.finditer(text)]
+        values = []
+        for raw in raw_values:
+            try:
+                value = self.cast(raw)
+            except (TypeError, ValueError):
+                continue
+            if (self.validator is None or self.validator(value)) and value not in values:
+                values.append(value)
+        return values
+
+
+class PreExtractor():
+    def __init__(self, child:str, fields:dict, constants:dict=None):
+        """
+        Args:
+            child: Name of the child node the extracted arguments are sent to.
+            fields: Parameter name -> Extract.
+            constants: Parameter name -> fixed value; strings are formatted with the extracted fields.
+        """
+        self.child = child
+        self.fields = fields
+        self.constants = constants or {}
+
+    def extract(self, arg, sys_data):
+        """Arguments for the child, or None when some parameter is missing or ambiguous"""
+        arguments = {}
+        for name, extract in self.fields.items():
+            values = extract.candidates(arg, sys_data)
+            if len(values) != 1:
+                return None
+            arguments[name] = values[0]
+        for name, value in self.constants.items():
+            arguments[name] = value.format(**arguments) if isinstance(value, str) else value
+        return arguments
+
+
+# Common extractions
+# An order id needs its cue ("order 1042", "order id is 1042", "order #1042"): a bare number may be a quantity or
+# a number of days, and a message with several numbers is left to the LLM
+ORDER_ID_IN_MESSAGE = Extract(pattern=r"(?i)\border\b(?:\s*(?:id|number|no\.?|#))?(?:\s*(?:is|:))?\s*#?\s*(\d{1,10})\b",
+                              cast=int, validator=lambda order_id: order_id > 0, group=1, exclusive=r"\d+")
+ORDER_ID_IN_CONTEXT = Extract(source="order", key="order_id", cast=int)
+VERIFICATION_CODE_IN_MESSAGE = Extract(pattern=r"(?<!\d)\d{6}(?!\d)", cast=int)
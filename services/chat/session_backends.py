@@ -0,0 +1,522 @@
+"""
+Session backends: where the conversation checkpoints of checkpoint.py live.
+
+Every backend stores an encoded checkpoint per session id with a version number, and
+updates are optimistic: a turn writes back with the version it read, and the write fails
+with SessionConflict when another turn of the same session wrote in between (a double
+submitted message served by two workers). Versions only ever increase: deleting a session
+leaves a tombstone (no data) at the next version, so a turn still holding a version read before
+the delete can't overwrite a conversation started after it. Version 0 means "never written".
+
+- MemorySessionBackend: process memory, one worker only.
+- FileSessionBackend: one file per session in a directory shared by the workers.
+- SQLiteSessionBackend: one table in a SQLite database (WAL) shared by the workers of a host.
+- RedisSessionBackend: any Redis-protocol server (WATCH/MULTI/EXEC), e.g. Redis itself or the
+  local stand-in served by this module for development and benchmarks.
+
+CHAT_SESSION_BACKEND=memory|file|sqlite|redis selects the backend of session_backend_from_env(),
+see the README for the other variables.
+
+Usage (Redis-protocol stand-in):
+    python -m services.chat.session_backends --port 6379
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import argparse
+import contextlib
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # fcntl is POSIX only, on Windows file writes are only serialized within the process
+    fcntl = None
+
+
+class SessionConflict(Exception):
+    """The session was updated by another turn since it was read"""
+    def __init__(self, session_id, expected, current):
+        super().__init__(f"Session {session_id} is at version {current}, expected {expected}")
+        self.session_id = session_id
+        self.expected = expected
+        self.current = current
+
+
+class SessionBackend(ABC):
+    """Encoded checkpoints by session id, with optimistic concurrency on the versions"""
+    @abstractmethod
+    def get(self, session_id):
+        """
+        Returns:
+            (data, version): the stored bytes and their version, (None, 0) for an unknown session and
+            (None, version) for a deleted one.
+        """
+
+    @abstractmethod
+    def put(self, session_id, data:bytes, version=None):
+        """
+        Stores data if the session is still at version (None skips the check).
+
+        Returns:
+            The new version.
+
+        Raises:
+            SessionConflict: the session is no longer at version.
+        """
+
+    @abstractmethod
+    def delete(self, session_id, version=None):
+        """
+        Removes the session's data if it is still at version (None skips the check), leaving a tombstone
+        at the next version.
+
+        Raises:
+            SessionConflict: the session is no longer at version.
+        """
+
+    def close(self):
+        pass
+
+
+def _check(session_id, version, current):
+    if version is not None and version != current:
+        raise SessionConflict(session_id, version, current)
+
+
+### In-process ###
+class MemorySessionBackend(SessionBackend):
+    """Process local sessions, least recently used ones evicted beyond max_sessions"""
+    def __init__(self, max_sessions=100_000):
+        self.max_sessions = max_sessions
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None, 0
+            self._data.move_to_end(session_id)
+            return entry[1], entry[0]
+
+    def put(self, session_id, data, version=None):
+        with self._lock:
+            current = self._data.get(session_id, (0, None))[0]
+            _check(session_id, version, current)
+            self._data[session_id] = (current + 1, data)
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+            return current + 1
+
+    def delete(self, session_id, version=None):
+        with self._lock:
+            current = self._data.get(session_id, (0, None))[0]
+            _check(session_id, version, current)
+            if current:
+                # Tombstone, evicted like the sessions
+                self._data[session_id] = (current + 1, None)
+
+
+### Files ###
+class FileSessionBackend(SessionBackend):
+    """
+    One file per session ("<version>\\n<data>", "<version>" alone for a tombstone) in a directory shared by the workers.
+
+    Files are replaced atomically, so reads take no lock. Writes are serialized by an advisory lock on
+    the directory (fcntl), which keeps the version check and the write together across processes.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._thread_lock = threading.Lock()
+        self._lock_path = os.path.join(directory, ".lock")
+
+    def _path(self, session_id):
+        name = re.sub(r"[^a-zA-Z0-9_-]", "_", str(session_id))
+        return os.path.join(self.directory, f"{name}.ckpt")
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None, 0
+        version, separator, data = content.partition(b"\n")
+        return data if separator else None, int(version)
+
+    def get(self, session_id):
+        return self._read(self._path(session_id))
+
+    @staticmethod
+    def _write(path, content):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield  # closing the file releases the flock
+
+    def put(self, session_id, data, version=None):
+        path = self._path(session_id)
+        with self._locked():
+            current = self._read(path)[1]
+            _check(session_id, version, current)
+            self._write(path, b"%d\n" % (current + 1) + data)
+        return current + 1
+
+    def delete(self, session_id, version=None):
+        path = self._path(session_id)
+        with self._locked():
+            current = self._read(path)[1]
+            _check(session_id, version, current)
+            if current:
+                self._write(path, b"%d" % (current + 1))
+
+
+### SQLite ###
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions table in a SQLite database in WAL mode, one connection per thread (tombstones have NULL data)"""
+    def __init__(self, path="sessions.db", timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _current(self, connection, session_id):
+        row = connection.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, session_id):
+        row = self._connection().execute("SELECT data, version FROM sessions WHERE id = ?", (str(session_id),)).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def put(self, session_id, data, version=None):
+        session_id, connection = str(session_id), self._connection()
+        if version is None:
+            return connection.execute("INSERT INTO sessions (id, version, data) VALUES (?, 1, ?) "
+                                      "ON CONFLICT(id) DO UPDATE SET version = version + 1, data = excluded.data RETURNING version",
+                                      (session_id, data)).fetchone()[0]
+        if version == 0:
+            cursor = connection.execute("INSERT INTO sessions (id, version, data) VALUES (?, 1, ?) ON CONFLICT(id) DO NOTHING",
+                                        (session_id, data))
+        else:
+            cursor = connection.execute("UPDATE sessions SET version = version + 1, data = ? WHERE id = ? AND version = ?",
+                                        (data, session_id, version))
+        if cursor.rowcount == 0:
+            raise SessionConflict(session_id, version, self._current(connection, session_id))
+        return version + 1
+
+    def delete(self, session_id, version=None):
+        session_id, connection = str(session_id), self._connection()
+        if version is None:
+            connection.execute("UPDATE sessions SET version = version + 1, data = NULL WHERE id = ?", (session_id,))
+            return
+        cursor = connection.execute("UPDATE sessions SET version = version + 1, data = NULL WHERE id = ? AND version = ?",
+                                    (session_id, version))
+        if cursor.rowcount == 0:
+            _check(session_id, version, self._current(connection, session_id))
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+### Redis protocol ###
+# RESP2 framing shared by the client and the stand-in server
+def encode_command(*parts) -> bytes:
+    parts = [part if isinstance(part, bytes) else str(part).encode() for part in parts]
+    return b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(part), part) for part in parts)
+
+
+class RespError(Exception):
+    pass
+
+
+# Reply of an aborted EXEC (null array), None being the null bulk string
+_ABORTED = object()
+
+
+def read_reply(reader):
+    """One RESP reply from a buffered binary reader: bytes, int, None, list, or RespError for error replies"""
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        return RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        return None if length < 0 else [read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected RESP reply {line!r}")
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Sessions as "<version>:<data>" strings ("<version>" alone for a tombstone, expiring with the sessions)
+    on a Redis-protocol server, one connection per thread.
+
+    Writes are check-and-set transactions: WATCH and GET, then MULTI/SET/EXEC pipelined, which the
+    server aborts when the key changed after the WATCH.
+    """
+    def __init__(self, host="127.0.0.1", port=6379, prefix="chat:session:", ttl=None, timeout=5.0):
+        """
+        Args:
+            prefix: Key prefix of the sessions.
+            ttl: Seconds a session is kept after its last write, None to keep it until deleted.
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """host:port"""
+        host, _, port = url.rpartition(":")
+        return cls(host or "127.0.0.1", int(port), **kwargs)
+
+    def _execute(self, *commands):
+        """Sends the commands in one write and returns their replies"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = self._local.connection = (sock, sock.makefile("rb"))
+        sock, reader = connection
+        try:
+            sock.sendall(b"".join(encode_command(*command) for command in commands))
+            replies = [read_reply(reader) for _ in commands]
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    @staticmethod
+    def _parse(value):
+        if value is None:
+            return None, 0
+        version, separator, data = value.partition(b":")
+        return data if separator else None, int(version)
+
+    def get(self, session_id):
+        return self._parse(self._execute(("GET", self.prefix + str(session_id)))[0])
+
+    def _transaction(self, session_id, version, write):
+        key = self.prefix + str(session_id)
+        current = self._parse(self._execute(("WATCH", key), ("GET", key))[1])[1]
+        if version is not None and version != current:
+            self._execute(("UNWATCH",))
+            raise SessionConflict(session_id, version, current)
+        result = self._execute(("MULTI",), write(key, current), ("EXEC",))[-1]
+        if result is None:  # the key changed after the WATCH
+            raise SessionConflict(session_id, version if version is not None else current, self.get(session_id)[1])
+        return current + 1
+
+    def put(self, session_id, data, version=None):
+        expiry = ("EX", self.ttl) if self.ttl else ()
+        return self._transaction(session_id, version, lambda key, current: ("SET", key, b"%d:" % (current + 1) + data, *expiry))
+
+    def delete(self, session_id, version=None):
+        expiry = ("EX", self.ttl) if self.ttl else ()
+        self._transaction(session_id, version, lambda key, current: ("SET", key, b"%d" % (current + 1), *expiry) if current else ("DEL", key))
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection[1].close()
+            connection[0].close()
+            self._local.connection = None
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """
+    In-memory Redis-protocol server with the commands the session backend uses: PING, GET, SET (EX),
+    DEL, WATCH, UNWATCH, MULTI, EXEC and DISCARD. A local stand-in for development and benchmarks,
+    not a Redis replacement (no persistence, one lock for every command).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 6379)):
+        super().__init__(address, _RespHandler)
+        self.values = {}
+        self.expiries = {}
+        # Writes per key, compared by EXEC against the count seen at WATCH
+        self.writes = {}
+        self.lock = threading.Lock()
+
+    def _expire(self, key):
+        expiry = self.expiries.get(key)
+        if expiry is not None and expiry <= time.monotonic():
+            self.values.pop(key, None)
+            self.expiries.pop(key, None)
+            self.writes[key] = self.writes.get(key, 0) + 1
+
+    def run(self, name, args):
+        """Executes one command (lock held)"""
+        if name == b"PING":
+            return b"PONG"
+        if name == b"GET":
+            self._expire(args[0])
+            return self.values.get(args[0])
+        if name == b"SET":
+            key = args[0]
+            self.values[key] = args[1]
+            self.expiries.pop(key, None)
+            if len(args) >= 4 and args[2].upper() == b"EX":
+                self.expiries[key] = time.monotonic() + int(args[3])
+            self.writes[key] = self.writes.get(key, 0) + 1
+            return b"OK"
+        if name == b"DEL":
+            removed = 0
+            for key in args:
+                self._expire(key)
+                if self.values.pop(key, None) is not None:
+                    removed += 1
+                    self.expiries.pop(key, None)
+                    self.writes[key] = self.writes.get(key, 0) + 1
+            return removed
+        return RespError(f"ERR unknown command '{name.decode()}'")
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        server = self.server
+        watched, queued = {}, None
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                self._send(RespError("ERR protocol error"))
+                return
+            name, args = command[0].upper(), command[1:]
+            if name == b"MULTI":
+                queued, reply = [], b"OK"
+            elif name == b"EXEC":
+                if queued is None:
+                    reply = RespError("ERR EXEC without MULTI")
+                else:
+                    with server.lock:
+                        for key in watched:
+                            server._expire(key)
+                        if any(server.writes.get(key, 0) != writes for key, writes in watched.items()):
+                            reply = _ABORTED
+                        else:
+                            reply = [server.run(queued_name, queued_args) for queued_name, queued_args in queued]
+                    watched, queued = {}, None
+            elif name == b"DISCARD":
+                watched, queued, reply = {}, None, b"OK"
+            elif queued is not None:
+                queued.append((name, args))
+                reply = b"QUEUED"
+            elif name == b"WATCH":
+                with server.lock:
+                    for key in args:
+                        server._expire(key)
+                        watched[key] = server.writes.get(key, 0)
+                reply = b"OK"
+            elif name == b"UNWATCH":
+                watched, reply = {}, b"OK"
+            else:
+                with server.lock:
+                    reply = server.run(name, args)
+            self._send(reply)
+
+    def _send(self, reply):
+        self.wfile.write(self._encode(reply))
+        self.wfile.flush()
+
+    def _encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if reply is _ABORTED:
+            return b"*-1\r\n"
+        if isinstance(reply, RespError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+        if reply in (b"OK", b"QUEUED", b"PONG"):
+            return b"+%s\r\n" % reply
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+def start_resp_stand_in(host="127.0.0.1", port=0):
+    """Serves a RespStandIn from a daemon thread, returns the server (port 0 picks a free port, see server.server_address)"""
+    server = RespStandIn((host, port))
+    threading.Thread(target=server.serve_forever, name="resp-stand-in", daemon=True).start()
+    return server
+
+
+def session_backend_from_env():
+    """
+    Backend selected by CHAT_SESSION_BACKEND (default: file when CHAT_CHECKPOINT_DIR is set, memory otherwise).
+
+    file uses CHAT_CHECKPOINT_DIR, sqlite CHAT_SESSION_DB (default sessions.db), and redis CHAT_SESSION_REDIS
+    (host:port, default 127.0.0.1:6379) with CHAT_SESSION_TTL seconds (default 86400, 0 to disable).
+    """
+    kind = os.environ.get("CHAT_SESSION_BACKEND") or ("file" if os.environ.get("CHAT_CHECKPOINT_DIR") else "memory")
+    if kind == "memory":
+        return MemorySessionBackend()
+    if kind == "file":
+        return FileSessionBackend(os.environ.get("CHAT_CHECKPOINT_DIR", "chat_sessions"))
+    if kind == "sqlite":
+        return SQLiteSessionBackend(os.environ.get("CHAT_SESSION_DB", "sessions.db"))
+    if kind == "redis":
+        return RedisSessionBackend.from_url(os.environ.get("CHAT_SESSION_REDIS", "127.0.0.1:6379"),
+                                            ttl=int(os.environ.get("CHAT_SESSION_TTL", 86400)) or None)
+    raise ValueError(f"Unknown CHAT_SESSION_BACKEND {kind}, use memory, file, sqlite or redis")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Redis-protocol stand-in for the session backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespStandIn((args.host, args.port))
+    print(f"Redis-protocol stand-in listening on {args.host}:{args.port}")
+    server.serve_forever()
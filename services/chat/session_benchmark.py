@@ -0,0 +1,120 @@
+"""
+Session read/write overhead per turn for every session backend, and how it scales with workers.
+
+A turn of a stateless worker reads the session's checkpoint and writes the next one back with
+the version it read (session_backends.py). The benchmark times that pair on a checkpoint of
+typical size, then runs 1, 2, 4... worker processes on separate sessions of the same shared
+backend and reports the aggregate turns per second against linear scaling. It also checks that
+two workers writing the same session version get a SessionConflict on the second write.
+
+The Redis backend runs against the in-process stand-in unless --redis points at a server; the
+stand-in serves every command under one lock, so its scaling is not Redis'.
+
+Usage:
+    python -m services.chat.session_benchmark --turns 5000 --workers 1 2 4
+    python -m services.chat.session_benchmark --backends sqlite redis --redis 127.0.0.1:6379
+"""
+from services.chat.session_backends import (FileSessionBackend, MemorySessionBackend, RedisSessionBackend, SessionConflict,
+                                            SQLiteSessionBackend, start_resp_stand_in)
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+# Checkpoint of an order conversation waiting for the verification code (about the replay's mean size)
+CHECKPOINT = (b'[1,"2eee78beff6e0b0a",7,"preprocesing_code",{"order_id":"1042","customer_name":"Ana Perez",'
+              b'"order_status":"processing","order_date":"2025-03-02","total":129.9,"items":[{"sku":"A-1","qty":2}]},'
+              b'"I have sent a verification code to the email of the order, please write it here to confirm the '
+              b'cancellation.",6,"5b1e0c33a9d2"]')
+
+
+def open_backend(kind, location):
+    if kind == "memory":
+        return MemorySessionBackend()
+    if kind == "file":
+        return FileSessionBackend(location)
+    if kind == "sqlite":
+        return SQLiteSessionBackend(location)
+    return RedisSessionBackend.from_url(location)
+
+
+def run_turns(kind, location, worker, turns, sessions):
+    """Seconds taken by `turns` read + conditional write pairs over the worker's sessions"""
+    backend = open_backend(kind, location)
+    session_ids = [f"bench-{worker}-{index}" for index in range(sessions)]
+    started = time.perf_counter()
+    for turn in range(turns):
+        session_id = session_ids[turn % sessions]
+        _, version = backend.get(session_id)
+        backend.put(session_id, CHECKPOINT, version)
+    elapsed = time.perf_counter() - started
+    backend.close()
+    return elapsed
+
+
+def _worker(arguments):
+    return run_turns(*arguments)
+
+
+def check_conflict(kind, location):
+    """Two workers read the same version and both write: the second write must conflict"""
+    first = open_backend(kind, location)
+    # Process memory has a single handle
+    second = first if kind == "memory" else open_backend(kind, location)
+    _, version = first.get("bench-conflict")
+    second.get("bench-conflict")
+    first.put("bench-conflict", CHECKPOINT, version)
+    try:
+        second.put("bench-conflict", CHECKPOINT, version)
+    except SessionConflict:
+        return True
+    finally:
+        first.delete("bench-conflict")
+    return False
+
+
+def scaling(kind, location, workers, turns, sessions):
+    """Aggregate turns per second with `workers` processes, each running `turns` turns"""
+    with multiprocessing.Pool(workers) as pool:
+        started = time.perf_counter()
+        pool.map(_worker, [(kind, location, worker, turns, sessions) for worker in range(workers)])
+        elapsed = time.perf_counter() - started
+    return workers * turns / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure session read/write overhead per turn for every session backend")
+    parser.add_argument("--backends", nargs="*", default=["memory", "file", "sqlite", "redis"],
+                        choices=["memory", "file", "sqlite", "redis"])
+    parser.add_argument("--turns", type=int, default=5000, help="Turns per worker")
+    parser.add_argument("--sessions", type=int, default=200, help="Sessions per worker")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4], help="Worker process counts to compare")
+    parser.add_argument("--redis", help="host:port of a Redis-protocol server (default: an in-process stand-in)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="session-benchmark-")
+    stand_in = None
+    if "redis" in args.backends and not args.redis:
+        stand_in = start_resp_stand_in()
+        args.redis = "%s:%d" % stand_in.server_address
+    locations = {"memory": None, "file": os.path.join(directory, "files"), "sqlite": os.path.join(directory, "sessions.db"),
+                 "redis": args.redis}
+    try:
+        print(f"checkpoint {len(CHECKPOINT)} bytes, {args.turns} turns per worker over {args.sessions} sessions")
+        print(f"{'backend':<10}{'us/turn':>10}{'conflict':>10}" + "".join(f"{f'{n}w turns/s':>16}" for n in args.workers)
+              + f"{'scaling':>10}")
+        for kind in args.backends:
+            location = locations[kind]
+            per_turn = run_turns(kind, location, "single", args.turns, args.sessions) / args.turns * 1e6
+            conflict = "ok" if check_conflict(kind, location) else "MISSED"
+            # Process memory isn't shared: more workers means more processes, not more replicas of one store
+            rates = [scaling(kind, location, workers, args.turns, args.sessions) for workers in args.workers] if kind != "memory" else []
+            efficiency = f"{rates[-1] / (rates[0] * args.workers[-1] / args.workers[0]):.0%}" if len(rates) > 1 else "n/a"
+            print(f"{kind:<10}{per_turn:>10.1f}{conflict:>10}" + "".join(f"{rate:>16.0f}" for rate in rates)
+                  + "".join(f"{'-':>16}" for _ in args.workers[len(rates):]) + f"{efficiency:>10}")
+    finally:
+        if stand_in is not None:
+            stand_in.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
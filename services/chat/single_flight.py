@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import threading
+import time
+
+### Single-flight ###
+# Concurrent identical requests share one upstream call: the first caller (leader) runs it,
+# callers with the same key arriving while it runs wait and get the same result (or error).
+# With stale_seconds > 0, callers arriving up to that long after the leader finished also reuse
+# its result. Only the leader reports the call as its own (usage, cost). LLM_Nodes share prompts without conversation history (history_independent=True, or the first
+# message of a conversation with coalesce_window set), keyed by the request fingerprint.
+
+
+class _Flight():
+    __slots__ = ("done", "result", "error", "finished")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+
+class SingleFlight():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # key -> finished flight, oldest first, kept while reusable
+        self._recent = OrderedDict()
+        self._recent_window = 0.0
+        self.stats = {"leaders": 0, "joined": 0, "reused": 0}
+
+    def _prune(self, now):
+        while self._recent:
+            key, flight = next(iter(self._recent.items()))
+            if now - flight.finished <= self._recent_window:
+                break
+            del self._recent[key]
+
+    def call(self, key, function, stale_seconds=0.0):
+        """
+        Runs function() once for concurrent callers with the same key.
+
+        Args:
+            key: Identity of the request (e.g. its fingerprint).
+            function: Makes the upstream call.
+            stale_seconds: How long after completion a result may still be reused.
+
+        Returns:
+            (result, leader): the result of the leader's call, and whether this caller made it (False for
+            callers that joined or reused it). The leader's exception is raised in every caller.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            flight = self._recent.get(key)
+            if flight is not None and flight.error is None and now - flight.finished <= stale_seconds:
+                self.stats["reused"] += 1
+                return flight.result, False
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["joined"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+
+        try:
+            flight.result = function()
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                flight.finished = time.monotonic()
+                del self._in_flight[key]
+                if flight.error is None and stale_seconds > 0:
+                    self._recent_window = max(self._recent_window, stale_seconds)
+                    self._recent.pop(key, None)
+                    self._recent[key] = flight
+            flight.done.set()
+        return flight.result, True
+
+
+# Shared by every LLM_Node of the process
+llm_single_flight = SingleFlight()
@@ -0,0 +1,247 @@
+"""
+Soak test of the full chatbot stack with concurrent synthetic customers.
+
+N simulated customers run scripted cancel / track / policy dialogues against
+`Chat_Bot_ToT` and the mock order API (started in-process), using the stub LLM
+backend with emulated latency. The run reports per-turn p50/p95/p99, turns per
+second, node hops per turn and RSS over time, and exits with status 1 when latency
+or memory growth exceed the given thresholds.
+
+Usage:
+    python -m services.chat.soak_test --customers 20 --duration 600 --llm-latency-ms 400 --max-p99-ms 5000 --max-rss-growth-mb 50
+"""
+from services.chat.llm_backends import StubBackend, set_llm_backend
+from services.chat.fusion import FUSED_TOOL_SUFFIX
+from services.chat.history import ChatHistory
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+# Each dialogue is a list of (customer message, node path the stub LLM should follow during the turn).
+# {order_id} and {code} are filled per conversation; the code is read from the mock API "mailbox".
+DIALOGUES = {
+    "cancel": [
+        ("I want to cancel my order", ["Cancell_Order", "orderID_request"]),
+        ("My order id is {order_id}", ["sending_verification_code"]),
+        ("The code is {code}", ["check_cancelation_request"]),
+        ("Yes, cancel it, I found a better price elsewhere", ["finilizing_cancelation"]),
+    ],
+    "track": [
+        ("Where is my order {order_id}?", ["Track_Order", "status_check", "status_explanation"]),
+        ("No thanks, that is all", ["tracking_finilizing"]),
+    ],
+    "policy": [
+        ("What is your return policy?", ["policies_questions", "just_chatting"]),
+        ("Thanks, and can I pay with a credit card?", ["policies_questions", "just_chatting"]),
+    ],
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is not available)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # Unix only
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class ScriptedToolSelector():
+    """Stub LLM tool selector following, per customer thread, the node path expected by the script"""
+    def __init__(self):
+        self._local = threading.local()
+
+    def expect(self, path):
+        self._local.path = list(path)
+
+    def __call__(self, messages, tools):
+        names = [tool["function"]["name"] for tool in tools]
+        path = getattr(self._local, "path", [])
+        while path:
+            name = path.pop(0)
+            if name + FUSED_TOOL_SUFFIX in names:
+                return name + FUSED_TOOL_SUFFIX  # fusion on: the routing call answers for the node
+            if name in names:
+                return name
+        return None  # off script: let the stub pick by itself
+
+
+class SoakTest():
+    def __init__(self, chat_bot, selector:ScriptedToolSelector, mailbox:dict, customers=10, duration=60,
+                 think_time=0.0, order_ids=range(1000, 5000)):
+        self.chat_bot = chat_bot
+        self.selector = selector
+        self.mailbox = mailbox
+        self.customers = customers
+        self.duration = duration
+        self.think_time = think_time
+        self.order_ids = order_ids
+        self.turn_latencies = []
+        self.turn_hops = []
+        self.turn_errors = 0
+        self.dialogues_done = {name: 0 for name in DIALOGUES}
+        self.rss_samples = []
+        self._lock = threading.Lock()
+        self._hops = threading.local()
+        self._stop = threading.Event()
+        chat_bot.hop_listeners.append(self._count_hop)
+
+    def _count_hop(self, node_name, elapsed, error):
+        self._hops.count = getattr(self._hops, "count", 0) + 1
+
+    def _turn(self, message, path, resume_node, history, sys_data):
+        self.selector.expect(path)
+        self._hops.count = 0
+        started = time.perf_counter()
+        try:
+            resume_node, reply = self.chat_bot.run_from(message=message, history=history, image=None,
+                                                         from_node_name=resume_node, sys_data=sys_data)
+            failed = resume_node is None
+        except Exception:
+            resume_node, reply, failed = None, "", True
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.turn_latencies.append(elapsed)
+            self.turn_hops.append(self._hops.count)
+            self.turn_errors += failed
+        history.add_turn(message, str(reply))
+        return resume_node
+
+    def _customer(self, seed):
+        rng = random.Random(seed)
+        while not self._stop.is_set():
+            name = rng.choice(list(DIALOGUES))
+            order_id = rng.choice(self.order_ids)
+            # Every dialogue is a new conversation
+            resume_node, history, sys_data = None, ChatHistory(), {}
+            for message, path in DIALOGUES[name]:
+                if self._stop.is_set():
+                    return
+                message = message.format(order_id=order_id, code=self.mailbox.get(order_id, "000000"))
+                resume_node = self._turn(message, path, resume_node, history, sys_data)
+                if resume_node is None:
+                    break
+                if self.think_time:
+                    time.sleep(rng.uniform(0, 2 * self.think_time))
+            with self._lock:
+                self.dialogues_done[name] += 1
+
+    def _sample_rss(self, interval):
+        started = time.perf_counter()
+        while not self._stop.wait(interval):
+            self.rss_samples.append((time.perf_counter() - started, current_rss_mb()))
+
+    def run(self, sample_seconds=5.0):
+        self.rss_samples.append((0.0, current_rss_mb()))
+        threads = [threading.Thread(target=self._customer, args=(seed,), daemon=True) for seed in range(self.customers)]
+        sampler = threading.Thread(target=self._sample_rss, args=(sample_seconds,), daemon=True)
+        started = time.perf_counter()
+        for thread in threads + [sampler]:
+            thread.start()
+        time.sleep(self.duration)
+        self._stop.set()
+        for thread in threads + [sampler]:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        self.rss_samples.append((elapsed, current_rss_mb()))
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        latencies = sorted(self.turn_latencies)
+        hops = self.turn_hops
+        return {
+            "turns": len(latencies),
+            "turn_errors": self.turn_errors,
+            "turns_per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "hops_per_turn": sum(hops) / len(hops) if hops else 0.0,
+            "max_hops_per_turn": max(hops, default=0),
+            "dialogues": dict(self.dialogues_done),
+            "rss_mb": list(self.rss_samples),
+            # Growth after the first sample, so one-off warm-up allocations don't count
+            "rss_growth_mb": self.rss_samples[-1][1] - self.rss_samples[min(1, len(self.rss_samples) - 1)][1],
+        }
+
+
+def start_mock_api(port=8000):
+    """Runs the mock order API in a background thread and records every issued 2-step code"""
+    import uvicorn
+    from services.mock_API import endpoints
+
+    mailbox = {}
+    issue = endpoints.verification_codes.issue
+    def issue_and_deliver(order_id):
+        mailbox[order_id] = issue(order_id)
+        return mailbox[order_id]
+    endpoints.verification_codes.issue = issue_and_deliver
+
+    server = uvicorn.Server(uvicorn.Config(endpoints.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return mailbox
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent synthetic-customer soak test of the chatbot")
+    parser.add_argument("--customers", type=int, default=10, help="Concurrent simulated customers")
+    parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean customer pause between turns, in seconds")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Mean stub LLM latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=100, help="Stub LLM latency jitter (uniform)")
+    parser.add_argument("--sample-seconds", type=float, default=5, help="RSS sampling interval")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="Fail if the per-turn p99 exceeds this")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=None, help="Fail if RSS grows more than this")
+    parser.add_argument("--external-api", action="store_true",
+                        help="Use an already running mock API (cancel dialogues then fail verification)")
+    args = parser.parse_args()
+
+    selector = ScriptedToolSelector()
+    set_llm_backend(StubBackend(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, tool_selector=selector))
+    mailbox = {} if args.external_api else start_mock_api()
+
+    # Imported after the backend is set: the graph builds its retrievers at import time
+    from services.chat.policies_chat import Chat_Bot_ToT
+
+    soak = SoakTest(Chat_Bot_ToT, selector, mailbox, customers=args.customers, duration=args.duration,
+                    think_time=args.think_time)
+    # The engine prints every hop; keep the report readable. The lines are discarded, not buffered: a buffer
+    # would grow with every hop and show up in the RSS growth gate
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull) if os.environ.get("SOAK_VERBOSE") != "1" else contextlib.nullcontext():
+        report = soak.run(sample_seconds=args.sample_seconds)
+
+    print(f"turns: {report['turns']} ({report['turn_errors']} failed), {report['turns_per_second']:.2f} turns/s")
+    print(f"turn latency ms: p50 {report['p50_ms']:.0f}  p95 {report['p95_ms']:.0f}  p99 {report['p99_ms']:.0f}")
+    print(f"node hops per turn: mean {report['hops_per_turn']:.2f}, max {report['max_hops_per_turn']}")
+    print(f"dialogues completed: {report['dialogues']}")
+    print("RSS over time: " + ", ".join(f"{t:.0f}s={rss:.0f}MB" for t, rss in report["rss_mb"]))
+    print(f"RSS growth: {report['rss_growth_mb']:.1f} MB")
+
+    failures = []
+    if args.max_p99_ms is not None and report["p99_ms"] > args.max_p99_ms:
+        failures.append(f"p99 {report['p99_ms']:.0f} ms > {args.max_p99_ms:.0f} ms")
+    if args.max_rss_growth_mb is not None and report["rss_growth_mb"] > args.max_rss_growth_mb:
+        failures.append(f"RSS growth {report['rss_growth_mb']:.1f} MB > {args.max_rss_growth_mb:.1f} MB")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("PASSED")
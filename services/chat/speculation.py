@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from services.chat.instrumentation import span
+import os
+import threading
+import time
+
+### Speculative retrieval ###
+# A routing node (LLM_Node(speculation=SpeculativeRetrieval())) starts the retrievals of its likely
+# retriever-backed children in a thread pool, querying with the raw user message, while its own
+# completion runs. Once the route is known the losers are cancelled (or their result dropped when
+# already running) and the winner claims its documents instead of retrieving after the completion:
+# the retrieval leaves the critical path. Children are likely when they won at least min_share of the
+# parent's routes (all of them during warmup). Every policy keeps the work wasted on losers next to
+# the latency saved for winners, see ChatToT.speculation_report().
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bet of the current turn on the child chosen by the routing call, claimed by that child
+_winning_bet = ContextVar("winning_retrieval_bet", default=None)
+
+
+def retrieval_pool():
+    """Thread pool shared by the speculative retrievals of the process (SPECULATION_WORKERS threads)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=int(os.environ.get("SPECULATION_WORKERS", 8)),
+                                           thread_name_prefix="speculative-retrieval")
+    return _pool
+
+
+class _Bet():
+    """One speculative retrieval: its future, when it ran, and the policy to report to"""
+    __slots__ = ("policy", "child", "query", "future", "started", "finished")
+
+    def __init__(self, policy, child, query):
+        self.policy = policy
+        self.child = child
+        self.query = query
+        self.started = None
+        self.finished = None
+        self.future = retrieval_pool().submit(self._retrieve)
+
+    def _retrieve(self):
+        self.started = time.perf_counter()
+        try:
+            return self.child.retriver.invoke(self.query)
+        finally:
+            self.finished = time.perf_counter()
+
+    def drop(self):
+        """Loser: cancelled when not started yet, otherwise its work is counted as wasted once done"""
+        if self.future.cancel():
+            self.policy._count("cancelled")
+        else:
+            self.future.add_done_callback(lambda _: self.policy._count("wasted", self.finished - self.started))
+
+
+class Bets():
+    """Retrievals started for one routing call"""
+    def __init__(self, policy, bets):
+        self.policy = policy
+        self.bets = bets
+
+    def settle(self, winner_name):
+        """Keeps the winner's bet for the child to claim and drops the others (all of them for None)"""
+        self.policy._route(winner_name)
+        winner = None
+        for bet in self.bets:
+            if winner is None and bet.child.corpus["function"]["name"] == winner_name:
+                winner = bet
+            else:
+                bet.drop()
+        _winning_bet.set(winner)
+
+
+def claim(node_name, user_message):
+    """
+    Documents retrieved ahead for the node, None when there are none (or they can't be used).
+
+    The speculative query is the raw user message: they are used when the node received it unchanged.
+    """
+    bet = _winning_bet.get()
+    if bet is None or bet.child.corpus["function"]["name"] != node_name:
+        return None
+    _winning_bet.set(None)
+    if user_message != bet.query:
+        bet.drop()
+        bet.policy._count("mismatched")
+        return None
+    waited = time.perf_counter()
+    with span("retrieval", node_name, speculative=True):
+        try:
+            retrieved_docs = bet.future.result()
+        except Exception:
+            bet.policy._count("failed")
+            return None
+    waited = time.perf_counter() - waited
+    bet.policy._count("used", saved=(bet.finished - bet.started) - waited)
+    return retrieved_docs
+
+
+class SpeculativeRetrieval():
+    def __init__(self, max_children=3, min_share=0.1, warmup=20):
+        """
+        Args:
+            max_children: Retrievals started per routing call at most, the most frequent routes first.
+            min_share: Share of the parent's routes a child must win to be speculated on.
+            warmup: Routes observed before min_share applies (every retriever-backed child until then).
+        """
+        self.max_children = max_children
+        self.min_share = min_share
+        self.warmup = warmup
+        self.routes = {}
+        self._lock = threading.Lock()
+        self.stats = self.new_stats()
+
+    @staticmethod
+    def new_stats():
+        return {"started": 0, "used": 0, "cancelled": 0, "wasted": 0, "mismatched": 0, "failed": 0,
+                "wasted_seconds": 0.0, "saved_seconds": 0.0}
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = self.new_stats()
+
+    def _count(self, outcome, seconds=0.0, saved=0.0):
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats["wasted_seconds"] += seconds
+            self.stats["saved_seconds"] += max(0.0, saved)
+
+    def _route(self, winner_name):
+        with self._lock:
+            if winner_name:
+                self.routes[winner_name] = self.routes.get(winner_name, 0) + 1
+
+    def likely(self, children):
+        """Children worth a speculative retrieval, the most frequent routes first"""
+        with self._lock:
+            total = sum(self.routes.values())
+            routes = dict(self.routes)
+        if total >= self.warmup:
+            children = [child for child in children if routes.get(child.corpus["function"]["name"], 0) >= self.min_share * total]
+        children = sorted(children, key=lambda child: -routes.get(child.corpus["function"]["name"], 0))
+        return children[:self.max_children]
+
+    def place(self, children, user_message):
+        """Starts the retrievals of the likely children, queried with the raw user message"""
+        bets = [_Bet(self, child, user_message) for child in self.likely(children)] if isinstance(user_message, str) else []
+        with self._lock:
+            self.stats["started"] += len(bets)
+        return Bets(self, bets)
@@ -0,0 +1,200 @@
+import copy
+import json
+import re
+
+### Tool-call arguments ###
+# The arguments an LLM_Node sends to a child are checked at the edge, against a validator compiled
+# once per child from its corpus parameters. Common defects are repaired locally instead of costing
+# a node retry: JSON wrapped in code fences or with trailing commas, numbers and booleans sent as
+# strings (or the other way round), enum values in the wrong case, unknown keys, and required
+# arguments the model dropped but the node received itself (e.g. user_message or order_id).
+
+
+class ToolCallError(ValueError):
+    """The completion has no usable call to a child node"""
+    pass
+
+
+class ArgumentError(ToolCallError):
+    def __init__(self, tool_name, issues):
+        super().__init__(f"Invalid arguments for {tool_name}: {'; '.join(issues)}")
+        self.tool_name = tool_name
+        self.issues = issues
+
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_INTEGER_TEXT = re.compile(r"^\s*[+-]?\d[\d\s,_]*$")
+_NUMBER_TEXT = re.compile(r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$")
+_BOOLEAN_TEXT = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+
+
+def parse_arguments(text):
+    """
+    Decodes tool-call arguments.
+
+    Returns:
+        (arguments, repairs): the decoded object and the syntax repairs applied to get it.
+    """
+    try:
+        return json.loads(text), []
+    except (TypeError, json.JSONDecodeError):
+        if not isinstance(text, str):
+            raise ToolCallError(f"Tool-call arguments are not text: {type(text).__name__}")
+    repaired = _TRAILING_COMMA.sub(r"\1", _CODE_FENCE.sub("", text))
+    try:
+        return json.loads(repaired), ["json_syntax"]
+    except json.JSONDecodeError as error:
+        raise ToolCallError(f"Tool-call arguments are not valid JSON: {error}")
+
+
+### Type checks, each returns (value, repair name or None) or raises ValueError ###
+def _check_string(value):
+    if isinstance(value, str):
+        return value, None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value), "string_from_number"
+    raise ValueError(f"expected a string, got {type(value).__name__}")
+
+def _check_integer(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value, None
+    if isinstance(value, float) and value.is_integer():
+        return int(value), "integer_from_float"
+    if isinstance(value, str) and _INTEGER_TEXT.match(value):
+        return int(re.sub(r"[\s,_]", "", value)), "integer_from_string"
+    raise ValueError(f"expected an integer, got {value!r}")
+
+def _check_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value, None
+    if isinstance(value, str) and _NUMBER_TEXT.match(value):
+        return float(value), "number_from_string"
+    raise ValueError(f"expected a number, got {value!r}")
+
+def _check_boolean(value):
+    if isinstance(value, bool):
+        return value, None
+    if isinstance(value, (str, int)) and str(value).strip().lower() in _BOOLEAN_TEXT:
+        return _BOOLEAN_TEXT[str(value).strip().lower()], "boolean_from_text"
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+_TYPE_CHECKS = {"string": _check_string, "integer": _check_integer, "number": _check_number, "boolean": _check_boolean}
+
+
+def _compile_property(schema):
+    type_check = _TYPE_CHECKS.get(schema.get("type"))
+    enum = schema.get("enum")
+    enum_by_lower = {str(option).lower(): option for option in enum} if enum else None
+
+    def check(value):
+        repair = None
+        if type_check is not None:
+            value, repair = type_check(value)
+        if enum is not None and value not in enum:
+            if str(value).lower() not in enum_by_lower:
+                raise ValueError(f"expected one of {enum}, got {value!r}")
+            value, repair = enum_by_lower[str(value).lower()], "enum_case"
+        return value, repair
+    return check
+
+
+def required_parameters(parameters):
+    """Required argument names: the declared list, all parameters when it is empty, none for ["None"]"""
+    required = parameters.get("required") or list(parameters["properties"])
+    return [] if required == ["None"] else list(required)
+
+
+class ArgumentValidator():
+    """Checks and repairs the arguments of one tool, compiled once from its parameters schema"""
+    def __init__(self, tool_name, parameters):
+        self.tool_name = tool_name
+        self.checks = {name: _compile_property(schema) for name, schema in parameters["properties"].items()}
+        self.required = required_parameters(parameters)
+
+    def validate(self, arguments, context=None):
+        """
+        Args:
+            arguments: Decoded tool-call arguments.
+            context: Arguments the calling node received, used to restore dropped required ones.
+
+        Returns:
+            (arguments, repairs): the valid arguments and the names of the repairs applied.
+
+        Raises:
+            ArgumentError: when some argument is missing or can't be repaired.
+        """
+        if not isinstance(arguments, dict):
+            raise ArgumentError(self.tool_name, [f"arguments must be an object, got {type(arguments).__name__}"])
+        valid, repairs, issues = {}, [], []
+        for name, value in arguments.items():
+            check = self.checks.get(name)
+            if check is None:
+                repairs.append("dropped_unknown")
+                continue
+            if value is None:
+                continue  # handled as missing
+            try:
+                valid[name], repair = check(value)
+            except ValueError as error:
+                issues.append(f"{name}: {error}")
+                continue
+            if repair:
+                repairs.append(repair)
+        for name in self.required:
+            if name in valid or any(issue.startswith(f"{name}:") for issue in issues):
+                continue
+            if context and context.get(name) is not None:
+                try:
+                    valid[name], _ = self.checks[name](context[name])
+                    repairs.append("restored_from_input")
+                    continue
+                except ValueError:
+                    pass
+            issues.append(f"{name}: missing")
+        if issues:
+            raise ArgumentError(self.tool_name, issues)
+        return valid, repairs
+
+
+# Schema keywords accepted in strict mode; others (default, minimum, pattern, format...) get the request
+# rejected. They are dropped from what the LLM receives, the validators still check them locally
+STRICT_SCHEMA_KEYWORDS = {"type", "description", "enum", "const", "properties", "required", "additionalProperties",
+                          "items", "anyOf", "$ref", "$defs"}
+
+
+def _strict_schema(schema):
+    """Copy of a property schema restricted to STRICT_SCHEMA_KEYWORDS, a default is kept in the description"""
+    strict = {key: value for key, value in schema.items() if key in STRICT_SCHEMA_KEYWORDS}
+    if "default" in schema:
+        strict["description"] = f"{schema.get('description', '')} (default: {schema['default']})".strip()
+    if isinstance(strict.get("properties"), dict):
+        strict["properties"] = {name: _strict_schema(value) for name, value in strict["properties"].items()}
+    if isinstance(strict.get("items"), dict):
+        strict["items"] = _strict_schema(strict["items"])
+    if isinstance(strict.get("anyOf"), list):
+        strict["anyOf"] = [_strict_schema(value) for value in strict["anyOf"]]
+    return strict
+
+
+def strict_tool(tool):
+    """
+    Copy of a tool definition for strict structured outputs: every property is listed as required,
+    the optional ones also accept null, and keywords strict mode doesn't accept are dropped.
+    """
+    tool = copy.deepcopy(tool)
+    function = tool["function"]
+    parameters = function["parameters"]
+    required = set(required_parameters(parameters))
+    parameters["properties"] = {name: _strict_schema(schema) for name, schema in parameters["properties"].items()}
+    for name, schema in parameters["properties"].items():
+        if name not in required and isinstance(schema.get("type"), str):
+            schema["type"] = [schema["type"], "null"]
+    parameters["required"] = list(parameters["properties"])
+    parameters["additionalProperties"] = False
+    function["strict"] = True
+    return tool
+
+
+def new_argument_stats():
+    return {"tool_calls": 0, "valid": 0, "repaired": 0, "rejected": 0, "repairs": {}}
@@ -0,0 +1,296 @@
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import atexit
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+### Tracing ###
+# LLM hops are reported as observations to an exporter (Langfuse, a local JSON-lines file, or none).
+# Sampling is decided once per turn from the session id (head-based), so a session is traced
+# completely or not at all. Observations go through a bounded queue drained by a background
+# thread: when the queue is full they are dropped and counted, the turn never waits for export.
+#
+# Configuration:
+#   TRACING_BACKEND      none | file | langfuse (default: langfuse when LANGFUSE_PUBLIC_KEY and
+#                        LANGFUSE_SECRET_KEY are set, none otherwise)
+#   TRACING_FILE         output of the file backend (default traces.jsonl)
+#   TRACING_SAMPLE_RATE  fraction of sessions traced, 0-1 (default 1)
+#   TRACING_QUEUE_SIZE   observations waiting for export before new ones are dropped (default 1000)
+
+
+def head_sampled(session_id, sample_rate, rng=random):
+    """Sampling decision stable for a session id (and across processes), random per call without one"""
+    if sample_rate >= 1:
+        return True
+    if sample_rate <= 0:
+        return False
+    if session_id is None:
+        return rng.random() < sample_rate
+    digest = hashlib.blake2b(str(session_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest) / 2**64 < sample_rate
+
+
+### Exporters ###
+class TraceExporter(ABC):
+    @abstractmethod
+    def export(self, observations:list):
+        """Sends a batch of observations, called from the export thread only"""
+        pass
+
+    def flush(self):
+        pass
+
+
+class FileExporter(TraceExporter):
+    """Appends observations as JSON lines, for offline use"""
+    def __init__(self, path="traces.jsonl"):
+        self.path = path
+
+    def export(self, observations):
+        with open(self.path, "a") as file:
+            for observation in observations:
+                file.write(json.dumps(observation, default=str, ensure_ascii=False) + "\n")
+
+
+class LangfuseExporter(TraceExporter):
+    """One Langfuse trace with a generation per observation. The client is created on first export"""
+    def __init__(self, **client_kwargs):
+        self.client_kwargs = client_kwargs
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from langfuse import Langfuse  # optional dependency
+            self._client = Langfuse(**self.client_kwargs)
+        return self._client
+
+    def export(self, observations):
+        for observation in observations:
+            trace = self.client.trace(id=observation["trace_id"], name=observation["name"],
+                                      session_id=observation["session_id"], tags=observation["tags"],
+                                      metadata=observation["metadata"], input=observation["input"],
+                                      output=observation["output"])
+            trace.generation(name=observation["name"], model=observation["model"],
+                             start_time=datetime.fromtimestamp(observation["start_time"], timezone.utc),
+                             end_time=datetime.fromtimestamp(observation["end_time"], timezone.utc),
+                             input=observation["input"], output=observation["output"],
+                             level="ERROR" if observation["error"] else "DEFAULT",
+                             status_message=observation["error"])
+
+    def flush(self):
+        if self._client is not None:
+            self._client.flush()
+
+
+### Observations ###
+class Observation():
+    """One LLM hop, filled by the node while it runs and queued for export when it ends"""
+    __slots__ = ("tracer", "record")
+
+    def __init__(self, tracer, record):
+        self.tracer = tracer
+        self.record = record
+
+    def set_output(self, output):
+        self.record["output"] = output
+
+    def __enter__(self):
+        self.record["start_time"] = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["end_time"] = time.time()
+        if exc is not None:
+            self.record["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.enqueue(self.record)
+        return False
+
+
+class _NoopObservation():
+    __slots__ = ()
+
+    def set_output(self, output):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_OBSERVATION = _NoopObservation()
+
+# (session_id, sampled) of the turn running in this context
+_turn = ContextVar("tracing_turn", default=(None, False))
+
+
+class _Turn():
+    __slots__ = ("value", "token")
+
+    def __init__(self, value):
+        self.value = value
+
+    def __enter__(self):
+        self.token = _turn.set(self.value)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _turn.reset(self.token)
+        return False
+
+
+class _NoopTurn():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_TURN = _NoopTurn()
+
+
+class Tracer():
+    def __init__(self, exporter:TraceExporter=None, sample_rate=1.0, queue_size=1000, batch_size=50,
+                 flush_interval=1.0, seed=None):
+        """
+        Args:
+            exporter: Where observations go, None for a no-op tracer.
+            sample_rate: Fraction of sessions (or turns without session id) traced.
+            queue_size: Observations waiting for export before new ones are dropped.
+            batch_size: Observations handed to the exporter at once.
+            flush_interval: Seconds the export thread waits to fill a batch.
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._random = random.Random(seed)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.stats = {"sampled_turns": 0, "unsampled_turns": 0, "queued": 0, "dropped": 0,
+                      "exported": 0, "export_errors": 0}
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def turn(self, session_id=None):
+        """Context manager taking the sampling decision for the turn run inside it"""
+        if self.exporter is None:
+            return _NOOP_TURN
+        sampled = head_sampled(session_id, self.sample_rate, self._random)
+        self.stats["sampled_turns" if sampled else "unsampled_turns"] += 1
+        return _Turn((session_id, sampled))
+
+    def observe(self, name, model=None, tags=(), metadata=None, input=None):
+        """Context manager recording an LLM hop of a sampled turn, a shared no-op otherwise"""
+        session_id, sampled = _turn.get()
+        if not sampled:
+            return _NOOP_OBSERVATION
+        return Observation(self, {"trace_id": uuid.uuid4().hex, "session_id": session_id, "name": name,
+                                  "model": model, "tags": list(tags), "metadata": metadata,
+                                  "input": input, "output": None, "error": None})
+
+    def enqueue(self, record):
+        """Never blocks: the observation is dropped when the export queue is full"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return
+        self.stats["queued"] += 1
+        if self._worker is None:
+            self._start_worker()
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+                self._worker.start()
+                atexit.register(self.close)
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._export(batch)
+                    return
+                batch.append(record)
+            self._export(batch)
+
+    def _export(self, batch):
+        try:
+            self.exporter.export(batch)
+            self.stats["exported"] += len(batch)
+        except Exception:
+            # A failing exporter must not take the chatbot down
+            self.stats["export_errors"] += 1
+
+    def close(self, timeout=2.0):
+        """Exports what is queued, waiting at most timeout seconds"""
+        worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        worker.join(timeout)
+        try:
+            self.exporter.flush()
+        except Exception:
+            self.stats["export_errors"] += 1
+
+
+def tracer_from_env() -> Tracer:
+    backend = os.environ.get("TRACING_BACKEND")
+    if backend is None:
+        has_keys = os.environ.get("LANGFUSE_PUBLIC_KEY") and os.environ.get("LANGFUSE_SECRET_KEY")
+        backend = "langfuse" if has_keys else "none"
+    if backend == "none":
+        exporter = None
+    elif backend == "file":
+        exporter = FileExporter(os.environ.get("TRACING_FILE", "traces.jsonl"))
+    elif backend == "langfuse":
+        exporter = LangfuseExporter()
+    else:
+        # Tracing must not take the chatbot down: misconfigured means disabled
+        print(f"Unknown TRACING_BACKEND '{backend}', expected none, file or langfuse. Tracing disabled")
+        exporter = None
+    return Tracer(exporter, sample_rate=float(os.environ.get("TRACING_SAMPLE_RATE", 1.0)),
+                  queue_size=int(os.environ.get("TRACING_QUEUE_SIZE", 1000)))
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = tracer_from_env()
+    return _tracer
+
+def set_tracer(tracer:Tracer):
+    global _tracer
+    _tracer = tracer
@@ -0,0 +1,328 @@
+"""
+Transcript replay harness with a per-node latency profile and a regression gate.
+
+Recorded conversations (user messages plus the node path each turn is expected to
+take, see transcripts.json) are replayed through `ChatToT.run_from` against the mock
+order API started in-process. Every node call is split into LLM, retrieval and backend
+(order API) time plus the node's own code; whatever a turn spends outside node calls is
+engine overhead. The profile can be saved as a baseline and later runs diffed against
+it, failing when a node gets slower or a turn stops following its expected path.
+
+By default the LLM is the stub backend steered along the expected paths, so the profile
+isolates the cost of chat_ToT.py, node_utils.py and the RAG retrievers. Use --llm env to
+replay with the backend selected by LLM_BACKEND (e.g. a recorded cassette), and --models
+to compare model tiers: the report gives routing accuracy and cost per node and model.
+--fusion compare replays the transcripts without, then with node fusion (fusion.py) and
+prints routing accuracy, turn latency, LLM calls and cost side by side. --stateless keeps
+no conversation state in the harness: every turn only sends a session id, and the node to
+resume at and the order context come from the session's checkpoint (checkpoint.py).
+
+Usage:
+    python -m services.chat.transcript_replay --repeat 5 --save-baseline replay_baseline.json
+    python -m services.chat.transcript_replay --repeat 5 --baseline replay_baseline.json --tolerance 0.25
+"""
+from services.chat.instrumentation import SpanRecorder, recording
+from services.chat.llm_backends import StubBackend, backend_from_env, set_llm_backend
+from services.chat.model_policy import ModelPolicy, format_model_report
+from services.chat.soak_test import ScriptedToolSelector, percentile, start_mock_api
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+PROFILE_VERSION = 1
+# Time inside a node call is split in these span categories, the rest is the node's own code
+NODE_PHASES = ("llm", "retrieval", "backend")
+METRICS = ("total_ms", "llm_ms", "retrieval_ms", "backend_ms", "code_ms")
+
+
+class NodeProfiler(SpanRecorder):
+    """Collects per node call the time spent in each phase, and per turn the time outside node calls"""
+    def __init__(self):
+        self.node_samples = {}
+        self.turn_samples = []
+        self._phases = None
+        self._thread = None
+        self._turn_node_seconds = 0.0
+
+    def enter(self, span):
+        if span.category == "node":
+            self._phases = dict.fromkeys(NODE_PHASES, 0.0)
+            self._phases["llm_calls"] = 0
+            self._thread = threading.get_ident()
+
+    def exit(self, span, end, error=None):
+        elapsed = end - span.start
+        if span.category == "node":
+            phases, self._phases = self._phases, None
+            self._turn_node_seconds += elapsed
+            self.node_samples.setdefault(span.name, []).append((elapsed, phases, error is not None))
+        elif self._phases is not None and span.category in NODE_PHASES and threading.get_ident() == self._thread:
+            # Fan-out branches run in other threads: their wait is the fan-out node's own time
+            self._phases[span.category] += elapsed
+            self._phases["llm_calls"] += span.category == "llm"
+
+    def start_turn(self):
+        self._turn_node_seconds = 0.0
+
+    def end_turn(self, turn_seconds):
+        self.turn_samples.append((turn_seconds, turn_seconds - self._turn_node_seconds))
+
+    def summary(self):
+        """Median milliseconds per node call and per turn"""
+        nodes = {}
+        for name, samples in sorted(self.node_samples.items()):
+            columns = {metric: [] for metric in METRICS}
+            for elapsed, phases, _ in samples:
+                columns["total_ms"].append(elapsed * 1000)
+                for phase in NODE_PHASES:
+                    columns[f"{phase}_ms"].append(phases[phase] * 1000)
+                columns["code_ms"].append((elapsed - sum(phases[phase] for phase in NODE_PHASES)) * 1000)
+            nodes[name] = {"calls": len(samples),
+                           "errors": sum(failed for _, _, failed in samples),
+                           "llm_calls": sum(phases["llm_calls"] for _, phases, _ in samples),
+                           **{metric: statistics.median(values) for metric, values in columns.items()}}
+        turn_ms = sorted(turn * 1000 for turn, _ in self.turn_samples)
+        engine_ms = [engine * 1000 for _, engine in self.turn_samples]
+        return {"turns": len(turn_ms),
+                "turn": {"total_ms": statistics.median(turn_ms) if turn_ms else 0.0,
+                         "p95_ms": percentile(turn_ms, 0.95),
+                         "engine_ms": statistics.median(engine_ms) if engine_ms else 0.0},
+                "nodes": nodes}
+
+
+def load_transcripts(path):
+    with open(path) as file:
+        return json.load(file)["conversations"]
+
+
+class TranscriptReplay():
+    def __init__(self, chat_bot, conversations, mailbox:dict, selector:ScriptedToolSelector=None, stateless=False):
+        self.chat_bot = chat_bot
+        self.stateless = stateless
+        self._sessions = 0
+        self.conversations = conversations
+        self.mailbox = mailbox
+        self.selector = selector
+        self.path_mismatches = []
+        self._path = []
+        chat_bot.hop_listeners.append(self._record_hop)
+
+    def _record_hop(self, node_name, elapsed, error):
+        if error is None:
+            self._path.append(node_name)
+
+    def replay_conversation(self, conversation, profiler:NodeProfiler=None):
+        resume_node, history, sys_data = None, [], {}
+        order_id = conversation.get("order_id")
+        self._sessions += 1
+        session_id = f"{conversation['name']}-{self._sessions}"
+        for index, turn in enumerate(conversation["turns"]):
+            message = turn["user"].format(order_id=order_id, code=self.mailbox.get(order_id, "000000"))
+            expected = turn.get("expected_path")
+            if self.selector is not None:
+                self.selector.expect(expected or [])
+            self._path = []
+            if profiler:
+                profiler.start_turn()
+            started = time.perf_counter()
+            if self.stateless:
+                resume_node, reply = self.chat_bot.run_from(message=message, history=history, image=None, session_id=session_id)
+            else:
+                resume_node, reply = self.chat_bot.run_from(message=message, history=history, image=None,
+                                                             from_node_name=resume_node, sys_data=sys_data)
+            if profiler:
+                profiler.end_turn(time.perf_counter() - started)
+            if expected is not None and self._path != expected:
+                self.path_mismatches.append({"conversation": conversation["name"], "turn": index,
+                                             "expected": expected, "actual": list(self._path)})
+            history += [{"role": "user", "content": message}, {"role": "assistant", "content": str(reply)}]
+            if resume_node is None:
+                break
+
+    def run(self, repeat=1, warmup=1):
+        """Replays every conversation warmup + repeat times, profiling only the last repeat passes"""
+        for _ in range(warmup):
+            for conversation in self.conversations:
+                self.replay_conversation(conversation)
+        self.path_mismatches = []
+        self.chat_bot.reset_stats()
+        profiler = NodeProfiler()
+        with recording(profiler):
+            for _ in range(repeat):
+                for conversation in self.conversations:
+                    self.replay_conversation(conversation, profiler)
+        profile = profiler.summary()
+        profile["path_mismatches"] = self.path_mismatches
+        profile["routing_accuracy"] = 1 - len(self.path_mismatches) / profile["turns"] if profile["turns"] else 1.0
+        # LLM calls skipped by pre-extractors and per model usage during the profiled passes
+        profile["pre_extraction"] = self.chat_bot.pre_extraction_stats()
+        profile["models"] = self.chat_bot.model_report()
+        profile["tool_arguments"] = self.chat_bot.argument_report()
+        profile["fusion"] = self.chat_bot.fusion_report()
+        profile["speculation"] = self.chat_bot.speculation_report()
+        if self.stateless:
+            profile["checkpoints"] = self.chat_bot.checkpoint_report()
+        return profile
+
+
+def compare_profiles(baseline, current, tolerance=0.25, min_delta_ms=2.0):
+    """
+    Diffs two profiles.
+
+    Args:
+        baseline: Profile saved by an earlier run.
+        current: Profile of this run.
+        tolerance: Relative slowdown allowed per metric.
+        min_delta_ms: Absolute slowdown ignored whatever its relative size (timer noise on tiny values).
+
+    Returns:
+        (rows, regressions): one (scope, metric, baseline, current) row per compared metric,
+        and the descriptions of the regressions found.
+    """
+    rows, regressions = [], []
+
+    def check(scope, metric, before, after):
+        rows.append((scope, metric, before, after))
+        if after - before > min_delta_ms and after > before * (1 + tolerance):
+            regressions.append(f"{scope} {metric}: {before:.2f} -> {after:.2f} ms")
+
+    for metric in ("total_ms", "engine_ms"):
+        check("turn", metric, baseline["turn"][metric], current["turn"][metric])
+    for name, before in baseline["nodes"].items():
+        after = current["nodes"].get(name)
+        if after is None:
+            regressions.append(f"{name}: not visited any more")
+            continue
+        if after["calls"] != before["calls"] or after["llm_calls"] != before["llm_calls"]:
+            regressions.append(f"{name}: {before['calls']} calls / {before['llm_calls']} LLM calls -> "
+                               f"{after['calls']} / {after['llm_calls']}")
+        for metric in METRICS:
+            check(name, metric, before[metric], after[metric])
+    for name in current["nodes"].keys() - baseline["nodes"].keys():
+        regressions.append(f"{name}: visited, but not in the baseline")
+    return rows, regressions
+
+
+def compare_fusion(unfused, fused):
+    """Rows (metric, unfused, fused) comparing replays of the same transcripts without and with node fusion"""
+    def llm_calls(profile):
+        return sum(stats["calls"] for models in profile["models"].values() for stats in models.values())
+
+    def cost(profile):
+        return sum(stats["cost_usd"] for models in profile["models"].values() for stats in models.values())
+
+    return [("routing accuracy", unfused["routing_accuracy"], fused["routing_accuracy"]),
+            ("turn median ms", unfused["turn"]["total_ms"], fused["turn"]["total_ms"]),
+            ("turn p95 ms", unfused["turn"]["p95_ms"], fused["turn"]["p95_ms"]),
+            ("LLM calls", llm_calls(unfused), llm_calls(fused)),
+            ("cost $", cost(unfused), cost(fused))]
+
+
+def print_profile(profile):
+    print(f"{'node':<28}{'calls':>6}{'llm#':>6}" + "".join(f"{metric:>14}" for metric in METRICS))
+    for name, node in profile["nodes"].items():
+        print(f"{name:<28}{node['calls']:>6}{node['llm_calls']:>6}" + "".join(f"{node[metric]:>14.2f}" for metric in METRICS))
+    turn = profile["turn"]
+    for name, stats in profile.get("pre_extraction", {}).items():
+        print(f"pre-extraction {name}: {stats['avoided_llm_calls']} LLM calls avoided, {stats['fallbacks']} fallbacks")
+    print(format_model_report(profile.get("models", {})))
+    for name, stats in profile.get("fusion", {}).items():
+        if stats["fused_answers"] or stats["routed"]:
+            print(f"fusion {name}: {stats['fused_answers']} answered in the routing call, {stats['routed']} routed")
+    for name, stats in profile.get("speculation", {}).items():
+        print(f"speculative retrieval {name}: {stats['started']} started, {stats['used']} used, {stats['cancelled']} cancelled, "
+              f"{stats['wasted']} wasted ({stats['wasted_seconds'] * 1000:.1f} ms), {stats['saved_seconds'] * 1000:.1f} ms saved")
+    if "checkpoints" in profile:
+        stats = profile["checkpoints"]
+        print(f"checkpoints: {stats['saved']} saved ({stats['mean_bytes']:.0f} bytes on average), {stats['resumed']} resumed, "
+              f"{stats['cleared']} cleared, {stats['stale']} stale, {stats['invalid']} invalid, {stats['conflicts']} conflicts, "
+              f"session I/O {stats['io_ms_per_turn']:.3f} ms per turn")
+    for name, stats in profile.get("tool_arguments", {}).items():
+        print(f"tool arguments {name}: {stats['valid']} valid, {stats['repaired']} repaired {stats['repairs']}, {stats['rejected']} rejected")
+    print(f"routing accuracy: {profile['routing_accuracy']:.1%}")
+    print(f"turns: {profile['turns']}, median {turn['total_ms']:.2f} ms (p95 {turn['p95_ms']:.2f} ms), "
+          f"engine overhead {turn['engine_ms']:.2f} ms per turn")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded conversations and profile latency per node")
+    parser.add_argument("--transcripts", default=os.path.join("services", "chat", "transcripts.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="Profiled passes over the transcripts")
+    parser.add_argument("--warmup", type=int, default=1, help="Unprofiled passes run first")
+    parser.add_argument("--llm", choices=["stub", "env"], default="stub",
+                        help="stub: stub LLM steered along the expected paths; env: backend from LLM_BACKEND")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Stub LLM latency")
+    parser.add_argument("--models", nargs="*", default=[], metavar="NODE=MODEL[,MODEL...]",
+                        help="Override node models (cheapest first), e.g. root=gpt-4.1-nano,gpt-4.1")
+    parser.add_argument("--fusion", choices=["off", "on", "compare"],
+                        help="Node fusion (default CHAT_FUSION, see fusion.py); compare replays without, then with it, and gates the fused run")
+    parser.add_argument("--stateless", action="store_true",
+                        help="Resume every turn from its session checkpoint (backend from CHAT_SESSION_BACKEND, process memory by default)")
+    parser.add_argument("--output", help="Write the profile JSON here")
+    parser.add_argument("--save-baseline", help="Write the profile as the new baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown allowed per metric")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Slowdowns below this are ignored")
+    args = parser.parse_args()
+
+    selector = None
+    if args.llm == "stub":
+        selector = ScriptedToolSelector()
+        set_llm_backend(StubBackend(latency_ms=args.llm_latency_ms, tool_selector=selector, seed=0))
+    else:
+        set_llm_backend(backend_from_env())
+    mailbox = start_mock_api()
+
+    # Imported after the backend is set: the graph builds its retrievers at import time
+    from services.chat.policies_chat import Chat_Bot_ToT
+
+    for override in args.models:
+        node_name, _, models = override.partition("=")
+        Chat_Bot_ToT.set_models({node_name: ModelPolicy(models.split(","))})
+
+    if args.stateless and Chat_Bot_ToT.checkpoints is None:
+        Chat_Bot_ToT.use_checkpoints()
+    replay = TranscriptReplay(Chat_Bot_ToT, load_transcripts(args.transcripts), mailbox, selector, stateless=args.stateless)
+    # The engine prints every hop; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()) if os.environ.get("REPLAY_VERBOSE") != "1" else contextlib.nullcontext():
+        unfused = None
+        if args.fusion == "compare":
+            Chat_Bot_ToT.set_fusion(False)
+            unfused = replay.run(repeat=args.repeat, warmup=args.warmup)
+        if args.fusion is not None:
+            Chat_Bot_ToT.set_fusion(args.fusion != "off")
+        profile = replay.run(repeat=args.repeat, warmup=args.warmup)
+    profile = {"version": PROFILE_VERSION, "llm": args.llm, "transcripts": args.transcripts, **profile}
+
+    print_profile(profile)
+    if unfused is not None:
+        print(f"\n{'':<20}{'unfused':>12}{'fused':>12}")
+        for metric, before, after in compare_fusion(unfused, profile):
+            print(f"{metric:<20}{before:>12.4g}{after:>12.4g}")
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(profile, file, indent=2)
+            print(f"profile written to {path}")
+
+    failures = [f"{mismatch['conversation']} turn {mismatch['turn']}: expected {mismatch['expected']}, got {mismatch['actual']}"
+                for mismatch in profile["path_mismatches"]]
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        rows, regressions = compare_profiles(baseline, profile, tolerance=args.tolerance, min_delta_ms=args.min_delta_ms)
+        print(f"\n{'scope':<28}{'metric':<14}{'baseline':>10}{'current':>10}{'change':>9}")
+        for scope, metric, before, after in rows:
+            change = f"{(after / before - 1) * 100:+.0f}%" if before else "n/a"
+            print(f"{scope:<28}{metric:<14}{before:>10.2f}{after:>10.2f}{change:>9}")
+        failures += regressions
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("PASSED")
@@ -1,5 +1,6 @@
 from services.mock_API.data_models import OrderGenericDetailsResponse, OrderCancellationRequest, OrderTrackingResponse
 import random
+import itertools
 from functools import lru_cache
 from typing import Dict, List, Any, Optional
 
@@ -9,6 +10,10 @@ from typing import Dict, List, Any, Optional
 # Global storage for generated data
 _data_storage = {}
 
+# Order versions, bumped on every update so encoded snapshots know when to refresh
+_order_versions = {}
+_version_counter = itertools.count(1)
+
 
 def generate_mock_items(seed: int) -> List[Dict[str, Any]]:
     """
@@ -130,7 +135,7 @@ def update_order_details(order_id: int, updates: Dict[str, Any]) -> bool:
     order = _data_storage[cache_key]
     
     # Process allowed fields to update
-    for key, value in updates.items:
+    for key, value in updates.items():
         if hasattr(order, key):
             setattr(order, key, value)
             
@@ -138,9 +143,23 @@ def update_order_details(order_id: int, updates: Dict[str, Any]) -> bool:
             if key == "items":
                 order.total_amount = sum(item["quantity"] * item["price"] for item in order.items)
     
+    _order_versions[order_id] = next(_version_counter)
     return True
 
 
+def get_order_version(order_id: int) -> int:
+    """
+    Returns the version of an order, which changes on every update_order_details call.
+    
+    Args:
+        order_id: The ID of the order
+        
+    Returns:
+        The order version (0 if the order was never updated)
+    """
+    return _order_versions.get(order_id, 0)
+
+
 def clear_mock_data_cache() -> None:
     """
     Clears all cached mock data.
@@ -1,5 +1,5 @@
-from typing import Optional, Dict
-from pydantic import BaseModel
+from typing import Optional, Dict, Literal
+from pydantic import BaseModel, Field
 
 # --- Data Models ---
 class OrderGenericDetailsResponse(BaseModel):
@@ -34,3 +34,15 @@ class CodeVerifierResponse(BaseModel):
     """Response model for 2-step code verification endpoint."""
     order_id: int
     verified: bool
+    attempts_left: Optional[int] = None  # None when no code is pending for the order
+
+
+class FaultProfile(BaseModel):
+    """Latency and failure behaviour injected on one endpoint of the mock API."""
+    latency_distribution: Literal["none", "fixed", "uniform", "normal", "lognormal", "exponential"] = "none"
+    latency_ms: float = 0.0  # fixed value, mean or median depending on the distribution
+    latency_jitter_ms: float = 0.0  # uniform half-width, normal/lognormal spread
+    error_rate: float = Field(0.0, ge=0.0, le=1.0)  # probability of answering with error_status
+    error_status: int = 500
+    timeout_rate: float = Field(0.0, ge=0.0, le=1.0)  # probability of hanging timeout_seconds and answering 504
+    timeout_seconds: float = 30.0
@@ -1,6 +1,15 @@
-from fastapi import FastAPI, HTTPException, Query, Body
-from services.mock_API.data_models import OrderGenericDetailsResponse, OrderCancellationRequest, OrderTrackingResponse, CodeVerifierResponse
-from services.mock_API.data_mocking import generate_order_details, update_order_details
+from fastapi import FastAPI, HTTPException, Query, Body, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, Optional
+from services.mock_API.data_models import OrderGenericDetailsResponse, OrderCancellationRequest, OrderTrackingResponse, CodeVerifierResponse, FaultProfile
+from services.mock_API.fault_injection import FaultInjectionMiddleware, FaultInjector
+from services.mock_API.data_mocking import generate_order_details, update_order_details, get_order_version
+from services.mock_API.fast_responses import EncodedSnapshot, FastPathMiddleware, SnapshotCache
+from services.mock_API.verification_codes import VerificationCodeStore
+from services.mock_API.tracking_events import TrackingEventHub
+import asyncio
+import json
+import os
 import random
 import time
 
@@ -10,25 +19,97 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Latency / error / timeout injection, configured by MOCK_API_FAULTS or the /admin/faults endpoints
+fault_injector = FaultInjector.from_settings()
+
+# Pending 2-step codes. The mock "email" is the API console; set MOCK_API_RETURN_CODES=1
+# to also return the code in the response (load tests, scripted clients).
+verification_codes = VerificationCodeStore(ttl_seconds=float(os.environ.get("MOCK_2STEP_TTL_SECONDS", 300)),
+                                           max_attempts=int(os.environ.get("MOCK_2STEP_MAX_ATTEMPTS", 3)))
+RETURN_CODES = os.environ.get("MOCK_API_RETURN_CODES", "") == "1"
+
+# Single source of tracking events, shared by /order/track polls and /order/track/stream subscribers
+tracking_hub = TrackingEventHub(tick_seconds=float(os.environ.get("MOCK_TRACKING_TICK_SECONDS", 5)),
+                                advance_probability=float(os.environ.get("MOCK_TRACKING_ADVANCE_PROBABILITY", 0.3)))
+
+# Fields that can be requested through the /order/details projection
+ORDER_FIELDS = set(OrderGenericDetailsResponse.model_fields)
+
+# Fast path: serve /order/details and /order/track from pre-encoded snapshots with ETags
+FAST_PATH = os.environ.get("MOCK_API_FAST_PATH", "") == "1"
+snapshot_cache = SnapshotCache()
+
+def _fast_order_details(params: dict) -> Optional[EncodedSnapshot]:
+    # Per-request variations (include_*) and invalid requests go through the regular endpoint
+    if set(params) - {"order_id", "fields"}:
+        return None
+    try:
+        order_id = int(params["order_id"])
+    except (KeyError, ValueError):
+        return None
+    requested = None
+    if params.get("fields"):
+        requested = frozenset(field.strip() for field in params["fields"].split(",") if field.strip()) | {"order_id"}
+        if requested - ORDER_FIELDS:
+            return None
+    order_details = generate_order_details(order_id)
+    return snapshot_cache.get(("details", order_id, requested), get_order_version(order_id),
+                              lambda: order_details.model_dump(include=requested))
+
+def _fast_track_order(params: dict) -> Optional[EncodedSnapshot]:
+    if set(params) != {"order_id"}:
+        return None
+    try:
+        order_id = int(params["order_id"])
+    except ValueError:
+        return None
+    if not generate_order_details(order_id).tracking_id:
+        return None
+    return snapshot_cache.get(("track", order_id), get_order_version(order_id),
+                              lambda: tracking_hub.snapshot(order_id))
+
+# Last added middleware runs first: faults are injected before the fast path answers
+app.add_middleware(FastPathMiddleware, routes={"/order/details": _fast_order_details, "/order/track": _fast_track_order},
+                   enabled=lambda: FAST_PATH)
+app.add_middleware(FaultInjectionMiddleware, injector=fault_injector)
+
 # --- API Endpoints ---
-@app.get("/order/details", response_model=OrderGenericDetailsResponse)
+@app.get("/order/details", response_model=OrderGenericDetailsResponse, response_model_exclude_unset=True)
 async def get_order_details(order_id: int = Query(..., description="The ID of the order to retrieve."),
                            include_tracking: bool = Query(False, description="Include tracking information."),
-                           include_cancellation: bool = Query(False, description="Include cancellation reason.")):
+                           include_cancellation: bool = Query(False, description="Include cancellation reason."),
+                           fields: Optional[str] = Query(None, description="Comma-separated order fields to return (order_id is always included).")):
     """
     Retrieves generic details for a specific order.
     Demonstrates how a single endpoint can serve different data requirements.
+    When `fields` is given, only those fields are returned.
     """
     # Use order_id as the seed for consistent results for the same order.
     order_details = generate_order_details(order_id)
 
-    if include_tracking:
-        order_details.tracking_id = f"TRACK-{order_id}-{random.randint(100, 999)}"
-    if include_cancellation:
-        if random.random() < 0.2:  # Simulate 20% chance of having been cancelled
-            order_details.cancellation_reason = random.choice(["Customer request", "Item unavailable", "Payment issue"])
-        else:
-            order_details.cancellation_reason = None # Ensure no reason is included if not cancelled.
+    requested = None
+    if fields:
+        requested = frozenset(field.strip() for field in fields.split(",") if field.strip())
+        unknown = requested - ORDER_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown order fields: {', '.join(sorted(unknown))}")
+        requested |= {"order_id"}
+
+    # Per-request variations go on a copy: the cached order only changes through update_order_details
+    if include_tracking or include_cancellation:
+        updates = {}
+        if include_tracking:
+            updates["tracking_id"] = f"TRACK-{order_id}-{random.randint(100, 999)}"
+        if include_cancellation:
+            if random.random() < 0.2:  # Simulate 20% chance of having been cancelled
+                updates["cancellation_reason"] = random.choice(["Customer request", "Item unavailable", "Payment issue"])
+            else:
+                updates["cancellation_reason"] = None # Ensure no reason is included if not cancelled.
+        order_details = order_details.model_copy(update=updates)
+
+    if requested:
+        # Only the projected fields are set, so they are the only ones serialized
+        return OrderGenericDetailsResponse(**order_details.model_dump(include=requested))
 
     return order_details
 
@@ -48,11 +129,8 @@ async def cancel_order(cancellation_request: OrderCancellationRequest):
     order_details = generate_order_details(order_id) # Get base order details
 
     if order_details.status not in ["shipped", "delivered"]:
-        order_details.status = "cancelled"
-        order_details.cancellation_reason = reason  # Store the provided reason.
-    
-    
-    update_order_details(order_id,order_details)
+        # Store the cancellation and the provided reason.
+        update_order_details(order_id, {"status": "cancelled", "cancellation_reason": reason})
 
     return order_details
 
@@ -68,26 +146,43 @@ async def track_order(order_id: int = Query(..., description="The ID of the orde
     if not order_details.tracking_id:
         raise HTTPException(status_code=404, detail=f"Tracking information not found for order {order_id}")
 
-    # Mock tracking events.
-    num_events = random.randint(1, 4)
-    tracking_events = [
-        {
-            "event": "Order placed",
-            "timestamp": "2024-07-28T10:00:00",
-        }
-    ]
-    if num_events > 1:
-        tracking_events.append({"event": "Order processed", "timestamp": "2024-07-28T12:00:00"})
-    if num_events > 2:
-        tracking_events.append({"event": "Order shipped", "timestamp": "2024-07-29T08:00:00"})
-    if num_events > 3:
-        tracking_events.append({"event": "Order delivered", "timestamp": "2024-07-31T14:00:00"})
-
-    return OrderTrackingResponse(
-        order_id=order_id,
-        status=order_details.status,
-        tracking_events=tracking_events,
-    )
+    # Tracking events come from the shared hub, so consecutive polls are consistent.
+    return OrderTrackingResponse(**tracking_hub.snapshot(order_id))
+
+
+
+@app.get("/order/track/stream")
+async def track_order_stream(request: Request,
+                             order_ids: str = Query(..., description="Comma-separated IDs of the orders to follow."),
+                             heartbeat_seconds: float = Query(15, description="Seconds between keep-alive comments.")):
+    """
+    Server-sent events stream of status transitions for the given orders.
+    Sends one `snapshot` event per order, then a `status` event per transition.
+    """
+    try:
+        ids = [int(order_id) for order_id in order_ids.split(",") if order_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="order_ids must be comma-separated integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="order_ids is required")
+
+    async def event_stream():
+        queue = tracking_hub.subscribe(ids)
+        try:
+            for order_id in ids:
+                yield f"event: snapshot\ndata: {json.dumps(tracking_hub.snapshot(order_id))}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(message)}\n\n"
+        finally:
+            tracking_hub.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 
@@ -101,8 +196,13 @@ async def send_2_steps_code(request: dict = Body(...)):
     if not order_id:
         raise HTTPException(status_code=400, detail="order_id is required")
     
-    
-    return {"message": "2-step code sent successfully"}
+    code = verification_codes.issue(int(order_id))
+    print(f"[mock email] 2-step code for order {order_id}: {code}")
+
+    response = {"message": "2-step code sent successfully", "expires_in": verification_codes.ttl_seconds}
+    if RETURN_CODES:
+        response["code"] = code
+    return response
 
     
 
@@ -114,15 +214,45 @@ async def verify_2_steps_code(
     """
     Verify the 2-steps code for the order with the given ID
     """
-    # In production, you would compare against a code stored in your database
-    # This is just a hard-coded example
-    if code != 123654:
-        return CodeVerifierResponse(order_id=order_id, verified=False)
-    
-    return CodeVerifierResponse(order_id=order_id, verified=True)
+    verified = verification_codes.verify(order_id, code)
+    return CodeVerifierResponse(order_id=order_id, verified=verified,
+                                attempts_left=None if verified else verification_codes.attempts_left(order_id))
     
 
 
+# --- Admin Endpoints ---
+@app.get("/admin/faults", response_model=Dict[str, FaultProfile])
+async def get_faults():
+    """
+    Lists the fault profiles by endpoint path ("*" applies to all endpoints).
+    """
+    return fault_injector.profiles
+
+
+
+@app.put("/admin/faults", response_model=FaultProfile)
+async def set_fault(profile: FaultProfile, path: str = Query(..., description="Endpoint path, or * for all endpoints.")):
+    """
+    Sets the fault profile of an endpoint.
+    """
+    fault_injector.profiles[path] = profile
+    return profile
+
+
+
+@app.delete("/admin/faults")
+async def clear_faults(path: Optional[str] = Query(None, description="Endpoint path to clear. Clears all profiles if omitted.")):
+    """
+    Removes one or all fault profiles.
+    """
+    if path is None:
+        fault_injector.profiles.clear()
+    else:
+        fault_injector.profiles.pop(path, None)
+    return {"message": "Fault profiles cleared"}
+
+
+
 if __name__ == "__main__":
     import uvicorn
 
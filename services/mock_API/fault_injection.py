@@ -0,0 +1,118 @@
+from services.mock_API.data_models import FaultProfile
+from fastapi.responses import JSONResponse
+from typing import Dict, Optional
+import asyncio
+import json
+import math
+import os
+import random
+
+# --- Fault Injection ---
+# Profiles are keyed by endpoint path ("/order/track") and "*" applies to every
+# endpoint without its own profile. They are loaded from MOCK_API_FAULTS (inline
+# JSON or a path to a JSON file) and can be changed at runtime via /admin/faults.
+
+
+class FaultInjector:
+    """
+    Holds the fault profiles of the mock API and applies them to incoming requests.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, FaultProfile]] = None, seed: Optional[int] = None):
+        self.profiles: Dict[str, FaultProfile] = dict(profiles or {})
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_settings(cls, setting: Optional[str] = None) -> "FaultInjector":
+        """
+        Builds the injector from a JSON mapping of endpoint path to profile.
+
+        Args:
+            setting: Inline JSON or a path to a JSON file. Defaults to MOCK_API_FAULTS.
+
+        Returns:
+            A FaultInjector, empty if nothing is configured.
+        """
+        setting = setting if setting is not None else os.environ.get("MOCK_API_FAULTS", "")
+        if not setting:
+            return cls()
+        if os.path.isfile(setting):
+            with open(setting) as file:
+                raw_profiles = json.load(file)
+        else:
+            raw_profiles = json.loads(setting)
+        return cls({path: FaultProfile(**profile) for path, profile in raw_profiles.items()})
+
+    def profile_for(self, path: str) -> Optional[FaultProfile]:
+        return self.profiles.get(path) or self.profiles.get("*")
+
+    def sample_latency(self, profile: FaultProfile) -> float:
+        """
+        Draws a latency from the profile distribution.
+
+        Returns:
+            Latency in seconds (never negative).
+        """
+        mean = profile.latency_ms
+        spread = profile.latency_jitter_ms
+        distribution = profile.latency_distribution
+        if distribution == "none":
+            latency_ms = 0.0
+        elif distribution == "fixed":
+            latency_ms = mean
+        elif distribution == "uniform":
+            latency_ms = self._random.uniform(mean - spread, mean + spread)
+        elif distribution == "normal":
+            latency_ms = self._random.gauss(mean, spread)
+        elif distribution == "lognormal":
+            # latency_ms is the median, spread / median the log-space sigma
+            latency_ms = self._random.lognormvariate(math.log(mean), spread / mean) if mean > 0 else 0.0
+        elif distribution == "exponential":
+            latency_ms = self._random.expovariate(1 / mean) if mean > 0 else 0.0
+        else:
+            raise ValueError(f"Unknown latency distribution '{distribution}'")
+        return max(latency_ms, 0.0) / 1000
+
+    async def apply(self, path: str) -> Optional[JSONResponse]:
+        """
+        Delays the request and decides whether it fails.
+
+        Args:
+            path: Endpoint path of the request.
+
+        Returns:
+            The error response to send instead of calling the endpoint, or None.
+        """
+        profile = self.profile_for(path)
+        if profile is None:
+            return None
+
+        if profile.timeout_rate and self._random.random() < profile.timeout_rate:
+            await asyncio.sleep(profile.timeout_seconds)
+            return JSONResponse(status_code=504, content={"detail": f"Injected timeout on {path}"})
+
+        latency = self.sample_latency(profile)
+        if latency:
+            await asyncio.sleep(latency)
+
+        if profile.error_rate and self._random.random() < profile.error_rate:
+            return JSONResponse(status_code=profile.error_status, content={"detail": f"Injected error on {path}"})
+        return None
+
+
+class FaultInjectionMiddleware:
+    """
+    ASGI middleware applying the injector to every request except the /admin endpoints.
+    """
+
+    def __init__(self, app, injector: FaultInjector):
+        self.app = app
+        self.injector = injector
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith("/admin"):
+            fault_response = await self.injector.apply(scope["path"])
+            if fault_response is not None:
+                await fault_response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,170 @@
+"""
+Open-loop load generator for the mock order API.
+
+Requests are scheduled at a fixed rate regardless of how fast the API answers, and
+latency is measured from the scheduled start, so a slow backend shows up as queueing
+delay instead of silently lowering the offered load.
+
+Usage:
+    python -m services.mock_API.load_generator --rps 50 --duration 30 --mix details=3,track=2,verify=1
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse
+import random
+import threading
+import time
+import requests
+
+BASE_URL = "http://127.0.0.1:8000"
+
+
+# --- Scenarios ---
+def _details(session: requests.Session, order_id: int, timeout: float):
+    return session.get(f"{BASE_URL}/order/details", params={"order_id": order_id}, timeout=timeout)
+
+def _track(session: requests.Session, order_id: int, timeout: float):
+    return session.get(f"{BASE_URL}/order/track", params={"order_id": order_id}, timeout=timeout)
+
+def _cancel(session: requests.Session, order_id: int, timeout: float):
+    return session.post(f"{BASE_URL}/order/cancel", json={"order_id": order_id, "reason": "load test"}, timeout=timeout)
+
+def _verify(session: requests.Session, order_id: int, timeout: float):
+    # Needs the API started with MOCK_API_RETURN_CODES=1 to know the issued code
+    response = session.post(f"{BASE_URL}/security/send_2_steps_code", json={"order_id": order_id}, timeout=timeout)
+    if not response.ok:
+        return response
+    code = response.json().get("code", 0)
+    return session.get(f"{BASE_URL}/security/verify_2_steps_code", params={"order_id": order_id, "code": code}, timeout=timeout)
+
+SCENARIOS = {"details": _details, "track": _track, "cancel": _cancel, "verify": _verify}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    """
+    Drives the mock API endpoints at a target request rate and collects latencies.
+    """
+
+    def __init__(self, rps: float, duration: float, mix: Dict[str, float], timeout: float = 10.0,
+                 max_workers: int = 64, order_ids: range = range(1000, 2000)):
+        """
+        Args:
+            rps: Target requests (scenarios) started per second.
+            duration: Test duration in seconds.
+            mix: Relative weight of each scenario in SCENARIOS.
+            timeout: Client timeout per HTTP call, in seconds.
+            max_workers: Maximum number of in-flight scenarios.
+            order_ids: Pool of order ids to draw from.
+        """
+        unknown = set(mix) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        self.rps = rps
+        self.duration = duration
+        self.mix = mix
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.order_ids = order_ids
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.results: Dict[str, Dict[str, list]] = {name: {"latencies": [], "errors": []} for name in mix}
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _run_one(self, name: str, order_id: int, scheduled_at: float):
+        error = None
+        try:
+            response = SCENARIOS[name](self._session(), order_id, self.timeout)
+            if not response.ok:
+                error = str(response.status_code)
+        except requests.Timeout:
+            error = "timeout"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        latency = time.perf_counter() - scheduled_at
+        with self._lock:
+            self.results[name]["latencies"].append(latency)
+            if error:
+                self.results[name]["errors"].append(error)
+
+    def run(self) -> Dict[str, dict]:
+        """
+        Runs the load test.
+
+        Returns:
+            Per-scenario report (see report()).
+        """
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        interval = 1 / self.rps
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            sent = 0
+            while sent * interval < self.duration:
+                scheduled_at = start + sent * interval
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._run_one, random.choices(names, weights)[0], random.choice(self.order_ids), scheduled_at)
+                sent += 1
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        """
+        Args:
+            elapsed: Wall time of the run, in seconds.
+
+        Returns:
+            For each scenario: count, errors by kind, throughput (completed/s) and p50/p95/p99 in ms.
+        """
+        report = {}
+        for name, result in self.results.items():
+            latencies = sorted(result["latencies"])
+            errors = {}
+            for error in result["errors"]:
+                errors[error] = errors.get(error, 0) + 1
+            report[name] = {
+                "count": len(latencies),
+                "errors": errors,
+                "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+            }
+        return report
+
+
+def print_report(report: Dict[str, dict]):
+    print(f"{'scenario':<10}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report.items():
+        print(f"{name:<10}{row['count']:>8}{sum(row['errors'].values()):>8}{row['throughput']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+        if row["errors"]:
+            print(f"{'':<10}errors: {row['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the mock order API")
+    parser.add_argument("--url", default=BASE_URL, help="Base URL of the mock API")
+    parser.add_argument("--rps", type=float, default=20, help="Target scenarios per second")
+    parser.add_argument("--duration", type=float, default=10, help="Test duration in seconds")
+    parser.add_argument("--mix", default="details=1,track=1", help="Scenario weights, e.g. details=3,track=2,verify=1")
+    parser.add_argument("--timeout", type=float, default=10, help="Client timeout per HTTP call in seconds")
+    parser.add_argument("--workers", type=int, default=64, help="Maximum in-flight scenarios")
+    args = parser.parse_args()
+
+    BASE_URL = args.url.rstrip("/")
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    generator = LoadGenerator(rps=args.rps, duration=args.duration, mix=mix, timeout=args.timeout, max_workers=args.workers)
+    print_report(generator.run())
@@ -0,0 +1,78 @@
+"""
+Requests per second of /order/details and /order/track with and without the fast path.
+
+The app is driven in-process through its ASGI interface, so the numbers measure
+routing, validation and encoding cost without network noise.
+
+Usage:
+    python -m services.mock_API.response_benchmark --requests 20000
+"""
+from services.mock_API import endpoints
+import argparse
+import asyncio
+import time
+
+
+async def call(path: str, query: str, headers=()) -> tuple:
+    """
+    Sends one GET request to the app.
+
+    Returns:
+        (status code, response headers, body)
+    """
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": query.encode(), "headers": [(b"host", b"bench")] + list(headers),
+             "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await endpoints.app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def measure(path: str, orders: int, total: int, revalidate: bool = False) -> tuple:
+    """
+    Returns:
+        (requests per second, average body bytes)
+    """
+    etags = {}
+    body_bytes = 0
+    start = time.perf_counter()
+    for i in range(total):
+        query = f"order_id={i % orders}"
+        headers = [(b"if-none-match", etags[query])] if revalidate and query in etags else []
+        status, response_headers, body = await call(path, query, headers)
+        if b"etag" in response_headers:
+            etags[query] = response_headers[b"etag"]
+        body_bytes += len(body)
+    elapsed = time.perf_counter() - start
+    return total / elapsed, body_bytes / total
+
+
+async def main(total: int, orders: int):
+    print(f"{'endpoint':<16}{'mode':<14}{'req/s':>10}{'bytes/req':>11}")
+    for path in ["/order/details", "/order/track"]:
+        for mode in ["pydantic", "fast", "fast+etag"]:
+            endpoints.FAST_PATH = mode != "pydantic"
+            endpoints.snapshot_cache.clear()
+            await measure(path, orders, orders, revalidate=False)  # warm the mock data
+            rps, size = await measure(path, orders, total, revalidate=mode == "fast+etag")
+            print(f"{path:<16}{mode:<14}{rps:>10,.0f}{size:>11.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the mock API response paths")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per endpoint and mode")
+    parser.add_argument("--orders", type=int, default=100, help="Distinct order ids to cycle through")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.orders))
@@ -0,0 +1,109 @@
+from services.mock_API.data_mocking import generate_order_details, update_order_details
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+import random
+
+# --- Tracking Events ---
+# A single hub owns the tracking timeline of every order. Polls (/order/track) read
+# its snapshot and streams (/order/track/stream) subscribe to it, so both see the
+# same stable status. One background ticker advances the subscribed orders and fans
+# each transition out to the subscribers' queues.
+
+STATUS_PIPELINE = ["pending", "processing", "components gathered", "quality check",
+                   "packaging", "shipped", "out for delivery", "delivered"]
+
+# Historical events implied by the initial status of a mocked order
+_BASE_EVENTS = [
+    ("pending", "Order placed", "2024-07-28T10:00:00"),
+    ("processing", "Order processed", "2024-07-28T12:00:00"),
+    ("shipped", "Order shipped", "2024-07-29T08:00:00"),
+    ("delivered", "Order delivered", "2024-07-31T14:00:00"),
+]
+
+
+class TrackingEventHub:
+    """
+    Shared source of order status transitions for polling and streaming clients.
+    """
+
+    def __init__(self, tick_seconds: float = 5.0, advance_probability: float = 0.3, queue_size: int = 100):
+        """
+        Args:
+            tick_seconds: Interval between status updates of subscribed orders.
+            advance_probability: Chance that a subscribed order moves one status forward per tick.
+            queue_size: Pending events kept per subscriber; older events are dropped for slow consumers.
+        """
+        self.tick_seconds = tick_seconds
+        self.advance_probability = advance_probability
+        self.queue_size = queue_size
+        self._events: Dict[int, List[dict]] = {}
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._ticker: Optional[asyncio.Task] = None
+        # Own generator: the mock data helpers reseed the global one
+        self._random = random.Random()
+
+    def snapshot(self, order_id: int) -> dict:
+        """
+        Returns:
+            The current status and tracking events of the order.
+        """
+        order_details = generate_order_details(order_id)
+        if order_id not in self._events:
+            reached = STATUS_PIPELINE.index(order_details.status) if order_details.status in STATUS_PIPELINE else 0
+            self._events[order_id] = [
+                {"event": event, "timestamp": timestamp}
+                for status, event, timestamp in _BASE_EVENTS
+                if STATUS_PIPELINE.index(status) <= reached
+            ]
+        return {"order_id": order_id, "status": order_details.status, "tracking_events": list(self._events[order_id])}
+
+    def subscribe(self, order_ids: Iterable[int]) -> asyncio.Queue:
+        """
+        Registers a subscriber for the given orders and starts the shared ticker if needed.
+
+        Returns:
+            The queue on which the orders' transitions are delivered.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        for order_id in order_ids:
+            self.snapshot(order_id)
+            self._subscribers.setdefault(order_id, set()).add(queue)
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        for order_id in list(self._subscribers):
+            self._subscribers[order_id].discard(queue)
+            if not self._subscribers[order_id]:
+                del self._subscribers[order_id]
+
+    def publish(self, order_id: int, status: str) -> None:
+        """
+        Records a status transition of the order and pushes it to its subscribers.
+        """
+        self.snapshot(order_id)
+        update_order_details(order_id, {"status": status})
+        event = {"event": f"Status changed to {status}", "timestamp": datetime.now().isoformat(timespec="seconds")}
+        self._events[order_id].append(event)
+
+        message = {"order_id": order_id, "status": status, "event": event}
+        for queue in self._subscribers.get(order_id, ()):
+            if queue.full():
+                queue.get_nowait()  # slow consumer: drop its oldest event
+            queue.put_nowait(message)
+
+    def _advance(self) -> None:
+        for order_id in list(self._subscribers):
+            status = generate_order_details(order_id).status
+            if status not in STATUS_PIPELINE or status == STATUS_PIPELINE[-1]:
+                continue  # cancelled or delivered orders don't move
+            if self._random.random() < self.advance_probability:
+                self.publish(order_id, STATUS_PIPELINE[STATUS_PIPELINE.index(status) + 1])
+
+    async def _run(self) -> None:
+        # Stops by itself once nobody is subscribed anymore
+        while self._subscribers:
+            await asyncio.sleep(self.tick_seconds)
+            self._advance()
@@ -0,0 +1,165 @@
+import hashlib
+import hmac
+import math
+import secrets
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# --- 2-step Verification Codes ---
+# Pending codes live in a timing wheel: one slot per tick, each slot holding the
+# orders whose code expires on that tick. Issuing, verifying and expiring are all
+# constant time per code, and a whole tick of codes is dropped with one clear().
+
+
+class VerificationCodeStore:
+    """
+    In-memory store of hashed 2-step verification codes with TTL and attempt limits.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_attempts: int = 3, tick_seconds: float = 1.0,
+                 code_length: int = 6, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            ttl_seconds: Lifetime of an issued code.
+            max_attempts: Verification attempts allowed per issued code.
+            tick_seconds: Expiry resolution (size of one timing wheel slot).
+            code_length: Number of digits of the generated codes.
+            clock: Monotonic time source, injectable for tests and load simulations.
+        """
+        if ttl_seconds <= 0 or tick_seconds <= 0:
+            raise ValueError("ttl_seconds and tick_seconds must be positive")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self.tick_seconds = tick_seconds
+        self.code_length = code_length
+        self._clock = clock
+        self._secret = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+
+        self._ttl_ticks = max(1, math.ceil(ttl_seconds / tick_seconds))
+        # One extra slot so the slot being filled is never the one being expired
+        self._slots = [set() for _ in range(self._ttl_ticks + 1)]
+        # order_id -> [code_hash, expires_tick, attempts_left]
+        self._entries: Dict[int, list] = {}
+        self._last_tick = self._tick()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _tick(self) -> int:
+        return int(self._clock() // self.tick_seconds)
+
+    def _hash(self, order_id: int, code: str) -> bytes:
+        return hmac.new(self._secret, f"{order_id}:{code}".encode(), hashlib.sha256).digest()
+
+    def _advance(self) -> int:
+        """Drop every slot whose tick has passed since the last call. Returns the number of expired codes."""
+        now = self._tick()
+        expired = 0
+        # After a full turn of the wheel every slot has been visited once
+        for tick in range(self._last_tick + 1, min(now, self._last_tick + len(self._slots)) + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for order_id in slot:
+                del self._entries[order_id]
+            expired += len(slot)
+            slot.clear()
+        self._last_tick = max(self._last_tick, now)
+        return expired
+
+    def _discard(self, order_id: int) -> None:
+        entry = self._entries.pop(order_id, None)
+        if entry is not None:
+            self._slots[entry[1] % len(self._slots)].discard(order_id)
+
+    def expire(self) -> int:
+        """
+        Expires the codes whose TTL has passed.
+
+        Returns:
+            The number of expired codes.
+        """
+        with self._lock:
+            return self._advance()
+
+    def issue(self, order_id: int) -> str:
+        """
+        Generates a new code for the order, replacing any pending one.
+
+        Args:
+            order_id: The order the code is issued for.
+
+        Returns:
+            The plain code, to be delivered to the customer. Only its hash is stored.
+        """
+        code = str(secrets.randbelow(9 * 10 ** (self.code_length - 1)) + 10 ** (self.code_length - 1))
+        with self._lock:
+            self._advance()
+            self._discard(order_id)
+            expires_tick = self._last_tick + self._ttl_ticks
+            self._entries[order_id] = [self._hash(order_id, code), expires_tick, self.max_attempts]
+            self._slots[expires_tick % len(self._slots)].add(order_id)
+        return code
+
+    def verify(self, order_id: int, code) -> bool:
+        """
+        Checks a code for the order. A code is single-use and is revoked after
+        `max_attempts` failed checks.
+
+        Args:
+            order_id: The order the code was issued for.
+            code: The code provided by the customer.
+
+        Returns:
+            True if the code is valid.
+        """
+        with self._lock:
+            self._advance()
+            entry = self._entries.get(order_id)
+            if entry is None:
+                return False
+            if hmac.compare_digest(entry[0], self._hash(order_id, str(code))):
+                self._discard(order_id)
+                return True
+            entry[2] -= 1
+            if entry[2] <= 0:
+                self._discard(order_id)
+            return False
+
+    def attempts_left(self, order_id: int) -> Optional[int]:
+        """
+        Returns:
+            Remaining verification attempts for the pending code, None if there is no pending code.
+        """
+        with self._lock:
+            self._advance()
+            entry = self._entries.get(order_id)
+            return entry[2] if entry else None
+
+
+# Example usage / scale check
+if __name__ == "__main__":
+    pending = 1_000_000
+    fake_time = [0.0]
+    store = VerificationCodeStore(ttl_seconds=300, clock=lambda: fake_time[0])
+
+    start = time.perf_counter()
+    for order_id in range(pending):
+        store.issue(order_id)
+        fake_time[0] += 300 / pending  # spread issue times over one TTL
+    elapsed = time.perf_counter() - start
+    print(f"issue:  {pending / elapsed:,.0f} ops/s with {len(store):,} pending codes")
+
+    start = time.perf_counter()
+    for order_id in range(pending):
+        store.verify(order_id, "000000")
+    elapsed = time.perf_counter() - start
+    print(f"verify: {pending / elapsed:,.0f} ops/s")
+
+    fake_time[0] += 300
+    start = time.perf_counter()
+    expired = store.expire()
+    print(f"expire: {expired:,} codes in {time.perf_counter() - start:.3f}s, {len(store):,} left")
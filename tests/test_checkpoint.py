@@ -0,0 +1,82 @@
+from services.chat.chat_ToT import ChatToT, Code_Node
+from services.chat.checkpoint import Checkpoint, CheckpointError, history_digest
+from services.chat.session_backends import MemorySessionBackend
+import pytest
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+QUESTION = "What is your order number?"
+
+
+def ask_order(arg, trase=True, childs_tools=(), order_fields=None):
+    return "answer", QUESTION, {"asked": True}
+
+
+def answer(arg, trase=True, childs_tools=(), order_fields=None):
+    return "", f"answered {arg['user_message']}"
+
+
+def build():
+    chat_bot = ChatToT(Code_Node("ask", "Asks for the order number", MESSAGE, ask_order, is_interactive=True))
+    chat_bot.conect_node_to_node("ask", Code_Node("answer", "Answers", MESSAGE, answer))
+    chat_bot.compile()
+    chat_bot.hop_listeners = []
+    chat_bot.use_checkpoints(MemorySessionBackend())
+    return chat_bot
+
+
+def test_round_trip():
+    plan = build().plan
+    checkpoint = Checkpoint("answer", {"order_id": 1042}, QUESTION, 2, history_digest([QUESTION]))
+    decoded = Checkpoint.decode(checkpoint.encode(plan), plan)
+    assert (decoded.node, decoded.sys_data, decoded.pending) == ("answer", {"order_id": 1042}, QUESTION)
+    assert (decoded.history_length, decoded.history_digest) == (2, history_digest([QUESTION]))
+
+
+@pytest.mark.parametrize("data", [b"", b"not a checkpoint", b"\x00\xff\x10garbage"])
+def test_corrupt_data_raises(data):
+    with pytest.raises(CheckpointError):
+        Checkpoint.decode(data, build().plan)
+
+
+def test_node_missing_from_the_graph_raises():
+    plan = build().plan
+    other = ChatToT(Code_Node("greet", "Greets", MESSAGE, answer))
+    with pytest.raises(CheckpointError):
+        Checkpoint.decode(Checkpoint("answer", {}).encode(plan), other.plan)
+
+
+def test_turn_resumes_at_the_interactive_node():
+    chat_bot = build()
+    assert chat_bot.run_from("where is my order?", [], None, session_id="s1") == ("answer", QUESTION)
+    history = [{"role": "user", "content": "where is my order?"}, {"role": "assistant", "content": QUESTION}]
+    assert chat_bot.run_from("1042", history, None, session_id="s1") == ("", "answered 1042")
+    assert chat_bot.checkpoint_stats["resumed"] == 1
+    # Cleared at the answer
+    assert chat_bot.load_checkpoint("s1") is None
+
+
+def test_turn_without_history_resumes():
+    chat_bot = build()
+    chat_bot.run_from("where is my order?", None, None, session_id="s1")
+    # Callers keeping no history can't be checked against the checkpoint
+    assert chat_bot.run_from("1042", None, None, session_id="s1") == ("", "answered 1042")
+    assert chat_bot.checkpoint_stats["resumed"] == 1
+
+
+def test_stale_checkpoint_starts_from_the_root():
+    chat_bot = build()
+    chat_bot.run_from("where is my order?", [], None, session_id="s1")
+    # The client edited the conversation: the last message isn't the paused node's question
+    history = [{"role": "user", "content": "where is my order?"}, {"role": "assistant", "content": "something else"}]
+    assert chat_bot.run_from("1042", history, None, session_id="s1") == ("answer", QUESTION)
+    assert chat_bot.checkpoint_stats["stale"] == 1
+    assert chat_bot.checkpoint_stats["resumed"] == 0
+
+
+def test_corrupt_checkpoint_is_discarded():
+    chat_bot = build()
+    chat_bot.checkpoints.put("s1", b"corrupt")
+    assert chat_bot.run_from("where is my order?", [], None, session_id="s1") == ("answer", QUESTION)
+    assert chat_bot.checkpoint_stats["invalid"] == 1
+    # Overwritten by the turn's checkpoint
+    assert chat_bot.load_checkpoint("s1").node == "answer"
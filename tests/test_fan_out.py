@@ -0,0 +1,83 @@
+from services.chat.chat_ToT import ChatToT, Code_Node, FanOut_Node, Join_Node
+import time
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+def order_details(arg, trase=True, childs_tools=(), order_fields=None, sys_data=None):
+    sys_data["status"] = "shipped"
+    return "", "order 1042 shipped"
+
+
+def tracking_events(arg, trase=True, childs_tools=(), order_fields=None):
+    # Order details returned like the node_utils functions do
+    return "", "in transit", {"tracking_id": "TRACK-1042"}
+
+
+def slow_policy(arg, trase=True, childs_tools=(), order_fields=None):
+    time.sleep(0.5)
+    return "", "late policy context"
+
+
+def build(required_branches=()):
+    seen = {}
+
+    def answer(arg, trase=True, childs_tools=(), order_fields=None, sys_data=None):
+        seen.update(arg=dict(arg), sys_data=dict(sys_data))
+        return "", "answered"
+
+    gather = FanOut_Node("gather", "Order details, tracking and policy", MESSAGE, join="merge", deadline=0.1,
+                         required_branches=required_branches)
+    chat_bot = ChatToT(gather)
+    chat_bot.conect_node_to_node("gather", Join_Node("merge", "Merge", MESSAGE))
+    for name, function in (("details", order_details), ("tracking", tracking_events), ("policy", slow_policy)):
+        chat_bot.conect_node_to_node("gather", Code_Node(name, name, MESSAGE, function))
+    chat_bot.conect_node_to_node("merge", Code_Node("answer", "Answer", MESSAGE, answer))
+    return chat_bot, gather, seen
+
+
+def test_deadline_gives_partial_results_and_merges_order_context():
+    chat_bot, gather, seen = build()
+    started = time.perf_counter()
+    next_node, reply = chat_bot.run_from("where is my order?", [], None, sys_data={"order_id": 1042})
+    assert time.perf_counter() - started < 0.4  # the slow branch is not waited for
+    assert (next_node, reply) == ("", "answered")
+    assert seen["arg"]["details"] == "order 1042 shipped"
+    assert seen["arg"]["tracking"] == "in transit"
+    assert "policy" not in seen["arg"] and seen["arg"]["missing_sources"] == "policy"
+    # Changed in the branch's copy, and returned as order details
+    assert seen["sys_data"] == {"order_id": 1042, "status": "shipped", "tracking_id": "TRACK-1042"}
+    assert gather.branch_stats["policy"]["timeouts"] == 1
+    assert gather.branch_stats["details"]["ok"] == 1
+
+
+def test_missing_required_branch_fails_the_fan_out():
+    chat_bot, gather, seen = build(required_branches=["policy"])
+    next_node, _ = chat_bot.run_from("where is my order?", [], None, max_retries=2, sys_data={})
+    assert next_node is None
+    assert not seen
+    assert gather.branch_stats["policy"] == {"calls": 2, "ok": 0, "timeouts": 2, "errors": 0}
+
+
+def test_branch_callbacks_merge_in_branch_order():
+    def first(arg, trase=True, childs_tools=(), order_fields=None):
+        # Finishes last, still merged first
+        time.sleep(0.05)
+        return "", "first", {"status": "first"}
+
+    def second(arg, trase=True, childs_tools=(), order_fields=None):
+        return "", "second", {"status": "second"}
+
+    seen = {}
+
+    def answer(arg, trase=True, childs_tools=(), order_fields=None, sys_data=None):
+        seen.update(sys_data)
+        return "", "answered"
+
+    chat_bot = ChatToT(FanOut_Node("gather", "Both", MESSAGE, join="merge"))
+    chat_bot.conect_node_to_node("gather", Join_Node("merge", "Merge", MESSAGE))
+    chat_bot.conect_node_to_node("gather", Code_Node("first", "first", MESSAGE, first))
+    chat_bot.conect_node_to_node("gather", Code_Node("second", "second", MESSAGE, second))
+    chat_bot.conect_node_to_node("merge", Code_Node("answer", "Answer", MESSAGE, answer))
+    chat_bot.run_from("status?", [], None, sys_data={})
+    assert seen["status"] == "second"
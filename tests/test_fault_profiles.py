@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from services.mock_API.endpoints import app, fault_injector
+from services.mock_API.fault_injection import FaultInjector
+import pytest
+
+
+@pytest.fixture
+def client():
+    yield TestClient(app)
+    fault_injector.profiles.clear()
+
+
+@pytest.mark.parametrize("profile", [{"latency_distribution": "gamma"}, {"error_rate": 1.5}, {"timeout_rate": -0.1}])
+def test_invalid_profile_is_rejected_when_set(client, profile):
+    response = client.put("/admin/faults", params={"path": "*"}, json=profile)
+    assert response.status_code == 422
+    assert fault_injector.profiles == {}
+
+
+def test_valid_profile_is_set(client):
+    profile = {"latency_distribution": "lognormal", "latency_ms": 200, "latency_jitter_ms": 80, "error_rate": 0.05}
+    assert client.put("/admin/faults", params={"path": "/order/track"}, json=profile).status_code == 200
+    assert fault_injector.profiles["/order/track"].latency_distribution == "lognormal"
+
+
+def test_invalid_profile_in_settings():
+    with pytest.raises(ValidationError):
+        FaultInjector.from_settings('{"*": {"latency_distribution": "gamma"}}')
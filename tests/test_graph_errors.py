@@ -0,0 +1,55 @@
+from services.chat.chat_ToT import ChatToT, Code_Node
+from services.chat.graph_loader import load_graph
+from services.chat.graph_plan import GraphError
+import pytest
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+def route(arg, trase=True, childs_tools=(), order_fields=None):
+    return "loop", arg
+
+
+def test_compile_reports_every_issue():
+    chat_bot = ChatToT(Code_Node("root", "Routes", MESSAGE, route))
+    chat_bot.conect_node_to_node("root", Code_Node("loop", "Loops", MESSAGE, route))
+    chat_bot.conect_node_to_node("loop", Code_Node("back", "Back", MESSAGE, route))
+    chat_bot.conect_node_to_node("back", Code_Node("loop", "Loops", MESSAGE, route))
+    with pytest.raises(GraphError) as error:
+        chat_bot.compile()
+    issues = error.value.issues
+    assert len(issues) == 3
+    assert all("no path to an output or interactive node" in issue for issue in issues)
+    assert all(issue in str(error.value) for issue in issues)
+
+
+def test_load_graph_reports_every_issue(tmp_path):
+    path = tmp_path / "graph.yaml"
+    path.write_text("""
+version: 1
+root: root
+nodes:
+  - name: root
+    type: code
+    description: Routes
+    function: services.chat.missing_module:route
+    children: [answer, unknown]
+  - name: answer
+    type: teleport
+    description: Answers
+""")
+    with pytest.raises(GraphError) as error:
+        load_graph(str(path))
+    issues = error.value.issues
+    assert len(issues) == 3
+    assert "root: child unknown is not declared" in issues
+    assert any(issue.startswith("root: No module named") for issue in issues)
+    assert any(issue.startswith("answer: Unknown node type 'teleport'") for issue in issues)
+
+
+def test_graph_without_root(tmp_path):
+    path = tmp_path / "graph.json"
+    path.write_text('{"root": "start", "nodes": []}')
+    with pytest.raises(GraphError) as error:
+        load_graph(str(path))
+    assert any("start" in issue for issue in error.value.issues)
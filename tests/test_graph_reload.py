@@ -0,0 +1,52 @@
+from services.chat import chat_ToT
+from services.chat.graph_loader import GraphReloader, load_graph
+import json
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+def greet(arg, trase=True, childs_tools=(), order_fields=None):
+    return "", "hello"
+
+
+def goodbye(arg, trase=True, childs_tools=(), order_fields=None):
+    return "", "goodbye"
+
+
+def write_graph(path, function):
+    path.write_text(json.dumps({"version": 1, "root": "answer", "nodes": [
+        {"name": "answer", "type": "code", "description": "Answers", "parameters": MESSAGE,
+         "function": f"tests.test_graph_reload:{function}"}]}))
+
+
+def test_reload_swaps_the_plan_without_a_new_chat_bot(tmp_path, monkeypatch):
+    path = tmp_path / "graph.json"
+    write_graph(path, "greet")
+    chat_bot = load_graph(str(path))
+    chat_bot.hop_listeners = []
+    reloader = GraphReloader(chat_bot, str(path))
+    assert chat_bot.run_from("hi", [], None, trase=False) == ("", "hello")
+    signature = chat_bot.plan.signature
+
+    def fail():
+        raise AssertionError("reload built a ChatToT")
+    monkeypatch.setattr(chat_ToT, "session_backend_from_env", fail)
+    monkeypatch.setattr(chat_ToT.TurnTracer, "from_env", fail)
+    write_graph(path, "goodbye")
+    assert reloader.reload()
+    assert reloader.stats == {"reloads": 1, "failures": 0}
+    assert chat_bot.run_from("hi", [], None, trase=False) == ("", "goodbye")
+    # Same nodes and edges, so checkpoints still point at the same plan ids
+    assert chat_bot.plan.signature == signature
+
+
+def test_invalid_file_keeps_the_running_graph(tmp_path):
+    path = tmp_path / "graph.json"
+    write_graph(path, "greet")
+    chat_bot = load_graph(str(path))
+    chat_bot.hop_listeners = []
+    reloader = GraphReloader(chat_bot, str(path))
+    write_graph(path, "missing_function")
+    assert not reloader.reload()
+    assert reloader.stats["failures"] == 1
+    assert chat_bot.run_from("hi", [], None, trase=False) == ("", "hello")
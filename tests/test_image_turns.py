@@ -0,0 +1,55 @@
+from services.chat import chat_ToT
+from services.chat.chat_ToT import ChatToT, Code_Node, Image_to_text_Node
+from services.chat.image_pipeline import ImagePipeline
+from services.chat.llm_backends import LLMBackend, as_completion
+from PIL import Image
+import pytest
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+class VisionBackend(LLMBackend):
+    """Describes every picture the same way and records the messages of every request"""
+    offline = True
+
+    def __init__(self):
+        self.requests = []
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        self.requests.append(messages)
+        return as_completion({"choices": [{"message": {"role": "assistant", "content": "a cracked screen"}}],
+                              "usage": {"prompt_tokens": 100, "completion_tokens": 5}})
+
+
+def answer(arg, trase=True, childs_tools=(), order_fields=None):
+    return "", f"{arg['image_description']} / {arg['user_message']}"
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pipeline = ImagePipeline(workers=1)
+    monkeypatch.setattr(chat_ToT, "image_pipeline", lambda: pipeline)
+    return pipeline
+
+
+def test_description_is_cached_across_messages(pipeline):
+    backend = VisionBackend()
+    chat_bot = ChatToT(Image_to_text_Node("describe", "Describes the picture", MESSAGE, backend=backend))
+    chat_bot.conect_node_to_node("describe", Code_Node("answer", "Answers", MESSAGE, answer))
+    chat_bot.hop_listeners = []
+    photo = Image.new("RGBA", (2000, 1500), (200, 30, 30, 255))
+    assert chat_bot.run_from("my screen is broken", [], photo) == ("", "a cracked screen / my screen is broken")
+    assert chat_bot.run_from("can I get a refund?", [], photo) == ("", "a cracked screen / can I get a refund?")
+    assert len(backend.requests) == 1
+    # The cached description can't depend on the message it was first asked with
+    content = backend.requests[0][-1]["content"]
+    assert [part["type"] for part in content] == ["image_url"]
+    assert pipeline.stats["described"] == 1 and pipeline.stats["cache_hits"] == 1
+
+
+def test_graph_without_an_image_node_skips_preparation(pipeline):
+    chat_bot = ChatToT(Code_Node("answer", "Answers", MESSAGE, lambda arg, **kwargs: ("", f"image {arg['image']}")))
+    chat_bot.hop_listeners = []
+    photo = Image.new("RGB", (2000, 1500))
+    assert chat_bot.run_from("hello", [], photo) == ("", "image None")
+    assert pipeline.stats["images"] == 0
@@ -0,0 +1,45 @@
+from services.chat.llm_backends import LLMBackend, as_completion
+from services.chat.llm_scheduler import LLMScheduler, ScheduledBackend, TokenBucket
+import pytest
+
+MESSAGES = [{"role": "user", "content": "where is my order?"}]
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class FlakyBackend(LLMBackend):
+    """Rejects the first `rejections` requests with a 429, then answers using 15 tokens"""
+    offline = True
+
+    def __init__(self, rejections):
+        self.rejections = rejections
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        if self.rejections:
+            self.rejections -= 1
+            raise RateLimited("rate limited")
+        return as_completion({"choices": [{"message": {"role": "assistant", "content": "shipped"}}],
+                              "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}})
+
+
+def scheduled(rejections, retries=3):
+    scheduler = LLMScheduler(tpm=60000, rate_limit_retries=retries, default_retry_after=0)
+    # A frozen clock: the level only moves with what the requests take and give back
+    scheduler.tokens = TokenBucket(60000, 2000, clock=lambda: 0.0)
+    return scheduler, ScheduledBackend(FlakyBackend(rejections), scheduler)
+
+
+def test_rate_limited_attempts_give_their_tokens_back():
+    scheduler, backend = scheduled(rejections=2)
+    backend.complete("gpt-4.1-mini", MESSAGES)
+    assert scheduler.counters["rate_limited"] == 2
+    assert scheduler.tokens.level == 2000 - 15
+
+
+def test_last_rate_limited_attempt_gives_its_tokens_back():
+    scheduler, backend = scheduled(rejections=5, retries=1)
+    with pytest.raises(RateLimited):
+        backend.complete("gpt-4.1-mini", MESSAGES)
+    assert scheduler.tokens.level == 2000
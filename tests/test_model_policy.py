@@ -0,0 +1,73 @@
+from services.chat.chat_ToT import ChatToT, LLM_Node
+from services.chat.llm_backends import LLMBackend, as_completion
+from services.chat.model_policy import ModelPolicy, completion_confidence
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+def tool_choice(name):
+    return {"message": {"role": "assistant", "content": None, "tool_calls": [
+        {"id": "call", "type": "function", "function": {"name": name, "arguments": '{"user_message": "hi"}'}}]}}
+
+
+def answer_choice(logprob):
+    return {"message": {"role": "assistant", "content": "an answer"},
+            "logprobs": {"content": [{"token": "an", "logprob": logprob}, {"token": "answer", "logprob": logprob}]}}
+
+
+class ScriptedBackend(LLMBackend):
+    """Returns the choices scripted per model and records the options of every request"""
+    offline = True
+
+    def __init__(self, choices_per_model):
+        self.choices_per_model = choices_per_model
+        self.requests = []
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        self.requests.append((model, logprobs, n))
+        choices = self.choices_per_model[model][:n]
+        return as_completion({"choices": choices, "usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+
+
+def routing_graph(backend):
+    policy = ModelPolicy(["small", "large"], min_confidence=0.5)
+    root = LLM_Node("root", "Routes", MESSAGE, "User message: {user_message}", policy, backend=backend)
+    chat_bot = ChatToT(root)
+    for name in ("tracking", "refunds"):
+        chat_bot.conect_node_to_node("root", LLM_Node(name, name, MESSAGE, "{user_message}", "answers", backend=backend))
+    return chat_bot
+
+
+def test_confidence_scores():
+    agreeing = as_completion({"choices": [tool_choice("tracking")] * 3})
+    split = as_completion({"choices": [tool_choice("tracking"), tool_choice("refunds"), tool_choice("refunds")]})
+    assert completion_confidence(agreeing) == 1.0
+    assert abs(completion_confidence(split) - 1 / 3) < 1e-9
+    assert completion_confidence(as_completion({"choices": [tool_choice("tracking")]})) is None
+    assert abs(completion_confidence(as_completion({"choices": [answer_choice(-0.5)]})) - 0.6065) < 1e-3
+
+
+def test_routing_escalates_without_a_majority():
+    backend = ScriptedBackend({"small": [tool_choice("tracking"), tool_choice("refunds"), tool_choice("refunds")],
+                               "large": [tool_choice("refunds")], "answers": [answer_choice(0.0)]})
+    chat_bot = routing_graph(backend)
+    chat_bot.run_from("where is my refund?", [], None)
+    # Sampled routes are only asked from the tier that can escalate
+    assert backend.requests == [("small", False, 3), ("large", False, 1), ("answers", False, 1)]
+    assert chat_bot.model_report()["root"]["small"]["low_confidence"] == 1
+
+
+def test_routing_stays_on_the_small_model_when_sure():
+    backend = ScriptedBackend({"small": [tool_choice("tracking")] * 3, "answers": [answer_choice(0.0)]})
+    chat_bot = routing_graph(backend)
+    chat_bot.run_from("where is my order?", [], None)
+    assert backend.requests == [("small", False, 3), ("answers", False, 1)]
+    assert "large" not in chat_bot.model_report()["root"]
+
+
+def test_answers_ask_for_logprobs():
+    backend = ScriptedBackend({"small": [answer_choice(-2.0)], "large": [answer_choice(0.0)]})
+    node = LLM_Node("root", "Answers", MESSAGE, "{user_message}", ModelPolicy(["small", "large"], min_confidence=0.5), backend=backend)
+    _, reply = ChatToT(node).run_from("hello", [], None)
+    assert backend.requests == [("small", True, 1), ("large", False, 1)]
+    assert reply.content == "an answer"
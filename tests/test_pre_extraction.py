@@ -0,0 +1,23 @@
+from services.chat.pre_extraction import ORDER_ID_IN_CONTEXT, ORDER_ID_IN_MESSAGE, VERIFICATION_CODE_IN_MESSAGE, PreExtractor
+import pytest
+
+
+@pytest.mark.parametrize("message, order_id", [("My order id is 1042", 1042), ("Where is my order 2718?", 2718),
+                                               ("order #1042 please", 1042), ("Order number: 77", 77)])
+def test_order_id_with_cue(message, order_id):
+    assert ORDER_ID_IN_MESSAGE.candidates({"user_message": message}, {}) == [order_id]
+
+
+@pytest.mark.parametrize("message", ["I ordered 3 days ago", "cancel 2 items", "cancel order 12 and 15",
+                                     "my order 1042 has 3 items", "I want to cancel my order"])
+def test_order_id_left_to_the_llm(message):
+    assert ORDER_ID_IN_MESSAGE.candidates({"user_message": message}, {}) == []
+
+
+def test_extractor_fills_child_arguments():
+    extractor = PreExtractor("check", fields={"order_id": ORDER_ID_IN_CONTEXT, "code": VERIFICATION_CODE_IN_MESSAGE},
+                             constants={"system_message": "Checking order {order_id}"})
+    assert extractor.extract({"user_message": "the code is 123456"}, {"order_id": "1042"}) == \
+        {"order_id": 1042, "code": 123456, "system_message": "Checking order 1042"}
+    assert extractor.extract({"user_message": "123456 or 654321?"}, {"order_id": 1042}) is None
+    assert extractor.extract({"user_message": "the code is 123456"}, {}) is None
@@ -0,0 +1,94 @@
+from services.chat.session_backends import (FileSessionBackend, MemorySessionBackend, RedisSessionBackend, SessionBackend,
+                                            SessionConflict, SQLiteSessionBackend, start_resp_stand_in)
+import pytest
+
+
+@pytest.fixture(scope="module")
+def resp_server():
+    server = start_resp_stand_in()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "file", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemorySessionBackend()
+    elif request.param == "file":
+        backend = FileSessionBackend(str(tmp_path / "sessions"))
+    elif request.param == "sqlite":
+        backend = SQLiteSessionBackend(str(tmp_path / "sessions.db"))
+    else:
+        host, port = request.getfixturevalue("resp_server").server_address[:2]
+        # A prefix per test, the stand-in is shared by the module
+        backend = RedisSessionBackend(host, port, prefix=f"{request.node.name}:")
+    yield backend
+    backend.close()
+
+
+def test_unknown_session(backend):
+    assert backend.get("missing") == (None, 0)
+
+
+def test_versions_increase_on_every_write(backend):
+    assert backend.put("s1", b"first", 0) == 1
+    assert backend.put("s1", b"second", 1) == 2
+    assert backend.get("s1") == (b"second", 2)
+    # No version skips the check
+    assert backend.put("s1", b"third") == 3
+
+
+def test_put_at_an_old_version_conflicts(backend):
+    backend.put("s1", b"first", 0)
+    backend.put("s1", b"second", 1)
+    with pytest.raises(SessionConflict) as conflict:
+        backend.put("s1", b"lost update", 1)
+    assert (conflict.value.session_id, conflict.value.expected, conflict.value.current) == ("s1", 1, 2)
+    assert backend.get("s1") == (b"second", 2)
+
+
+def test_creating_an_existing_session_conflicts(backend):
+    backend.put("s1", b"first", 0)
+    with pytest.raises(SessionConflict):
+        backend.put("s1", b"other turn", 0)
+    assert backend.get("s1") == (b"first", 1)
+
+
+def test_delete_checks_the_version(backend):
+    backend.put("s1", b"first", 0)
+    backend.put("s1", b"second", 1)
+    with pytest.raises(SessionConflict):
+        backend.delete("s1", 1)
+    assert backend.get("s1")[0] == b"second"
+    backend.delete("s1", 2)
+    # A tombstone keeps the version
+    assert backend.get("s1") == (None, 3)
+
+
+def test_versions_keep_increasing_across_deletes(backend):
+    # A turn reads version 1, a double submitted turn answers and deletes the session
+    stale_version = backend.put("s1", b"paused", 0)
+    backend.delete("s1", stale_version)
+    # and a new conversation starts in the same session
+    _, version = backend.get("s1")
+    assert backend.put("s1", b"new conversation", version) > stale_version + 1
+    with pytest.raises(SessionConflict):
+        backend.put("s1", b"stale turn", stale_version)
+    with pytest.raises(SessionConflict):
+        backend.put("s1", b"stale first turn", 0)
+    assert backend.get("s1")[0] == b"new conversation"
+
+
+def test_deleting_an_unknown_session(backend):
+    backend.delete("missing", 0)
+    assert backend.get("missing") == (None, 0)
+
+
+def test_incomplete_backend_fails_when_instantiated():
+    class GetOnly(SessionBackend):
+        def get(self, session_id):
+            return None, 0
+
+    with pytest.raises(TypeError):
+        GetOnly()
@@ -0,0 +1,52 @@
+from services.chat.chat_ToT import ChatToT, LLM_Node
+from services.chat.llm_backends import LLMBackend, as_completion
+from services.chat.single_flight import SingleFlight
+import threading
+import time
+
+MESSAGE = {"user_message": {"type": "string", "description": "Last user message"}}
+
+
+class CountingBackend(LLMBackend):
+    offline = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def complete(self, model, messages, tools=None, tool_choice=None, store=True, logprobs=False, n=1):
+        self.calls += 1
+        time.sleep(0.05)
+        return as_completion({"choices": [{"message": {"role": "assistant", "content": "30 days"}}],
+                              "usage": {"prompt_tokens": 1000, "completion_tokens": 100}})
+
+
+def test_only_the_leader_makes_the_call():
+    flight, started, results = SingleFlight(), threading.Event(), []
+
+    def slow():
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    leader = threading.Thread(target=lambda: results.append(flight.call("key", slow)))
+    leader.start()
+    started.wait()
+    joined = flight.call("key", slow)
+    leader.join()
+    assert results == [("result", True)]
+    assert joined == ("result", False)
+    assert flight.call("key", slow, stale_seconds=0) == ("result", True)
+    assert flight.stats == {"leaders": 2, "joined": 1, "reused": 0}
+
+
+def test_reused_completions_are_not_counted_as_calls():
+    backend = CountingBackend()
+    chat_bot = ChatToT(LLM_Node("policies", "Answers policy questions", MESSAGE,
+                                "Answer from the policies. User message: {user_message} (single flight test)",
+                                "gpt-4.1-mini", backend=backend, coalesce_window=30))
+    chat_bot.hop_listeners = []
+    for _ in range(3):
+        chat_bot.run_from("what is the return window?", [], None, trase=False)
+    stats = chat_bot.model_report()["policies"]["gpt-4.1-mini"]
+    assert backend.calls == 1
+    assert (stats["calls"], stats["shared"], stats["prompt_tokens"]) == (1, 2, 1000)
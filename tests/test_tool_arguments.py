@@ -0,0 +1,95 @@
+from services.chat.graph_loader import load_graph
+from services.chat.llm_backends import StubBackend, set_llm_backend
+from services.chat.tool_arguments import (STRICT_SCHEMA_KEYWORDS, ArgumentError, ArgumentValidator, ToolCallError,
+                                          parse_arguments, strict_tool)
+import os
+import pytest
+
+GRAPH_FILE = os.path.join("services", "chat", "graphs", "policies_chat.yaml")
+
+PARAMETERS = {"type": "object", "required": ["order_id", "reason"],
+              "properties": {"order_id": {"type": "integer", "description": "Order id", "minimum": 1},
+                             "reason": {"type": "string", "description": "Why", "enum": ["price", "delay"]},
+                             "notify": {"type": "boolean", "description": "Send emails", "default": False}}}
+
+
+def schema_keywords(schema):
+    """Every keyword used in a property schema, nested ones included"""
+    keywords = set(schema)
+    for value in (schema.get("properties") or {}).values():
+        keywords |= schema_keywords(value)
+    if isinstance(schema.get("items"), dict):
+        keywords |= schema_keywords(schema["items"])
+    for value in schema.get("anyOf") or []:
+        keywords |= schema_keywords(value)
+    return keywords
+
+
+def assert_strict(tool):
+    function = tool["function"]
+    parameters = function["parameters"]
+    assert function["strict"] is True
+    assert parameters["additionalProperties"] is False
+    assert parameters["required"] == list(parameters["properties"])
+    assert schema_keywords(parameters) <= STRICT_SCHEMA_KEYWORDS
+
+
+@pytest.fixture(scope="module")
+def support_graph():
+    set_llm_backend(StubBackend())
+    return load_graph(GRAPH_FILE)
+
+
+def test_support_graph_strict_payloads(support_graph):
+    checked = 0
+    for plan_node in support_graph.plan.nodes:
+        if getattr(plan_node.node, "strict_tools", False):
+            for tool in plan_node.node.request_tools():
+                assert_strict(tool)
+                checked += 1
+    assert checked > 0
+
+
+def test_strict_tool_drops_unsupported_keywords():
+    tool = strict_tool({"type": "function", "function": {"name": "cancel", "description": "Cancel", "parameters": PARAMETERS}})
+    assert_strict(tool)
+    properties = tool["function"]["parameters"]["properties"]
+    assert properties["notify"] == {"type": ["boolean", "null"], "description": "Send emails (default: False)"}
+    assert properties["order_id"] == {"type": "integer", "description": "Order id"}
+    # The definition the validators are compiled from is left untouched
+    assert PARAMETERS["properties"]["order_id"]["minimum"] == 1
+
+
+@pytest.mark.parametrize("text, expected, repairs", [
+    ('{"a": 1}', {"a": 1}, []),
+    ('```json\n{"a": 1}\n```', {"a": 1}, ["json_syntax"]),
+    ('{"a": [1, 2,],}', {"a": [1, 2]}, ["json_syntax"]),
+])
+def test_parse_arguments_repairs_syntax(text, expected, repairs):
+    assert parse_arguments(text) == (expected, repairs)
+
+
+def test_parse_arguments_rejects_garbage():
+    with pytest.raises(ToolCallError):
+        parse_arguments("not json at all")
+
+
+def test_validator_repairs_values():
+    validator = ArgumentValidator("cancel", PARAMETERS)
+    arguments, repairs = validator.validate({"order_id": "1,042", "reason": "Price", "notify": "yes", "extra": 1})
+    assert arguments == {"order_id": 1042, "reason": "price", "notify": True}
+    assert sorted(repairs) == ["boolean_from_text", "dropped_unknown", "enum_case", "integer_from_string"]
+
+
+def test_validator_restores_dropped_required_arguments():
+    validator = ArgumentValidator("cancel", PARAMETERS)
+    arguments, repairs = validator.validate({"reason": "delay"}, context={"order_id": 7})
+    assert arguments == {"reason": "delay", "order_id": 7}
+    assert repairs == ["restored_from_input"]
+
+
+def test_validator_reports_every_issue():
+    validator = ArgumentValidator("cancel", PARAMETERS)
+    with pytest.raises(ArgumentError) as error:
+        validator.validate({"order_id": "soon", "reason": "boredom"})
+    assert len(error.value.issues) == 2